@@ -11,6 +11,7 @@ from django.shortcuts import (
 )
 from django.urls import reverse_lazy
 from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.http import urlsafe_base64_decode
 from django.utils.translation import gettext_lazy as _
 from django.views import generic
@@ -19,7 +20,7 @@ from .forms import (
     AuthenticationForm, DeacrivateForm, PasswordCreationForm, SignupForm, UserProfileForm, UserSettingsForm, VerificationAgainForm,
 )
 from bookplaylist.views import (
-    TemplateContextMixin, login_required, sensitive_post_parameters,
+    ConditionalGetMixin, TemplateContextMixin, login_required, sensitive_post_parameters,
 )
 from main.models import Playlist
 
@@ -38,7 +39,12 @@ class IndexView(TemplateContextMixin, generic.ListView):
     template_name = 'accounts/index.html'
 
     def get_queryset(self):
-        return Playlist.objects.filter(like__user=self.request.user, like__deleted_at__isnull=True)
+        return Playlist.objects.for_cards().filter(like__user=self.request.user, like__deleted_at__isnull=True)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['playlists_created'] = self.request.user.playlist_set.for_cards()
+        return context
 
 
 @login_required
@@ -90,7 +96,7 @@ class PasswordChangeView(TemplateContextMixin, auth_views.PasswordChangeView):
         return super().form_valid(form)
 
 
-class ProfileView(TemplateContextMixin, generic.UpdateView):
+class ProfileView(ConditionalGetMixin, TemplateContextMixin, generic.UpdateView):
     form_class = UserProfileForm
     model = UserModel
     template_name = 'accounts/profile.html'
@@ -98,6 +104,13 @@ class ProfileView(TemplateContextMixin, generic.UpdateView):
     def get_object(self, queryset=None):
         return get_object_or_404(UserModel, username=self.kwargs.get('username'))
 
+    @cached_property
+    def playlists(self):
+        return list(self.object.playlist_set.for_cards())
+
+    def get_etag_values(self):
+        return [self.object.pk, self.object.updated_at] + [playlist.get_card_version() for playlist in self.playlists]
+
     def form_valid(self, form):
         if self.request.user != self.get_object():
             messages.warning(self.request, _('You don\'t have permission to update other user\'s profile.'))
@@ -115,7 +128,9 @@ class ProfileView(TemplateContextMixin, generic.UpdateView):
             self.object.comment or \
             ''
         self.og_url = '{}://{}{}'.format(self.request.scheme, self.request.get_host(), self.request.path)
-        return super().get_context_data(**kwargs)
+        context = super().get_context_data(**kwargs)
+        context['playlists'] = self.playlists
+        return context
 
 
 class PasswordResetView(TemplateContextMixin, auth_views.PasswordResetView):
@@ -0,0 +1,21 @@
+from django.db.backends.sqlite3 import (
+    base, schema,
+)
+
+
+class DatabaseSchemaEditor(schema.DatabaseSchemaEditor):
+    # The names of indexes are unique per table in MySQL but per database in SQLite,
+    # so the test database prefixes them with the table.
+
+    def _get_index_name(self, model, name, suffix=''):
+        return '{}_{}{}'.format(model._meta.db_table, name, suffix) if name else name
+
+    def _create_index_sql(self, model, fields, *, name=None, **kwargs):
+        return super()._create_index_sql(model, fields, name=self._get_index_name(model, name), **kwargs)
+
+    def _create_unique_sql(self, model, columns, name=None, condition=None):
+        return super()._create_unique_sql(model, columns, name=self._get_index_name(model, name, '_uniq'), condition=condition)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    SchemaEditorClass = DatabaseSchemaEditor
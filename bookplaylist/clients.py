@@ -0,0 +1,218 @@
+import hashlib
+import os
+import random
+import requests
+import threading
+import time
+from concurrent.futures import (
+    Future, TimeoutError as FutureTimeoutError,
+)
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from requests.adapters import HTTPAdapter
+
+
+_session_lock = threading.Lock()
+_session = None
+_session_pid = None
+
+
+def get_session():
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        # Sessions must not be shared across forked workers.
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=settings.PROVIDER_API_POOL_CONNECTIONS,
+                    pool_maxsize=settings.PROVIDER_API_POOL_MAXSIZE,
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session, _session_pid = session, pid
+    return _session
+
+
+class ProviderBusy(requests.RequestException):
+    pass
+
+
+class Bulkhead:
+    # Limits the calls in flight in this process, so that a slow provider holds
+    # a bounded number of worker threads and the calls above it fail at once.
+
+    def __init__(self, size):
+        self.size = size
+        self._semaphore = threading.BoundedSemaphore(size)
+
+    def __enter__(self):
+        if not self._semaphore.acquire(blocking=False):
+            raise ProviderBusy('{} calls to the provider are in flight.'.format(self.size))
+
+    def __exit__(self, *exc_info):
+        self._semaphore.release()
+
+
+class ProviderClient:
+    retry_exceptions = (requests.ConnectionError, requests.Timeout,)
+    success_codes = (requests.codes.ok, requests.codes.bad_request,)
+
+    def __init__(self, endpoint, timeout=None, max_attempts=None, backoff=None, backoff_max=None, deadline=None,
+                 bulkhead=None):
+        self.endpoint = endpoint
+        self.timeout = timeout or settings.PROVIDER_API_TIMEOUT
+        self.max_attempts = max_attempts or settings.PROVIDER_API_MAX_ATTEMPTS
+        self.backoff = backoff or settings.PROVIDER_API_BACKOFF
+        self.backoff_max = backoff_max or settings.PROVIDER_API_BACKOFF_MAX
+        self.deadline = deadline or settings.PROVIDER_API_DEADLINE
+        self.bulkhead = bulkhead
+
+    def get(self, params):
+        if self.bulkhead is None:
+            return self._get(params)
+        with self.bulkhead:
+            return self._get(params)
+
+    def _get(self, params):
+        deadline = time.monotonic() + self.deadline
+        response = None
+        error = None
+        for attempt in range(self.max_attempts):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                response = get_session().get(self.endpoint, params=params, timeout=self._get_timeout(remaining))
+            except self.retry_exceptions as e:
+                error = e
+            else:
+                if response.status_code in self.success_codes:
+                    return response
+            delay = self._get_backoff(attempt)
+            if attempt + 1 == self.max_attempts or time.monotonic() + delay >= deadline:
+                break
+            time.sleep(delay)
+
+        if response is None:
+            raise error or requests.Timeout('Deadline exceeded before the first attempt.')
+        return response
+
+    def _get_timeout(self, remaining):
+        connect_timeout, read_timeout = self.timeout
+        return (min(connect_timeout, remaining), min(read_timeout, remaining))
+
+    def _get_backoff(self, attempt):
+        # "Full jitter": sleep a random time up to the exponential ceiling.
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+
+class CachedResponse:
+
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+_inflight_lock = threading.Lock()
+_inflight = {}
+
+
+class CachedProviderClient(ProviderClient):
+    ignored_params = ('applicationId',)
+
+    def __init__(self, endpoint, key_prefix, cache_alias=None, **kwargs):
+        super().__init__(endpoint, **kwargs)
+        self.key_prefix = key_prefix
+        self.cache = caches[cache_alias or settings.PROVIDER_CACHE_ALIAS]
+
+    def get(self, params):
+        key = self.get_cache_key(params)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return CachedResponse(*cached)
+
+        # Coalesce identical requests in this process: the first caller fetches
+        # and the others wait for its result.
+        with _inflight_lock:
+            future = _inflight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = _inflight[key] = Future()
+        if not is_leader:
+            try:
+                return future.result(timeout=self.deadline)
+            except FutureTimeoutError:
+                raise requests.Timeout('Deadline exceeded while waiting for the same request.')
+
+        try:
+            response = self._get_with_lock(key, params)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(response)
+            return response
+        finally:
+            with _inflight_lock:
+                del _inflight[key]
+
+    def set_many(self, params_list, data_list):
+        timeout = settings.PROVIDER_CACHE_ISBN_TIMEOUT
+        values = {
+            self.get_cache_key(params): (requests.codes.ok, data)
+            for params, data in zip(params_list, data_list)
+        }
+        self.cache.set_many(values, timeout)
+
+    def get_cache_key(self, params):
+        if 'isbn' in params:
+            return 'provider:{}:isbn:{}'.format(self.key_prefix, params['isbn'])
+        query = urlencode(sorted((k, v) for k, v in params.items() if k not in self.ignored_params))
+        return 'provider:{}:search:{}'.format(self.key_prefix, hashlib.md5(query.encode()).hexdigest())
+
+    def _get_with_lock(self, key, params):
+        # Coalesce identical requests across processes sharing the cache: wait
+        # for the holder of the lock to fill the cache rather than fetching again.
+        lock_key = '{}:lock'.format(key)
+        lock_timeout = settings.PROVIDER_CACHE_LOCK_TIMEOUT
+        has_lock = self.cache.add(lock_key, True, lock_timeout)
+        if not has_lock:
+            waited = 0
+            while waited < min(lock_timeout, self.deadline):
+                time.sleep(0.05)
+                waited += 0.05
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return CachedResponse(*cached)
+        try:
+            response = super().get(params)
+            self._set_response(key, params, response)
+        finally:
+            if has_lock:
+                self.cache.delete(lock_key)
+        return response
+
+    def _set_response(self, key, params, response):
+        try:
+            data = response.json()
+        except ValueError:
+            return
+        if response.status_code == requests.codes.bad_request:
+            self.cache.set(key, (response.status_code, data), settings.PROVIDER_CACHE_NEGATIVE_TIMEOUT)
+        elif response.status_code == requests.codes.ok and 'error' not in data:
+            self.cache.set(key, (response.status_code, data), self._get_timeout_for(params, data))
+
+    def _get_timeout_for(self, params, data):
+        if not int(data.get('count') or 0):
+            return settings.PROVIDER_CACHE_NEGATIVE_TIMEOUT
+        elif 'isbn' in params:
+            return settings.PROVIDER_CACHE_ISBN_TIMEOUT
+        else:
+            return settings.PROVIDER_CACHE_SEARCH_TIMEOUT
@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+# Names and descriptions of the timings, in the order of the Server-Timing header.
+TIMINGS = {
+    'db': 'SQL',
+    'tpl': 'Templates',
+    'api': 'Provider API',
+    'og': 'OG image',
+}
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class RequestMetrics:
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.queries = 0
+        self.timings = defaultdict(float)
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.started_at
+
+    def add(self, name, seconds):
+        self.timings[name] += seconds
+
+    def as_dict(self):
+        values = {'{}_ms'.format(name): round(self.timings[name] * 1000, 1) for name in TIMINGS}
+        values['queries'] = self.queries
+        values['total_ms'] = round(self.total * 1000, 1)
+        return values
+
+    def get_server_timing(self):
+        entries = ['{};dur={:.1f};desc="{}"'.format(name, self.timings[name] * 1000, desc) for name, desc in TIMINGS.items()]
+        entries.append('queries;desc="{}"'.format(self.queries))
+        entries.append('total;dur={:.1f}'.format(self.total * 1000))
+        return ', '.join(entries)
+
+    def get_exceeded(self, budget):
+        values = self.as_dict()
+        return {name: (values[name], limit) for name, limit in budget.items() if values.get(name, 0) > limit}
+
+
+_local = threading.local()
+
+
+def get_current():
+    return getattr(_local, 'metrics', None)
+
+
+@contextmanager
+def collect():
+    metrics = _local.metrics = RequestMetrics()
+    try:
+        yield metrics
+    finally:
+        _local.metrics = None
+
+
+@contextmanager
+def timer(name):
+    # Does nothing outside of a request, e.g. in management commands and workers.
+    metrics = get_current()
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.add(name, time.perf_counter() - started_at)
+
+
+def query_wrapper(execute, sql, params, many, context):
+    metrics = get_current()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started_at = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.add('db', time.perf_counter() - started_at)
@@ -0,0 +1,62 @@
+import json
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+
+logger = logging.getLogger('bookplaylist.metrics')
+
+
+class MetricsMiddleware:
+    # Should be the first in MIDDLEWARE, so that the queries of the others are counted
+    # and process_template_response runs after the ones of the others.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        with metrics.collect() as current:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(metrics.query_wrapper))
+                response = self.get_response(request)
+
+            if settings.METRICS_SERVER_TIMING:
+                response['Server-Timing'] = current.get_server_timing()
+            view_name = request.resolver_match.view_name if request.resolver_match else None
+            values = current.as_dict()
+            values.update({
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'view': view_name,
+            })
+            logger.info(json.dumps(values, sort_keys=True), extra={'metrics': values})
+            self.check_budget(current, view_name, values)
+        return response
+
+    def process_template_response(self, request, response):
+        # Rendering here instead of in the handler only to measure it.
+        with metrics.timer('tpl'):
+            response.render()
+        return response
+
+    def check_budget(self, current, view_name, values):
+        budget = settings.METRICS_BUDGETS.get(view_name, settings.METRICS_DEFAULT_BUDGET)
+        exceeded = current.get_exceeded(budget)
+        if not exceeded:
+            return
+        message = 'Budget of {} exceeded: {}'.format(view_name, ', '.join(
+            '{} {} > {}'.format(name, value, limit) for name, (value, limit) in sorted(exceeded.items())
+        ))
+        logger.warning(message, extra={'metrics': values})
+        # Timings vary with the machine and its load, so only the query count fails.
+        if settings.METRICS_RAISE_ON_BUDGET_EXCEEDED and 'queries' in exceeded:
+            raise metrics.BudgetExceeded(message)
@@ -1,10 +1,18 @@
+import operator
 import os
 import uuid
+from collections import defaultdict
+from functools import reduce
 
 from django.core.exceptions import (
     NON_FIELD_ERRORS, ValidationError,
 )
-from django.db import models
+from django.db import (
+    connection, models,
+)
+from django.db.models import (
+    Case, IntegerField, Max, Q, Value, When,
+)
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
@@ -49,8 +57,10 @@ class BaseModel(models.Model):
 
     def validate_unique(self, exclude=None):
         super().validate_unique(exclude=exclude)
-        unique_checks_conditional = self._get_unique_checks_conditional(exclude=exclude)
-        errors = self._perform_unique_checks_conditional(unique_checks_conditional)
+        # Set by formsets, which check the forms all at once.
+        if getattr(self, '_defer_unique_checks_conditional', False):
+            return
+        errors = perform_unique_checks_conditional([(self, exclude)])[0]
         if errors:
             raise ValidationError(errors)
 
@@ -72,34 +82,50 @@ class BaseModel(models.Model):
                     unique_checks_conditional.append((model_class, constraint.fields, constraint.condition))
         return unique_checks_conditional
 
-    def _perform_unique_checks_conditional(self, unique_checks_conditional):
-        errors = {}
-
-        for model_class, unique_check, condition in unique_checks_conditional:
-            lookup_kwargs = {}
-            for field_name in unique_check:
-                f = self._meta.get_field(field_name)
-                lookup_value = getattr(self, f.attname)
-                if (lookup_value is None or
-                        (lookup_value == '' and connection.features.interprets_empty_strings_as_nulls)):
-                    continue
-                if f.primary_key and not self._state.adding:
-                    continue
-                lookup_kwargs[str(field_name)] = lookup_value
-
-            if len(unique_check) != len(lookup_kwargs):
+    def _get_unique_check_conditional_q(self, model_class, unique_check, condition):
+        lookup_kwargs = {}
+        for field_name in unique_check:
+            f = self._meta.get_field(field_name)
+            lookup_value = getattr(self, f.attname)
+            if (lookup_value is None or
+                    (lookup_value == '' and connection.features.interprets_empty_strings_as_nulls)):
+                return None
+            if f.primary_key and not self._state.adding:
+                return None
+            lookup_kwargs[str(field_name)] = lookup_value
+
+        q = condition & Q(**lookup_kwargs)
+        model_class_pk = self._get_pk_val(model_class._meta)
+        if not self._state.adding and model_class_pk is not None:
+            q &= ~Q(pk=model_class_pk)
+        return q
+
+
+def perform_unique_checks_conditional(instances):
+    # Checks the conditional unique constraints of (instance, exclude) pairs in
+    # one query per model, with a flag per instance and constraint.
+    errors = [{} for _ in instances]
+    checks = defaultdict(dict)
+    for i, (instance, exclude) in enumerate(instances):
+        for j, (model_class, unique_check, condition) in enumerate(instance._get_unique_checks_conditional(exclude=exclude)):
+            q = instance._get_unique_check_conditional_q(model_class, unique_check, condition)
+            if q is not None:
+                checks[model_class]['unique_{}_{}'.format(i, j)] = (i, unique_check, q)
+
+    for model_class, model_checks in checks.items():
+        result = model_class._default_manager \
+            .filter(reduce(operator.or_, (q for i, unique_check, q in model_checks.values()))) \
+            .aggregate(**{
+                alias: Max(Case(When(q, then=Value(1)), default=Value(0), output_field=IntegerField()))
+                for alias, (i, unique_check, q) in model_checks.items()
+            })
+        for alias, (i, unique_check, q) in model_checks.items():
+            if not result[alias]:
                 continue
-
-            qs = model_class._default_manager.filter(condition, **lookup_kwargs)
-
-            model_class_pk = self._get_pk_val(model_class._meta)
-            if not self._state.adding and model_class_pk is not None:
-                qs = qs.exclude(pk=model_class_pk)
-            if qs.exists():
-                if len(unique_check) == 1:
-                    key = unique_check[0]
-                else:
-                    key = NON_FIELD_ERRORS
-                errors.setdefault(key, []).append(self.unique_error_message(model_class, unique_check))
-
-        return errors
+            if len(unique_check) == 1:
+                key = unique_check[0]
+            else:
+                key = NON_FIELD_ERRORS
+            instance = instances[i][0]
+            errors[i].setdefault(key, []).append(instance.unique_error_message(model_class, unique_check))
+    return errors
@@ -14,5 +14,9 @@ def get_file_path(instance, filename, field, filetype='img'):
     return path
 
 
+# emoji 2 replaced UNICODE_EMOJI with EMOJI_DATA
+EMOJI = getattr(emoji, 'EMOJI_DATA', None) or emoji.UNICODE_EMOJI
+
+
 def remove_emoji(raw_str):
-    return ''.join(c for c in raw_str if c not in emoji.UNICODE_EMOJI)
+    return ''.join(c for c in raw_str if c not in EMOJI)
@@ -0,0 +1,79 @@
+from datetime import datetime
+from uuid import UUID
+
+from django.core import signing
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+class KeysetPaginator:
+    # Pages by the values of the ordering keys of the last object instead of OFFSET,
+    # so every page costs the same. The last key must be unique. Cursors older than
+    # max_age seconds are refused, so that old links do not page a changed list forever.
+    salt = 'bookplaylist.paginators.KeysetPaginator'
+
+    def __init__(self, queryset, ordering, per_page, max_age=None):
+        self.queryset = queryset.order_by(*ordering)
+        self.keys = [(key.lstrip('-'), key.startswith('-')) for key in ordering]
+        self.per_page = per_page
+        self.max_age = max_age
+
+    def page(self, cursor=None):
+        queryset = self.queryset
+        if cursor:
+            queryset = queryset.filter(self._get_condition(self.decode_cursor(cursor)))
+        object_list = list(queryset[:self.per_page + 1])
+        next_cursor = None
+        if len(object_list) > self.per_page:
+            object_list = object_list[:self.per_page]
+            next_cursor = self.encode_cursor(object_list[-1])
+        return KeysetPage(object_list, next_cursor)
+
+    def encode_cursor(self, obj):
+        values = [self._to_json(getattr(obj, name)) for name, descending in self.keys]
+        return signing.dumps(values, salt=self.salt, compress=True)
+
+    def decode_cursor(self, cursor):
+        try:
+            values = signing.loads(cursor, salt=self.salt, max_age=self.max_age)
+        except signing.BadSignature:
+            # SignatureExpired is a BadSignature too
+            raise InvalidCursor(cursor)
+        if not isinstance(values, list) or len(values) != len(self.keys):
+            raise InvalidCursor(cursor)
+        return values
+
+    def _get_condition(self, values):
+        # (a, b, c) < (x, y, z)  <=>  a < x OR (a = x AND b < y) OR (a = x AND b = y AND c < z)
+        condition = Q()
+        for i, (name, descending) in enumerate(self.keys):
+            lookups = {key[0]: value for key, value in zip(self.keys[:i], values[:i])}
+            lookups['{}__{}'.format(name, 'lt' if descending else 'gt')] = values[i]
+            condition |= Q(**lookups)
+        return condition
+
+    def _to_json(self, value):
+        if isinstance(value, datetime):
+            return value.isoformat()
+        elif isinstance(value, UUID):
+            return str(value)
+        return value
@@ -54,6 +54,7 @@ AUTHENTICATION_BACKENDS = [
 ]
 
 MIDDLEWARE = [
+    'bookplaylist.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     # 'django.middleware.locale.LocaleMiddleware',
@@ -101,6 +102,20 @@ WSGI_APPLICATION = 'bookplaylist.wsgi.application'
 # }
 
 
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# Processes share the changes of the search index and the snapshot of the
+# homepage sections through the default cache.
+# Set a shared backend (memcached, ...) in local_settings; main.W002 warns while
+# it is local to each process.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -203,9 +218,128 @@ ADMIN_REORDER = (
 
 
 DEFAULT_PROVIDER = 'rakuten'
+PROVIDER_REGISTRY_TIMEOUT = 60 * 5
+
+# (connect, read) timeout of each attempt, and the deadline of all attempts in seconds
+PROVIDER_API_TIMEOUT = (3.05, 5)
+PROVIDER_API_DEADLINE = 8
+PROVIDER_API_MAX_ATTEMPTS = 5
+PROVIDER_API_BACKOFF = 0.2
+PROVIDER_API_BACKOFF_MAX = 2
+PROVIDER_API_POOL_CONNECTIONS = 4
+PROVIDER_API_POOL_MAXSIZE = 10
+PROVIDER_API_MAX_WORKERS = 4
+
+# Deadline of the book search, and the number of its calls to the provider in flight
+# in each process; the searches above it fail at once rather than wait for a worker.
+PROVIDER_SEARCH_DEADLINE = 4
+PROVIDER_SEARCH_MAX_CONCURRENCY = 4
+
+# Alias in CACHES for responses of the provider API (locmem, file-based, memcached, ...)
+PROVIDER_CACHE_ALIAS = 'default'
+PROVIDER_CACHE_ISBN_TIMEOUT = 60 * 60 * 24
+PROVIDER_CACHE_SEARCH_TIMEOUT = 60 * 10
+PROVIDER_CACHE_NEGATIVE_TIMEOUT = 60 * 5
+PROVIDER_CACHE_LOCK_TIMEOUT = 10
+
+# Directory in the default storage for resized copies of covers
+COVER_CACHE_DIRECTORY = 'covers'
 
 OG_IMAGE_WIDTH = 1200
 OG_IMAGE_HEIGHT = 630
+OG_IMAGE_PLACEHOLDER = 'img/hero-sp.jpg'
+
+# 'html' renders the OG image templates with wkhtmltoimage. 'pillow' composes them
+# from main.renderers.LAYOUTS with the fonts below, and falls back to 'html' for
+# templates without a layout. The fonts (Noto Sans JP Bold and Prompt Regular,
+# SIL Open Font License) are not in the repository: put them at these paths
+# before selecting 'pillow'. The check main.W001 warns while they are missing.
+OG_IMAGE_RENDERER = 'html'
+OG_IMAGE_FONTS = {
+    'bold': os.path.join(BASE_DIR, 'fonts', 'NotoSansJP-Bold.otf'),
+    'brand': os.path.join(BASE_DIR, 'fonts', 'Prompt-Regular.ttf'),
+}
+
+# Render OG images by `manage.py runogimageworker` instead of in the request
+OG_IMAGE_ASYNC = True
+OG_IMAGE_JOB_MAX_ATTEMPTS = 3
+OG_IMAGE_JOB_TIMEOUT = 60 * 5
+
+# Query count and timings of each request, in the Server-Timing header and
+# in the log of 'bookplaylist.metrics'. Budgets are keyed by view name, with
+# the keys of RequestMetrics.as_dict(). Exceeded budgets are logged as warnings;
+# with METRICS_RAISE_ON_BUDGET_EXCEEDED, the query counts raise BudgetExceeded.
+METRICS_ENABLED = True
+METRICS_SERVER_TIMING = True
+METRICS_DEFAULT_BUDGET = {'queries': 30, 'total_ms': 2000}
+METRICS_BUDGETS = {
+    'main:index': {'queries': 10, 'total_ms': 500},
+    'main:playlist': {'queries': 10, 'total_ms': 1000},
+    'main:playlist_fragment': {'queries': 10, 'total_ms': 1000},
+    'main:playlist_detail': {'queries': 15, 'total_ms': 1000},
+    'accounts:index': {'queries': 15, 'total_ms': 1000},
+    'accounts:profile': {'queries': 15, 'total_ms': 1000},
+    # Calls the provider API, and may render the OG image without the worker
+    'main:playlist_create_book_store': {'queries': 60, 'total_ms': 10000},
+    'main:playlist_update_book_store': {'queries': 60, 'total_ms': 10000},
+}
+METRICS_RAISE_ON_BUDGET_EXCEEDED = False
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'bookplaylist.metrics': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# ETag of the pages of playlists and profiles. Change the version when their
+# templates change, so that clients and shared caches stop validating old pages.
+CONDITIONAL_GET_VERSION = '1'
+CONDITIONAL_GET_SHARED_MAX_AGE = 60
+
+PLAYLIST_PAGINATE_BY = 24
+# Seconds a "Load more playlists" link keeps working
+PLAYLIST_CURSOR_MAX_AGE = 60 * 60 * 24
+
+# Buffer the changes of Playlist.like_count by likes in each process and
+# write them at most every LIKE_COUNTER_FLUSH_INTERVAL seconds
+LIKE_COUNTER_BUFFER = False
+LIKE_COUNTER_FLUSH_INTERVAL = 10
+LIKE_COUNTER_FLUSH_SIZE = 100
+
+# Related playlists kept for each playlist by main.related. Books in more
+# playlists than RELATED_PLAYLISTS_MAX_DF relate nothing. Changed playlists
+# are recomputed by `manage.py rebuildrelatedplaylists --loop`.
+RELATED_PLAYLISTS_COUNT = 8
+RELATED_PLAYLISTS_MAX_DF = 1000
+
+# Rendered cards of playlists, keyed by Playlist.get_card_version
+PLAYLIST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Playlist IDs of the sections of the homepage are cached until invalidated,
+# or refreshed by `manage.py refreshhomepage --loop`. Invalidation reaches the
+# other processes only through a shared default cache.
+HOMEPAGE_SNAPSHOT_TIMEOUT = 60 * 10
+
+# 'ngram' answers searches from the in-process index in main.search,
+# 'database' from the full-text index of the database. Processes running the
+# 'ngram' index learn the changes of the others through the default cache, so
+# it must be shared (memcached, ...); otherwise they see them only at the full
+# reload every PLAYLIST_SEARCH_INDEX_RELOAD_INTERVAL seconds.
+PLAYLIST_SEARCH_BACKEND = 'ngram'
+PLAYLIST_SEARCH_MAX_RESULTS = 500
+PLAYLIST_SEARCH_INDEX_CHECK_INTERVAL = 5
+PLAYLIST_SEARCH_INDEX_RELOAD_INTERVAL = 60 * 10
 
 CONTACT_INQUIRY = (
     ('', _('(Please select)')),
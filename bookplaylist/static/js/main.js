@@ -33,6 +33,29 @@ $(function() {
     skip_invisible: true
   })
 
+  // infinite scroll of playlists
+  if ('IntersectionObserver' in window) {
+    const observer = new IntersectionObserver(function(entries) {
+      entries.forEach(function(entry) {
+        if (!entry.isIntersecting) {
+          return
+        }
+        const more = $(entry.target)
+        observer.unobserve(entry.target)
+        $.get(more.data('url')).done(function(html) {
+          const fragment = $('<div>').html(html).children()
+          more.replaceWith(fragment)
+          fragment.filter('.playlist-more').each(function() {
+            observer.observe(this)
+          })
+        })
+      })
+    }, {rootMargin: '400px 0px'})
+    $('.playlist-more').each(function() {
+      observer.observe(this)
+    })
+  }
+
   // drawer menu
   let height
   let scrollpos
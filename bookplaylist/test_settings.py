@@ -0,0 +1,30 @@
+from .settings import *  # noqa
+
+
+SECRET_KEY = 'test'
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'bookplaylist.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+    }
+}
+
+# The migrations include MySQL-only statements, so the test database is created from the models.
+MIGRATION_MODULES = {
+    'accounts': None,
+    'main': None,
+}
+
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media-test')
+MEDIA_URL = '/media/'
+RAKUTEN_APPLICATION_ID = 'test'
+FACEBOOK_APP_ID = 'test'
+ADMIN_EMAIL = 'admin@example.com'
+
+# The tests run in a single process.
+SILENCED_SYSTEM_CHECKS = SILENCED_SYSTEM_CHECKS + ['main.W002']
+
+# Queries over the budget of a view fail the test. The metrics of each request are not logged.
+METRICS_RAISE_ON_BUDGET_EXCEEDED = True
+LOGGING['loggers']['bookplaylist.metrics']['level'] = 'ERROR'
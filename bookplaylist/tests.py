@@ -0,0 +1,178 @@
+import json
+import threading
+import time
+from http.server import (
+    BaseHTTPRequestHandler, ThreadingHTTPServer,
+)
+from unittest import mock
+
+import requests
+from django.core.cache import cache
+from django.test import (
+    SimpleTestCase, override_settings,
+)
+
+from .clients import (
+    Bulkhead, CachedProviderClient, ProviderBusy, ProviderClient,
+)
+
+
+class StubProviderHandler(BaseHTTPRequestHandler):
+    # The path selects the behavior: /slow sleeps longer than the read timeout,
+    # /error/<n> fails the first n requests with 503, /error fails every request,
+    # /empty finds nothing.
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            count = server.requests
+        path = self.path.split('?')[0]
+        if path == '/slow':
+            time.sleep(server.delay)
+            status = 200
+        elif path == '/error':
+            status = 503
+        elif path.startswith('/error/'):
+            status = 503 if count <= int(path.split('/')[2]) else 200
+        else:
+            status = 200
+        body = json.dumps({'count': 0 if path == '/empty' else count}).encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on a slow response.
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class StubProviderMixin:
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubProviderHandler)
+        cls.server.daemon_threads = True
+        cls.server.lock = threading.Lock()
+        cls.server.delay = 0.5
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.requests = 0
+
+    def get_url(self, path):
+        return 'http://127.0.0.1:{}{}'.format(self.server.server_address[1], path)
+
+
+class ProviderClientTests(StubProviderMixin, SimpleTestCase):
+
+    def get_client(self, path, **kwargs):
+        kwargs = dict({'timeout': (1, 0.1), 'max_attempts': 3, 'backoff': 0.01, 'backoff_max': 0.02, 'deadline': 5}, **kwargs)
+        return ProviderClient(self.get_url(path), **kwargs)
+
+    def test_ok(self):
+        response = self.get_client('/ok').get({'isbn': '9784000000000'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.server.requests, 1)
+
+    def test_slow_responses_time_out_after_every_attempt(self):
+        with self.assertRaises(requests.Timeout):
+            self.get_client('/slow').get({})
+        self.assertEqual(self.server.requests, 3)
+
+    def test_server_errors_are_retried(self):
+        response = self.get_client('/error/2').get({})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.server.requests, 3)
+
+    def test_last_server_error_is_returned(self):
+        response = self.get_client('/error').get({})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.server.requests, 3)
+
+    def test_backoff_between_attempts(self):
+        with mock.patch('bookplaylist.clients.time.sleep') as sleep:
+            self.get_client('/error', max_attempts=4, backoff=0.1, backoff_max=0.3).get({})
+        self.assertEqual(self.server.requests, 4)
+        # Full jitter up to 0.1, 0.2 and then the maximum, with no sleep after the last attempt.
+        delays = [call[0][0] for call in sleep.call_args_list]
+        self.assertEqual(len(delays), 3)
+        for delay, ceiling in zip(delays, (0.1, 0.2, 0.3)):
+            self.assertTrue(0 <= delay <= ceiling)
+
+    def test_calls_over_the_bulkhead_fail_at_once(self):
+        client = self.get_client('/slow', timeout=(1, 1), bulkhead=Bulkhead(1))
+        thread = threading.Thread(target=client.get, args=({},))
+        thread.start()
+        while not self.server.requests:
+            time.sleep(0.01)
+        started_at = time.monotonic()
+        with self.assertRaises(ProviderBusy):
+            client.get({})
+        self.assertLess(time.monotonic() - started_at, 0.1)
+        thread.join()
+        self.assertEqual(self.server.requests, 1)
+
+        # Released after the call, even one that failed
+        with self.assertRaises(requests.Timeout):
+            self.get_client('/slow', bulkhead=client.bulkhead).get({})
+        self.assertEqual(client.get({}).status_code, 200)
+        self.assertEqual(self.server.requests, 5)
+
+    def test_deadline_exceeded(self):
+        started_at = time.monotonic()
+        with self.assertRaises(requests.Timeout):
+            self.get_client('/slow', timeout=(1, 1), max_attempts=5, deadline=0.3).get({})
+        self.assertLess(time.monotonic() - started_at, 0.5)
+        self.assertEqual(self.server.requests, 1)
+
+
+class CachedProviderClientTests(StubProviderMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def get_client(self, path):
+        return CachedProviderClient(self.get_url(path), 'test', timeout=(1, 2), max_attempts=1, deadline=5)
+
+    def test_concurrent_lookups_are_coalesced(self):
+        client = self.get_client('/slow')
+        responses = []
+
+        def get():
+            responses.append(client.get({'isbn': '9784000000000'}))
+
+        threads = [threading.Thread(target=get) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.server.requests, 1)
+        self.assertEqual([response.json() for response in responses], [{'count': 1}] * 5)
+
+        client.get({'isbn': '9784000000000'})
+        self.assertEqual(self.server.requests, 1)
+
+    @override_settings(PROVIDER_CACHE_NEGATIVE_TIMEOUT=0.2)
+    def test_miss_is_cached_until_it_expires(self):
+        client = self.get_client('/empty')
+        for _ in range(2):
+            self.assertEqual(client.get({'isbn': '9784000000000'}).json(), {'count': 0})
+        self.assertEqual(self.server.requests, 1)
+
+        time.sleep(0.3)
+        client.get({'isbn': '9784000000000'})
+        self.assertEqual(self.server.requests, 2)
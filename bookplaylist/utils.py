@@ -1,31 +1,47 @@
 import re
 import requests
-import time
+from concurrent.futures import ThreadPoolExecutor
 
 from django.conf import settings
 from django.core.mail import EmailMultiAlternatives
 from django.template import loader
 
-from main.models import Provider
+from . import metrics
+from .clients import CachedProviderClient
+from main.providers import providers
 
 
 class APIMixin:
+    client_kwargs = {}
 
-    def __init__(self, *args, **kwargs):
-        self.provider = Provider.objects.get(slug=settings.DEFAULT_PROVIDER)
-        return super().__init__(*args, **kwargs)
+    @property
+    def provider(self):
+        return providers.get_default()
 
     def get_book_data(self, params):
-        i = 0
-        while i < 5:
-            response = requests.get(self.provider.endpoint, params=params)
-            if response.status_code in (requests.codes.ok, requests.codes.bad_request,):
-                break
-            else:
-                i += 1
-                time.sleep(1)
-                continue
-        return response
+        with metrics.timer('api'):
+            return self.get_client().get(params)
+
+    def get_book_data_many(self, params_list):
+        if not params_list:
+            return []
+        client = self.get_client()
+
+        def get_json(params):
+            try:
+                return client.get(params).json()
+            except (requests.RequestException, ValueError):
+                return None
+
+        max_workers = min(settings.PROVIDER_API_MAX_WORKERS, len(params_list))
+        with metrics.timer('api'), ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(get_json, params_list))
+
+    def set_book_data_many(self, params_list, data_list):
+        self.get_client().set_many(params_list, data_list)
+
+    def get_client(self):
+        return CachedProviderClient(self.provider.endpoint, key_prefix=self.provider.slug, **self.client_kwargs)
 
     def format_isbn(self, isbn):
         return re.sub(r'\D', '', isbn)
@@ -1,3 +1,4 @@
+import hashlib
 import re
 
 from django.conf import settings
@@ -5,8 +6,13 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required as login_required_
 from django.shortcuts import redirect
 from django.templatetags.static import static
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers,
+)
 from django.utils.decorators import method_decorator
-from django.utils.http import urlencode
+from django.utils.http import (
+    quote_etag, urlencode,
+)
 from django.utils.translation import gettext_lazy as _
 from django.views import generic
 from django.views.decorators.csrf import csrf_protect as csrf_protect_
@@ -56,13 +62,58 @@ class TemplateContextMixin:
             'twitter_site': self.twitter_site,
             'slug_no_theme': self.slug_no_theme,
             'dummy_image': self.dummy_image,
+            'card_cache_timeout': settings.PLAYLIST_CARD_CACHE_TIMEOUT,
         })
         return context
 
+    def set_og_image(self, playlist):
+        self.og_image = playlist.get_og_image_url()
+        if playlist.og_image:
+            self.og_image_width = settings.OG_IMAGE_WIDTH
+            self.og_image_height = settings.OG_IMAGE_HEIGHT
+
     def get_full_absolute_url(self, obj):
         return '{}://{}{}'.format(self.request.scheme, self.request.get_host(), obj.get_absolute_url())
 
 
+class ConditionalGetMixin:
+    # ETag of a page of a single object, checked before get_context_data so that
+    # a 304 skips the rest of the queries. No Last-Modified: the like count, the
+    # like of the viewer and the cards on the page change without a timestamp.
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        etag = quote_etag(self.get_etag())
+        # Flash messages are shown only once, so such responses are neither validated nor cached.
+        has_messages = bool(len(messages.get_messages(request)))
+        is_private = request.user.is_authenticated or has_messages
+
+        response = None
+        if not has_messages:
+            response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = self.render_to_response(self.get_context_data())
+
+        response['ETag'] = etag
+        if is_private:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(response, public=True, max_age=0, s_maxage=settings.CONDITIONAL_GET_SHARED_MAX_AGE)
+        patch_vary_headers(response, ('Cookie',))
+        return response
+
+    def get_etag(self):
+        viewer = None
+        if self.request.user.is_authenticated:
+            # The CSRF token in the forms of the page changes with the cookie.
+            viewer = (self.request.user.pk, self.request.META.get('CSRF_COOKIE'))
+        values = [settings.CONDITIONAL_GET_VERSION, viewer] + self.get_etag_values()
+        return hashlib.md5(repr(values).encode()).hexdigest()
+
+    def get_etag_values(self):
+        raise NotImplementedError
+
+
 class OwnerOnlyMixin:
 
     def dispatch(self, request, *args, **kwargs):
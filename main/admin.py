@@ -163,6 +163,8 @@ class BookAdmin(Admin):
     list_display = ('__str__', 'isbn', 'created_at',)
     list_filter = ('created_at', 'updated_at',)
     search_fields = ('isbn', 'book_data__title', 'book_data__author', 'book_data__publisher', 'book_data__cover', 'book_data__affiliate_url',)
+    # Resolved from the book data by Book.refresh_book_data
+    readonly_fields = ('title', 'author', 'publisher', 'cover', 'affiliate_url',)
     inlines = [BookDataInline, PlaylistBookTabularInline]
 
 
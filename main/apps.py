@@ -5,3 +5,8 @@ from django.utils.translation import gettext_lazy as _
 class MainConfig(AppConfig):
     name = 'main'
     verbose_name = _('main')
+
+    def ready(self):
+        from . import (
+            checks, signals,
+        )
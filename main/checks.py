@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.checks import (
+    Warning, register,
+)
+
+
+# Caches of each process, which the other processes do not see
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    if settings.DEBUG or settings.CACHES['default']['BACKEND'] not in LOCAL_CACHE_BACKENDS:
+        return []
+    hints = ['The other processes serve the homepage sections for up to HOMEPAGE_SNAPSHOT_TIMEOUT seconds after a change.']
+    if settings.PLAYLIST_SEARCH_BACKEND == 'ngram':
+        hints.append('Their search indexes see the changes only at the reload every PLAYLIST_SEARCH_INDEX_RELOAD_INTERVAL seconds.')
+    hints.append('Use a shared cache such as memcached.')
+    return [
+        Warning(
+            'The default cache is not shared between processes.',
+            hint=' '.join(hints),
+            id='main.W002',
+        )
+    ]
+
+
+@register()
+def check_og_image_fonts(app_configs, **kwargs):
+    if settings.OG_IMAGE_RENDERER != 'pillow':
+        return []
+    from .renderers import get_missing_fonts
+
+    return [
+        Warning(
+            'Font "{}" of OG_IMAGE_FONTS is not found: {}'.format(name, settings.OG_IMAGE_FONTS.get(name)),
+            hint="Put the font at that path, or set OG_IMAGE_RENDERER = 'html' to render OG images with wkhtmltoimage. "
+                 "Rendering with Pillow fails until then.",
+            id='main.W001',
+        )
+        for name in get_missing_fonts()
+    ]
@@ -0,0 +1,76 @@
+import hashlib
+import io
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from PIL import Image
+
+from bookplaylist.clients import get_session
+
+
+# Bounding boxes (width, height) of the variants, about twice the CSS size for
+# high-density displays. Images are never scaled up.
+VARIANTS = {
+    'list': (210, 310),
+    'small': (180, 270),
+    'og': (252, 378),
+}
+
+FORMATS = {
+    'jpg': {'format': 'JPEG', 'quality': 85, 'optimize': True, 'progressive': True},
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 6},
+}
+
+
+def get_cover_path(isbn, source, variant, extension):
+    # The digest of the source URL makes each path immutable, so the files can be
+    # served with a long cache lifetime and replaced when the cover changes.
+    digest = hashlib.md5(source.encode()).hexdigest()[:8]
+    return '{}/{}/{}-{}.{}'.format(settings.COVER_CACHE_DIRECTORY, isbn, digest, variant, extension)
+
+
+def get_cover_paths(isbn, source):
+    return [
+        get_cover_path(isbn, source, variant, extension)
+        for variant in VARIANTS for extension in FORMATS
+    ]
+
+
+def download_cover(source):
+    response = get_session().get(source, timeout=settings.PROVIDER_API_TIMEOUT)
+    response.raise_for_status()
+    image = Image.open(io.BytesIO(response.content))
+    image.load()
+    return image.convert('RGB')
+
+
+def save_cover_variants(isbn, source):
+    image = download_cover(source)
+    for variant, size in VARIANTS.items():
+        thumbnail = image.copy()
+        thumbnail.thumbnail(size, Image.LANCZOS)
+        for extension, options in FORMATS.items():
+            output = io.BytesIO()
+            thumbnail.save(output, **options)
+            path = get_cover_path(isbn, source, variant, extension)
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            default_storage.save(path, ContentFile(output.getvalue()))
+
+
+def delete_cover_variants(isbn, source):
+    for path in get_cover_paths(isbn, source):
+        if default_storage.exists(path):
+            default_storage.delete(path)
+
+
+def open_cover_variant(isbn, source, variant):
+    try:
+        with default_storage.open(get_cover_path(isbn, source, variant, 'jpg')) as f:
+            image = Image.open(io.BytesIO(f.read()))
+            image.load()
+            return image
+    except (OSError, ValueError):
+        return None
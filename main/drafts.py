@@ -0,0 +1,104 @@
+from django import forms
+
+from .forms import PlaylistBookFormSet
+from .models import Book
+
+
+SESSION_KEY = 'playlist_draft'
+PREFIX = 'playlist_book_set'
+PLAYLIST_FIELDS = ('title', 'theme', 'description')
+
+
+def get_playlist_key(pk):
+    return str(pk) if pk else None
+
+
+class PlaylistDraft:
+    # The playlist being created or updated while books are searched and added.
+    # The session holds the fields of the playlist and [isbn, description, pk, deleted]
+    # of each book only; the titles and the covers are read from the books on render.
+
+    def __init__(self, pk=None, fields=None, books=None):
+        self.pk = get_playlist_key(pk)
+        self.fields = fields
+        self.books = [list(book) for book in books or []]
+        self.isbn_set = {book[0] for book in self.books}
+
+    def __contains__(self, isbn):
+        return isbn in self.isbn_set
+
+    @classmethod
+    def load(cls, session, pk=None):
+        # Returns None if there is no draft of the playlist, e.g. after the session expired.
+        data = session.get(SESSION_KEY)
+        if not data or data.get('pk') != get_playlist_key(pk):
+            return None
+        return cls(data['pk'], data['fields'], data['books'])
+
+    @classmethod
+    def from_playlist(cls, playlist):
+        return cls(playlist.pk, books=[
+            [playlist_book.book_id, playlist_book.description, str(playlist_book.pk), False]
+            for playlist_book in playlist.playlist_book_set.all()
+        ])
+
+    @staticmethod
+    def clear(session):
+        session.pop(SESSION_KEY, None)
+
+    def save(self, session):
+        session[SESSION_KEY] = {
+            'pk': self.pk,
+            'fields': self.fields,
+            'books': self.books,
+        }
+
+    def update(self, data):
+        # Takes the fields and the books posted by the playlist form.
+        self.fields = {name: data.get(name, '') for name in PLAYLIST_FIELDS}
+        try:
+            total = int(data.get('{}-TOTAL_FORMS'.format(PREFIX)))
+        except (TypeError, ValueError):
+            total = 0
+        books = []
+        for i in range(min(total, PlaylistBookFormSet.absolute_max)):
+            form_prefix = '{}-{}'.format(PREFIX, i)
+            isbn = data.get('{}-book'.format(form_prefix))
+            if not isbn:
+                continue
+            books.append([
+                isbn,
+                data.get('{}-description'.format(form_prefix), ''),
+                data.get('{}-id'.format(form_prefix)) or None,
+                forms.BooleanField().to_python(data.get('{}-DELETE'.format(form_prefix))),
+            ])
+        self.books = books
+        self.isbn_set = {book[0] for book in books}
+
+    def add(self, isbn):
+        if isbn in self.isbn_set:
+            return False
+        self.books.append([isbn, '', None, False])
+        self.isbn_set.add(isbn)
+        return True
+
+    def get_data(self):
+        # The data of the playlist form and the formset as if they were posted
+        data = dict(self.fields or {})
+        data.update({
+            '{}-TOTAL_FORMS'.format(PREFIX): str(len(self.books)),
+            '{}-INITIAL_FORMS'.format(PREFIX): str(sum(1 for book in self.books if book[2])),
+        })
+        for i, (isbn, description, pk, deleted) in enumerate(self.books):
+            form_prefix = '{}-{}'.format(PREFIX, i)
+            data['{}-book'.format(form_prefix)] = isbn
+            data['{}-description'.format(form_prefix)] = description
+            if pk:
+                data['{}-id'.format(form_prefix)] = pk
+            if deleted:
+                data['{}-DELETE'.format(form_prefix)] = 'on'
+        return data
+
+    def get_books(self):
+        books = Book.objects.prefetch_related(None).in_bulk(list(self.isbn_set), field_name='isbn')
+        return [books.get(book[0]) or Book(isbn=book[0]) for book in self.books]
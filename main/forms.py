@@ -1,11 +1,13 @@
 from django import forms
 from django.conf import settings
 from django.contrib.sites.shortcuts import get_current_site
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 
 from .models import (
-    Playlist, PlaylistBook, Theme,
+    Book, Playlist, PlaylistBook, Theme,
 )
+from bookplaylist.models import perform_unique_checks_conditional
 from bookplaylist.utils import SendEmailMixin
 
 
@@ -53,22 +55,73 @@ class PlaylistForm(BasePlaylistForm):
         return super().save(commit=commit)
 
 
+class PrefetchedModelChoiceField(forms.ModelChoiceField):
+    # Looks up the objects fetched by the formset at once before querying one by one.
+    objects = None
+
+    def to_python(self, value):
+        if self.objects and value in self.objects:
+            return self.objects[value]
+        return super().to_python(value)
+
+
 class PlaylistBookForm(BasePlaylistForm):
 
     class Meta:
         model = PlaylistBook
         fields = ('book', 'description',)
+        field_classes = {
+            'book': PrefetchedModelChoiceField,
+        }
 
-    def __init__(self, request, *args, **kwargs):
+    def __init__(self, request, *args, books=None, **kwargs):
         super().__init__(request, *args, **kwargs)
         self.fields['book'].widget = forms.HiddenInput()
+        self.fields['book'].objects = books
+        self._is_book_checked = False
         self.fields['description'].widget.attrs['placeholder'] = '例）幻想的で不思議な雰囲気を味わいたいひとにおすすめの一冊です。'
 
+    def _post_clean(self):
+        # The field has already found the book, so the model does not query it again.
+        # The unique checks of the formset still include the book.
+        self._is_book_checked = self.cleaned_data.get('book') is not None
+        try:
+            super()._post_clean()
+        finally:
+            self._is_book_checked = False
+
+    def _get_validation_exclusions(self):
+        exclude = super()._get_validation_exclusions()
+        if self._is_book_checked:
+            exclude.append('book')
+        return exclude
+
 
 DELETION_FIELD_NAME = 'DELETE'
 
 
-class HiddenDeleteBaseInlineFormSet(forms.BaseInlineFormSet):
+class UniqueConditionalFormSetMixin:
+    # Checks the conditional unique constraints of all the forms in one query
+    # instead of one query per form and constraint.
+
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        form.instance._defer_unique_checks_conditional = True
+        return form
+
+    def validate_unique(self):
+        super().validate_unique()
+        forms_to_delete = self.deleted_forms
+        valid_forms = [form for form in self.forms if form.is_valid() and form not in forms_to_delete]
+        errors = perform_unique_checks_conditional([
+            (form.instance, form._get_validation_exclusions()) for form in valid_forms
+        ])
+        for form, form_errors in zip(valid_forms, errors):
+            if form_errors:
+                form.add_error(None, form_errors)
+
+
+class HiddenDeleteBaseInlineFormSet(UniqueConditionalFormSetMixin, forms.BaseInlineFormSet):
 
     def add_fields(self, form, index):
         super().add_fields(form, index)
@@ -84,11 +137,46 @@ class HiddenDeleteBaseInlineFormSet(forms.BaseInlineFormSet):
             )
 
 
+class BasePlaylistBookFormSet(HiddenDeleteBaseInlineFormSet):
+
+    @cached_property
+    def books(self):
+        isbn_list = [self.data.get('{}-book'.format(self.add_prefix(i))) for i in range(self.total_form_count())]
+        return Book.objects.prefetch_related(None).in_bulk([isbn for isbn in isbn_list if isbn], field_name='isbn')
+
+    @cached_property
+    def playlist_books(self):
+        return {str(playlist_book.pk): playlist_book for playlist_book in self.get_queryset()}
+
+    def get_form_kwargs(self, index):
+        kwargs = super().get_form_kwargs(index)
+        if self.is_bound:
+            kwargs['books'] = self.books
+        return kwargs
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        field = form.fields[self._pk_field.name]
+        form.fields[self._pk_field.name] = PrefetchedModelChoiceField(
+            field.queryset, initial=field.initial, required=False, widget=field.widget,
+        )
+        form.fields[self._pk_field.name].objects = self.playlist_books
+
+    def save_bulk(self):
+        # Instead of save(), which saves the forms one by one
+        items = [
+            (form.instance.book_id, form.instance.description)
+            for form in self.forms
+            if form.cleaned_data.get('book') and form not in self.deleted_forms
+        ]
+        return PlaylistBook.objects.sync(self.instance, items)
+
+
 PlaylistBookFormSet = forms.inlineformset_factory(
     parent_model=Playlist,
     model=PlaylistBook,
     form=PlaylistBookForm,
-    formset=HiddenDeleteBaseInlineFormSet,
+    formset=BasePlaylistBookFormSet,
     extra=0,
 )
 
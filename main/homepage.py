@@ -0,0 +1,108 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import (
+    Playlist, Theme,
+)
+
+
+SECTIONS = ('recommended', 'popular', 'recent', 'themes')
+
+
+def get_cache_key(section):
+    return 'homepage:{}'.format(section)
+
+
+def build_recommended():
+    return list(
+        Playlist.objects
+            .filter(sequence__isnull=False)
+            .order_by('sequence')
+            .values_list('pk', flat=True)
+    )
+
+
+def build_popular():
+    return list(
+        Playlist.objects
+            .filter(book_count__gte=2)
+            .order_by('-like_count', '-created_at')
+            .values_list('pk', flat=True)[:4]
+    )
+
+
+def build_recent():
+    return list(
+        Playlist.objects
+            .filter(book_count__gte=2)
+            .order_by('-created_at')
+            .values_list('pk', flat=True)[:4]
+    )
+
+
+def build_themes():
+    playlist_ids = {}
+    playlists = Playlist.objects \
+        .filter(recommendation__isnull=False, recommendation__sequence__isnull=False) \
+        .order_by('recommendation__sequence') \
+        .values_list('theme', 'pk')
+    for theme_id, pk in playlists:
+        playlist_ids.setdefault(theme_id, []).append(pk)
+    return [(theme_id, playlist_ids.get(theme_id, [])) for theme_id in Theme.objects.values_list('pk', flat=True)]
+
+
+BUILDERS = {
+    'recommended': build_recommended,
+    'popular': build_popular,
+    'recent': build_recent,
+    'themes': build_themes,
+}
+
+
+def refresh(sections=SECTIONS):
+    snapshot = {section: BUILDERS[section]() for section in sections}
+    cache.set_many({get_cache_key(section): ids for section, ids in snapshot.items()}, settings.HOMEPAGE_SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def invalidate(*sections):
+    # After commit, so that the next request does not rebuild from the old rows.
+    keys = [get_cache_key(section) for section in sections]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def get_snapshot():
+    cached = cache.get_many([get_cache_key(section) for section in SECTIONS])
+    snapshot = {section: cached[get_cache_key(section)] for section in SECTIONS if get_cache_key(section) in cached}
+    missing = [section for section in SECTIONS if section not in snapshot]
+    if missing:
+        snapshot.update(refresh(missing))
+    return snapshot
+
+
+def get_sections():
+    snapshot = get_snapshot()
+    playlist_ids = set(snapshot['recommended'] + snapshot['popular'] + snapshot['recent'])
+    for theme_id, ids in snapshot['themes']:
+        playlist_ids.update(ids)
+
+    # Playlists unpublished since the snapshot are dropped here.
+    playlists = Playlist.objects.for_cards().in_bulk(playlist_ids)
+    themes = Theme.objects.in_bulk([theme_id for theme_id, ids in snapshot['themes']])
+
+    def hydrate(ids):
+        return [playlists[pk] for pk in ids if pk in playlists]
+
+    theme_list = []
+    for theme_id, ids in snapshot['themes']:
+        if theme_id in themes:
+            theme = themes[theme_id]
+            theme.homepage_playlists = hydrate(ids)
+            theme_list.append(theme)
+    return {
+        'playlists_recommended': hydrate(snapshot['recommended']),
+        'playlists_popular': hydrate(snapshot['popular']),
+        'playlists_recent': hydrate(snapshot['recent']),
+        'themes': theme_list,
+    }
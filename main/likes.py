@@ -0,0 +1,120 @@
+import atexit
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import (
+    Case, F, IntegerField, Value, When,
+)
+from django.utils import timezone
+
+from . import homepage
+
+
+class LikeCounterBuffer:
+    # Deltas of Playlist.like_count in this process, written in one UPDATE when
+    # LIKE_COUNTER_FLUSH_INTERVAL seconds have passed or LIKE_COUNTER_FLUSH_SIZE
+    # playlists are pending. Deltas lost in a crash are repaired by
+    # `manage.py reconcileplaylistcounts`.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.deltas = defaultdict(int)
+        self.flushed_at = time.monotonic()
+
+    def add(self, pk, delta, flush=False):
+        with self.lock:
+            self.deltas[pk] += delta
+        if flush:
+            self.flush()
+
+    def get(self, pk):
+        return self.deltas.get(pk, 0)
+
+    def flush(self, force=False):
+        from .models import Playlist
+
+        with self.lock:
+            is_due = time.monotonic() - self.flushed_at >= settings.LIKE_COUNTER_FLUSH_INTERVAL \
+                or len(self.deltas) >= settings.LIKE_COUNTER_FLUSH_SIZE
+            if not force and not is_due:
+                return
+            deltas = {pk: delta for pk, delta in self.deltas.items() if delta}
+            self.deltas = defaultdict(int)
+            self.flushed_at = time.monotonic()
+        if not deltas:
+            return
+        try:
+            Playlist.all_objects.filter(pk__in=list(deltas)).update(like_count=F('like_count') + Case(
+                *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+                default=Value(0),
+                output_field=IntegerField(),
+            ))
+        except Exception:
+            for pk, delta in deltas.items():
+                self.add(pk, delta)
+            raise
+
+
+counter_buffer = LikeCounterBuffer()
+atexit.register(lambda: counter_buffer.flush(force=True))
+
+
+def get_count(playlist):
+    if settings.LIKE_COUNTER_BUFFER:
+        return playlist.like_count + counter_buffer.get(playlist.pk)
+    return playlist.like_count
+
+
+def set_like(playlist, user, liked):
+    # Likes or unlikes the playlist and returns the number of likes after it.
+    # Repeating it does nothing, so a double click cannot like twice.
+    from .models import Like, Playlist
+
+    with transaction.atomic():
+        now = timezone.now()
+        if liked:
+            delta = _add_like(playlist, user, now)
+        else:
+            # One conditional UPDATE: only the active likes are deleted, and the count is what it changed.
+            delta = -Like.objects.filter(playlist=playlist, user=user).update(deleted_at=now, updated_at=now)
+
+        if delta:
+            homepage.invalidate('popular')
+            if settings.LIKE_COUNTER_BUFFER:
+                transaction.on_commit(lambda: counter_buffer.add(playlist.pk, delta, flush=True))
+            else:
+                Playlist.all_objects.filter(pk=playlist.pk).update(like_count=F('like_count') + delta)
+
+        count = Playlist.all_objects.values_list('like_count', flat=True).get(pk=playlist.pk)
+        if settings.LIKE_COUNTER_BUFFER:
+            count += counter_buffer.get(playlist.pk) + delta
+        return count
+
+
+def _add_like(playlist, user, now):
+    # There is no INSERT ... ON CONFLICT here: the unique constraint of the active like of
+    # the pair is conditional, which MySQL does not enforce (BaseModel.validate_unique checks
+    # it instead), so nothing in the database would conflict with a second active like.
+    # The row lock of the user makes the check and the insert atomic for the pair; it holds
+    # only the likes of the same user, and those of other users on the playlist do not wait.
+    from .models import Like
+
+    list(get_user_model().objects.select_for_update().filter(pk=user.pk).values_list('pk', flat=True))
+    rows = list(
+        Like.all_objects
+            .filter(playlist=playlist, user=user)
+            .order_by('-updated_at')
+            .values_list('pk', 'deleted_at')
+    )
+    if any(deleted_at is None for pk, deleted_at in rows):
+        return 0
+    # Restore the latest like rather than adding a row for each like
+    if rows:
+        Like.all_objects.filter(pk=rows[0][0]).update(deleted_at=None, updated_at=now)
+    else:
+        Like.objects.bulk_create([Like(playlist=playlist, user=user)])
+    return 1
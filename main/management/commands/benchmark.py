@@ -0,0 +1,298 @@
+import json
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import (
+    BaseCommand, CommandError,
+)
+from django.db import connection
+from django.test import Client
+from django.test.utils import (
+    override_settings, setup_test_environment, teardown_test_environment,
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from main import (
+    homepage, related,
+)
+from main.models import (
+    Book, BookData, Like, Playlist, PlaylistBook, Provider, Recommendation, Theme,
+)
+from main.search import (
+    ngram_index, update_documents,
+)
+
+
+DATASET_OPTIONS = (
+    'users', 'playlists', 'books', 'books_per_playlist', 'providers', 'likes', 'themes', 'recommendations', 'seed',
+)
+
+WORDS = [
+    '小説', 'ミステリー', 'ビジネス', '入門', '歴史', '料理', '旅行', '哲学', '科学', '経済',
+    'デザイン', 'プログラミング', '村上春樹', '夏目漱石', '東京', '京都', '猫', '宇宙', '恋愛', '写真',
+    'python', 'django', 'design', 'history', 'novel', 'essay', 'travel', 'science', 'startup', 'poetry',
+]
+
+
+class Command(BaseCommand):
+    help = 'Seed a synthetic dataset in a test database and measure the main views.'
+
+    def add_arguments(self, parser):
+        for name, default, help_text in [
+            ('users', 100, 'Number of users'),
+            ('playlists', 1000, 'Number of playlists'),
+            ('books', 2000, 'Number of books'),
+            ('books-per-playlist', 5, 'Number of books of each playlist'),
+            ('providers', 2, 'Number of providers, each with BookData of every book'),
+            ('likes', 5000, 'Number of likes'),
+            ('themes', 8, 'Number of themes'),
+            ('recommendations', 20, 'Number of recommended playlists'),
+            ('requests', 50, 'Number of measured requests of each scenario'),
+            ('seed', 0, 'Seed of the random generator'),
+        ]:
+            parser.add_argument(
+                '--{}'.format(name),
+                type=int,
+                default=default,
+                help='{}. Default is {}'.format(help_text, default),
+            )
+        parser.add_argument(
+            '--output',
+            help='Write the results to this file instead of stdout',
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be 1 or more.')
+        if settings.DEBUG:
+            self.stderr.write('DEBUG is on: the results include the overhead of the debug toolbar.')
+
+        self.rng = random.Random(options['seed'])
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+        try:
+            # A private cache, so that the shared one is neither read nor polluted.
+            with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+                self.seed(options)
+                results = {
+                    'environment': self.get_environment(),
+                    'dataset': self.get_dataset(),
+                    'options': {name: options[name] for name in DATASET_OPTIONS},
+                    'scenarios': self.run_scenarios(options['requests']),
+                }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(results, indent=2, ensure_ascii=False, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            print(output)
+
+    # Dataset
+
+    def seed(self, options):
+        rng = self.rng
+        start = time.monotonic()
+
+        providers = Provider.objects.bulk_create([
+            Provider(
+                name='Benchmark {}'.format(i),
+                slug='benchmark-{}'.format(i),
+                endpoint='https://example.com/{}/'.format(i),
+                priority=100 + i,
+            )
+            for i in range(options['providers'])
+        ])
+        themes = [
+            Theme.objects.get_or_create(slug='benchmark-{}'.format(i), defaults={'name': 'ベンチマーク{}'.format(i), 'sequence': i})[0]
+            for i in range(options['themes'])
+        ]
+        users = User.objects.bulk_create([
+            User(
+                username='user{}'.format(i),
+                email='user{}@example.com'.format(i),
+                password=make_password(None),
+                nickname=self.get_words(2),
+                date_verified=timezone.now(),
+            )
+            for i in range(options['users'])
+        ])
+
+        books = Book.objects.bulk_create([
+            Book(
+                isbn='978{:010d}'.format(i),
+                title=self.get_words(3),
+                author=self.get_words(1),
+                publisher=self.get_words(1),
+                cover='https://example.com/covers/{}.jpg'.format(i),
+            )
+            for i in range(options['books'])
+        ])
+        BookData.objects.bulk_create([
+            BookData(
+                book=book,
+                provider=provider,
+                title=book.title,
+                author=book.author,
+                publisher=book.publisher,
+                cover=book.cover,
+            )
+            for book in books for provider in providers
+        ], batch_size=1000)
+
+        playlists = Playlist.objects.bulk_create([
+            Playlist(
+                user=rng.choice(users),
+                theme=rng.choice(themes),
+                title=self.get_words(3),
+                description=self.get_words(12),
+                sequence=i + 1 if i < 4 else None,
+            )
+            for i in range(options['playlists'])
+        ], batch_size=1000)
+        books_per_playlist = min(options['books_per_playlist'], len(books))
+        PlaylistBook.objects.bulk_create([
+            PlaylistBook(playlist=playlist, book=book, description=self.get_words(8))
+            for playlist in playlists for book in rng.sample(books, books_per_playlist)
+        ], batch_size=1000)
+
+        pairs = set()
+        max_likes = min(options['likes'], len(playlists) * len(users))
+        while len(pairs) < max_likes:
+            pairs.add((rng.randrange(len(playlists)), rng.randrange(len(users))))
+        Like.objects.bulk_create([
+            Like(playlist=playlists[i], user=users[j]) for i, j in sorted(pairs)
+        ], batch_size=1000)
+        Recommendation.objects.bulk_create([
+            Recommendation(playlist=playlist, theme=playlist.theme, sequence=i + 1)
+            for i, playlist in enumerate(rng.sample(playlists, min(options['recommendations'], len(playlists))))
+        ])
+
+        # bulk_create skips save(), so the counters and the indexes are built here.
+        Playlist.all_objects.refresh_counts()
+        pk_list = [playlist.pk for playlist in playlists]
+        for i in range(0, len(pk_list), 500):
+            update_documents(pk_list[i:i + 500])
+        ngram_index.bump_version()
+        ngram_index.load()
+        for _ in related.rebuild():
+            pass
+        homepage.refresh()
+
+        self.users, self.themes, self.playlists = users, themes, playlists
+        self.likes = {(playlists[i].pk, users[j].pk) for i, j in pairs}
+        self.stderr.write('Seeded in {:.1f}s.'.format(time.monotonic() - start))
+
+    def get_words(self, n):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(n))
+
+    def get_dataset(self):
+        return {
+            model._meta.db_table: model.objects.count()
+            for model in (User, Provider, Theme, Book, BookData, Playlist, PlaylistBook, Like, Recommendation)
+        }
+
+    def get_environment(self):
+        try:
+            commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+        }
+
+    # Scenarios
+
+    def get_scenarios(self):
+        rng = self.rng
+        user = self.users[0]
+        return [
+            ('index', None, lambda: ('get', reverse('main:index'), {}, {})),
+            ('playlist_popular', None, lambda: ('get', reverse('main:playlist'), {'ordering': 'popular'}, {})),
+            ('playlist_recent', None, lambda: ('get', reverse('main:playlist'), {'ordering': 'recent'}, {})),
+            ('playlist_search', None, lambda: ('get', reverse('main:playlist'), {'q': rng.choice(WORDS)}, {})),
+            ('playlist_theme', None, lambda: ('get', reverse('main:playlist'), {'theme': rng.choice(self.themes).slug}, {})),
+            ('playlist_detail', None, lambda: ('get', reverse('main:playlist_detail', args=[rng.choice(self.playlists).pk]), {}, {})),
+            ('playlist_like', user, lambda: self.get_like_request(user, rng.choice(self.playlists))),
+            ('profile', None, lambda: ('get', reverse('accounts:profile', args=[rng.choice(self.users).username]), {}, {})),
+        ]
+
+    def get_like_request(self, user, playlist):
+        key = (playlist.pk, user.pk)
+        is_liked = key in self.likes
+        self.likes ^= {key}
+        return ('post', reverse('main:playlist_like', args=[playlist.pk]), {
+            'count': 0,
+            'is_liked': 'true' if is_liked else 'false',
+        }, {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'})
+
+    def run_scenarios(self, n):
+        results = {}
+        for name, user, get_request in self.get_scenarios():
+            client = Client()
+            if user:
+                client.force_login(user, backend='accounts.backends.ModelBackend')
+
+            # The first request warms up the caches and the n-gram index.
+            self.request(client, name, *get_request())
+            latencies, queries = [], []
+            for i in range(n):
+                elapsed, count = self.request(client, name, *get_request())
+                latencies.append(elapsed * 1000)
+                queries.append(count)
+
+            # Measured apart, as tracing slows the requests down.
+            tracemalloc.start()
+            self.request(client, name, *get_request())
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            latencies.sort()
+            results[name] = {
+                'requests': n,
+                'p50_ms': round(self.get_percentile(latencies, 50), 2),
+                'p95_ms': round(self.get_percentile(latencies, 95), 2),
+                'p99_ms': round(self.get_percentile(latencies, 99), 2),
+                'max_ms': round(latencies[-1], 2),
+                'queries_median': sorted(queries)[len(queries) // 2],
+                'queries_max': max(queries),
+                'peak_memory_kb': round(peak / 1024),
+            }
+            self.stderr.write('{}: p50 {p50_ms}ms, p95 {p95_ms}ms, {queries_max} queries'.format(name, **results[name]))
+        return results
+
+    def request(self, client, name, method, path, data, extra):
+        count = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal count
+            count += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_queries):
+            start = time.perf_counter()
+            response = getattr(client, method)(path, data, **extra)
+            elapsed = time.perf_counter() - start
+        if response.status_code != 200:
+            raise CommandError('{}: {} {} returned {}.'.format(name, method.upper(), path, response.status_code))
+        return elapsed, count
+
+    def get_percentile(self, values, percentile):
+        # Nearest-rank percentile of sorted values
+        index = max(0, -(-len(values) * percentile // 100) - 1)
+        return values[index]
@@ -0,0 +1,57 @@
+import requests
+from concurrent.futures import (
+    ThreadPoolExecutor, as_completed,
+)
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from main.models import Book
+
+
+def cache_cover(book, force):
+    try:
+        return book.cache_cover(force=force)
+    finally:
+        # Each thread opens its own connection to update the book.
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Download covers of Book and store their resized copies.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', '-f',
+            action='store_true',
+            help='Download covers which are already cached. Default is False',
+        )
+        parser.add_argument(
+            '--workers', '-w',
+            type=int,
+            default=4,
+            help='Number of threads to download covers. Default is 4',
+        )
+
+    def handle(self, *args, **options):
+        books = [
+            book for book in Book.objects.exclude(cover=None)
+            if options['force'] or not book.has_cached_cover()
+        ]
+
+        n = len(books)
+        if not n:
+            print('No covers to cache.')
+            return
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {executor.submit(cache_cover, book, options['force']): book for book in books}
+            for i, future in enumerate(as_completed(futures)):
+                i = str(i+1).zfill(len(str(n)))
+                book = futures[future]
+                try:
+                    future.result()
+                except (requests.RequestException, OSError) as e:
+                    print('{i}/{n} Failed. | isbn: {isbn} | error: {error}'.format(i=i, n=n, isbn=book.isbn, error=repr(e)))
+                else:
+                    print('{i}/{n} Done. | title: {title}'.format(i=i, n=n, title=book))
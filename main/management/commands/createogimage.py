@@ -1,9 +1,23 @@
+import time
+from functools import partial
+from concurrent.futures import (
+    ProcessPoolExecutor, as_completed,
+)
+
 from django.core.management.base import BaseCommand
+from django.db import connections
 from django.db.models import Q
 
 from main.models import Playlist
 
 
+def render_og_image(pk):
+    playlist = Playlist.objects.select_related('theme__template').get(pk=pk)
+    playlist.cache_covers()
+    playlist.save_og_image()
+    return playlist.title
+
+
 class Command(BaseCommand):
     help = 'Create Open Graph image of Playlist.'
 
@@ -11,17 +25,62 @@ class Command(BaseCommand):
         parser.add_argument(
             '--override', '--force', '-f',
             action='store_true',
-            help='Override existing images. Default is False',
+            help='Override existing images whose title, template, books or covers changed. Default is False',
+        )
+        parser.add_argument(
+            '--ignore-fingerprint',
+            action='store_true',
+            help='With --override, render every image even if nothing relevant changed.',
+        )
+        parser.add_argument(
+            '--workers', '-w',
+            type=int,
+            default=1,
+            help='Number of processes to render images. Default is 1',
         )
 
     def handle(self, *args, **options):
-        if options['override']:
-            playlists = Playlist.objects.all()
+        playlists = Playlist.objects \
+            .select_related('theme__template') \
+            .prefetch_related('theme__template__book_numbers')
+        if not options['override']:
+            playlists = playlists.filter(Q(og_image=None) | Q(og_image=''))
+
+        # Images already rendered from the same contents are skipped, so an
+        # interrupted run resumes from where it stopped.
+        if options['override'] and not options['ignore_fingerprint']:
+            pk_list = [p.pk for p in playlists if not p.is_og_image_up_to_date()]
         else:
-            playlists = Playlist.objects.filter(Q(og_image=None) | Q(og_image=''))
-        n = playlists.count()
+            pk_list = [p.pk for p in playlists]
+
+        n = len(pk_list)
         if not n:
             print('No data to create the image.')
-        for i, playlist in enumerate(playlists):
-            playlist.save_og_image()
-            print('{i}/{n} Done. | title: {title}'.format(i=str(i+1).zfill(len(str(n))), n=n, title=playlist.title))
+            return
+
+        start = time.monotonic()
+        done = 0
+        if options['workers'] > 1:
+            # Child processes must open their own connections.
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+                futures = {executor.submit(render_og_image, pk): pk for pk in pk_list}
+                for i, future in enumerate(as_completed(futures)):
+                    done += self._print_result(i, n, futures[future], future.result)
+        else:
+            for i, pk in enumerate(pk_list):
+                done += self._print_result(i, n, pk, partial(render_og_image, pk))
+
+        elapsed = time.monotonic() - start
+        print('{done}/{n} images created in {elapsed:.1f}s ({rate:.2f} images/s).'.format(
+            done=done, n=n, elapsed=elapsed, rate=done / elapsed if elapsed else 0))
+
+    def _print_result(self, i, n, pk, get_result):
+        i = str(i+1).zfill(len(str(n)))
+        try:
+            title = get_result()
+        except Exception as e:
+            print('{i}/{n} Failed. | pk: {pk} | error: {error}'.format(i=i, n=n, pk=pk, error=repr(e)))
+            return 0
+        print('{i}/{n} Done. | title: {title}'.format(i=i, n=n, title=title))
+        return 1
@@ -8,8 +8,9 @@ from django.utils.translation import gettext as _
 
 from bookplaylist.utils import APIMixin
 from main.models import (
-    Book, Playlist, Provider,
+    Book, Playlist,
 )
+from main.providers import providers
 
 
 class Command(APIMixin, BaseCommand):
@@ -20,15 +21,14 @@ class Command(APIMixin, BaseCommand):
         parser.add_argument(
             '--provider', '-p',
             type=str,
-            choices=[p[0] for p in Provider.objects.values_list('slug')],
+            choices=[p.slug for p in providers.by_priority()],
             nargs='?',
             default=default_provider.slug,
             help='Specify the provider of book data. Default is {}'.format(default_provider.slug),
         )
 
     def handle(self, *args, **options):
-        provider = Provider.objects.get(slug=options['provider'])
-        endpoint = provider.endpoint
+        provider = providers.get(options['provider'])
         isbn_list = [p[0] for p in Playlist.all_objects.all().values_list('book')]
         for isbn in isbn_list:
             params = {
@@ -36,7 +36,11 @@ class Command(APIMixin, BaseCommand):
                 'isbn': isbn,
             }
 
-            response = self.get_book_data(params)
+            try:
+                response = self.get_book_data(params)
+            except requests.RequestException as e:
+                print('Failed to get book {}: {}'.format(isbn, e))
+                continue
             if response.status_code == requests.codes.bad_request:
                 print('No data found.')
             elif 'error' in response:
@@ -58,7 +62,7 @@ class Command(APIMixin, BaseCommand):
                 book, created = Book.objects.get_or_create(isbn=data['Item']['isbn'])
                 if created:
                     book.book_data_set.create(
-                        provider = Provider.objects.get(slug=options['provider']),
+                        provider = provider,
                         title = title,
                         author = data['Item']['author'],
                         publisher = data['Item']['publisherName'],
@@ -67,7 +71,7 @@ class Command(APIMixin, BaseCommand):
                     print('Both a book and the data "{}" created!'.format(title))
                 else:
                     book_data, data_created = book.book_data_set.get_or_create(
-                        provider = Provider.objects.get(slug=options['provider']),
+                        provider = provider,
                         defaults = {
                             'title': title,
                             'author': data['Item']['author'],
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from main import related
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the related playlists of every playlist from the books they share.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of playlists to save at once. Default is 500',
+        )
+        parser.add_argument(
+            '--queued', '-q',
+            action='store_true',
+            help='Recompute only the playlists changed since they were last computed.',
+        )
+        parser.add_argument(
+            '--loop', '-l',
+            action='store_true',
+            help='Keep recomputing the queued playlists at the interval instead of exiting. Implies --queued',
+        )
+        parser.add_argument(
+            '--interval', '-i',
+            type=float,
+            default=1.0,
+            help='Seconds to wait when the queue is empty with --loop. Default is 1.0',
+        )
+
+    def handle(self, *args, **options):
+        if not options['queued'] and not options['loop']:
+            for done, total in related.rebuild(options['batch_size']):
+                print('{}/{} Done.'.format(done, total))
+            return
+        while True:
+            close_old_connections()
+            count = related.update_queued(options['batch_size'])
+            if count:
+                print('{} Done.'.format(count))
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
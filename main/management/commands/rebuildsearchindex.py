@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.models import Playlist
+from main.search import (
+    ngram_index, update_documents,
+)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the search documents of Playlist and the n-gram index.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of playlists to rebuild at once. Default is 500',
+        )
+
+    def handle(self, *args, **options):
+        pk_list = list(Playlist.all_objects.values_list('pk', flat=True))
+        n = len(pk_list)
+        batch_size = options['batch_size']
+        for i in range(0, n, batch_size):
+            update_documents(pk_list[i:i + batch_size])
+            print('{}/{} Done.'.format(min(i + batch_size, n), n))
+
+        # Other processes reload the in-process index when its version changes.
+        ngram_index.bump_version()
+        start = time.monotonic()
+        ngram_index.load()
+        print('N-gram index: {documents} documents, {grams} n-grams, loaded in {elapsed:.2f}s.'.format(
+            documents=len(ngram_index), grams=len(ngram_index.postings), elapsed=time.monotonic() - start))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from main.models import Playlist
+
+
+class Command(BaseCommand):
+    help = 'Recount likes and books of Playlist where the stored counts drifted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only print the playlists to fix. Default is False',
+        )
+
+    def handle(self, *args, **options):
+        playlists = list(Playlist.all_objects.with_count_drift())
+
+        n = len(playlists)
+        if not n:
+            print('No drift of the counts.')
+            return
+
+        for playlist in playlists:
+            print('pk: {pk} | likes: {like_count} -> {actual_like_count} | books: {book_count} -> {actual_book_count}'.format(
+                pk=playlist.pk,
+                like_count=playlist.like_count,
+                actual_like_count=playlist.actual_like_count,
+                book_count=playlist.book_count,
+                actual_book_count=playlist.actual_book_count,
+            ))
+        if options['dry_run']:
+            print('{} playlists to fix.'.format(n))
+            return
+
+        Playlist.all_objects.filter(pk__in=[playlist.pk for playlist in playlists]).refresh_counts()
+        print('{} playlists fixed.'.format(n))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from main import homepage
+
+
+class Command(BaseCommand):
+    help = 'Refresh the snapshot of the sections of the homepage.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', '-l',
+            action='store_true',
+            help='Keep refreshing at the interval instead of exiting.',
+        )
+        parser.add_argument(
+            '--interval', '-i',
+            type=float,
+            default=60.0,
+            help='Seconds between refreshes with --loop. Default is 60.0',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            start = time.monotonic()
+            snapshot = homepage.refresh()
+            print('Refreshed. | {sections} | {elapsed:.3f}s'.format(
+                sections=', '.join('{}: {}'.format(section, len(ids)) for section, ids in snapshot.items()),
+                elapsed=time.monotonic() - start,
+            ))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
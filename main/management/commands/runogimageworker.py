@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from main.models import OgImageJob
+
+
+class Command(BaseCommand):
+    help = 'Render Open Graph images of Playlists requested in the job queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', '-i',
+            type=float,
+            default=1.0,
+            help='Seconds to wait when the queue is empty. Default is 1.0',
+        )
+        parser.add_argument(
+            '--burst', '-b',
+            action='store_true',
+            help='Exit when the queue is empty instead of waiting for new jobs.',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            job = OgImageJob.objects.claim()
+            if not job:
+                if options['burst']:
+                    break
+                time.sleep(options['interval'])
+                continue
+            try:
+                job.run()
+            except Exception as e:
+                print('Failed. | title: {title} | error: {error}'.format(title=job.playlist.title, error=repr(e)))
+            else:
+                print('Done. | title: {title}'.format(title=job.playlist.title))
@@ -0,0 +1,64 @@
+# Generated by Django 2.2.6 on 2026-10-18 01:12
+
+import bookplaylist.models.fields
+from django.db import migrations
+
+
+BOOK_DATA_FIELDS = ('title', 'author', 'publisher', 'cover', 'affiliate_url')
+
+
+def resolve_book_data(apps, schema_editor):
+    Book = apps.get_model('main', 'Book')
+    BookData = apps.get_model('main', 'BookData')
+    db_alias = schema_editor.connection.alias
+    book_data_dict = {}
+    book_data_list = BookData.objects.using(db_alias) \
+        .filter(deleted_at__isnull=True) \
+        .select_related('provider') \
+        .order_by('provider__priority')
+    for book_datum in book_data_list:
+        book_data_dict.setdefault(book_datum.book_id, []).append(book_datum)
+    for isbn, book_data in book_data_dict.items():
+        values = {}
+        for field in BOOK_DATA_FIELDS:
+            values[field] = next((getattr(x, field) for x in book_data if getattr(x, field)), None)
+        Book.objects.using(db_alias).filter(isbn=isbn).update(**values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0029_auto_20191221_1152'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='title',
+            field=bookplaylist.models.fields.NullCharField(blank=True, max_length=255, null=True, verbose_name='title'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='author',
+            field=bookplaylist.models.fields.NullCharField(blank=True, max_length=255, null=True, verbose_name='author'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='publisher',
+            field=bookplaylist.models.fields.NullCharField(blank=True, max_length=255, null=True, verbose_name='publisher'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='cover',
+            field=bookplaylist.models.fields.NullURLField(blank=True, null=True, verbose_name='cover'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='affiliate_url',
+            field=bookplaylist.models.fields.NullURLField(blank=True, null=True, verbose_name='Affiliate URL'),
+        ),
+        migrations.RunPython(
+            resolve_book_data,
+            migrations.RunPython.noop,
+        ),
+    ]
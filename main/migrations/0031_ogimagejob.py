@@ -0,0 +1,52 @@
+# Generated by Django 2.2.6 on 2026-10-18 02:05
+
+import bookplaylist.models.fields
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0030_auto_20261018_1012'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OgImageJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='date created')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='date updated')),
+                ('deleted_at', models.DateTimeField(blank=True, null=True, verbose_name='date deleted')),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')], default='pending', max_length=10, verbose_name='status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='attempts')),
+                ('error', bookplaylist.models.fields.NullTextField(blank=True, null=True, verbose_name='error')),
+                ('date_requested', models.DateTimeField(default=django.utils.timezone.now, verbose_name='date requested')),
+                ('date_started', models.DateTimeField(blank=True, null=True, verbose_name='date started')),
+                ('date_finished', models.DateTimeField(blank=True, null=True, verbose_name='date finished')),
+                ('playlist', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='og_image_job', to='main.Playlist', verbose_name='playlist')),
+            ],
+            options={
+                'verbose_name': 'Open Graph image job',
+                'verbose_name_plural': 'Open Graph image jobs',
+                'db_table': 'og_image_jobs',
+                'ordering': ['date_requested'],
+                'abstract': False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ogimagejob',
+            index=models.Index(fields=['created_at'], name='created_at'),
+        ),
+        migrations.AddIndex(
+            model_name='ogimagejob',
+            index=models.Index(fields=['updated_at'], name='updated_at'),
+        ),
+        migrations.AddIndex(
+            model_name='ogimagejob',
+            index=models.Index(fields=['status', 'date_requested'], name='idx01'),
+        ),
+    ]
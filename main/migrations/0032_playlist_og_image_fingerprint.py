@@ -0,0 +1,19 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:20
+
+import bookplaylist.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0031_ogimagejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playlist',
+            name='og_image_fingerprint',
+            field=bookplaylist.models.fields.NullCharField(blank=True, editable=False, max_length=64, null=True, verbose_name='fingerprint of Open Graph image'),
+        ),
+    ]
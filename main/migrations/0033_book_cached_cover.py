@@ -0,0 +1,19 @@
+# Generated by Django 2.2.6 on 2026-10-18 14:20
+
+import bookplaylist.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0032_playlist_og_image_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='cached_cover',
+            field=bookplaylist.models.fields.NullURLField(blank=True, editable=False, null=True, verbose_name='cached cover'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 2.2.6 on 2026-10-18 07:30
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(model):
+    queryset = model.objects \
+        .filter(playlist=OuterRef('pk'), deleted_at__isnull=True) \
+        .order_by() \
+        .values('playlist') \
+        .annotate(count=Count('pk')) \
+        .values('count')
+    return Coalesce(Subquery(queryset, output_field=models.PositiveIntegerField()), 0)
+
+
+def count_likes_and_books(apps, schema_editor):
+    Playlist = apps.get_model('main', 'Playlist')
+    Like = apps.get_model('main', 'Like')
+    PlaylistBook = apps.get_model('main', 'PlaylistBook')
+    db_alias = schema_editor.connection.alias
+    Playlist.objects.using(db_alias).update(
+        like_count=count_subquery(Like),
+        book_count=count_subquery(PlaylistBook),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0033_book_cached_cover'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playlist',
+            name='book_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='book count'),
+        ),
+        migrations.AddField(
+            model_name='playlist',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='like count'),
+        ),
+        migrations.AddIndex(
+            model_name='playlist',
+            index=models.Index(fields=['like_count', 'created_at'], name='idx02'),
+        ),
+        migrations.AddIndex(
+            model_name='playlist',
+            index=models.Index(fields=['book_count', 'created_at'], name='idx03'),
+        ),
+        migrations.RunPython(
+            count_likes_and_books,
+            migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,113 @@
+# Generated by Django 2.2.6 on 2026-10-18 09:10
+
+import bookplaylist.models.fields
+from django.db import migrations, models
+import django.db.models.deletion
+import unicodedata
+import uuid
+
+
+def normalize(text):
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        schema_editor.execute(
+            "ALTER TABLE `playlist_search_documents` ADD FULLTEXT INDEX `ft01` (`document`) WITH PARSER ngram"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            "CREATE INDEX playlist_search_documents_trgm01 ON playlist_search_documents USING gin (document gin_trgm_ops)"
+        )
+    elif vendor == 'sqlite':
+        # The trigram tokenizer needs SQLite 3.34+; without it search falls back to the document column.
+        try:
+            with schema_editor.connection.cursor() as cursor:
+                cursor.execute(
+                    "CREATE VIRTUAL TABLE playlist_search_fts USING fts5(playlist_id UNINDEXED, document, tokenize='trigram')"
+                )
+        except Exception:
+            pass
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS playlist_search_fts")
+
+
+def build_documents(apps, schema_editor):
+    Playlist = apps.get_model('main', 'Playlist')
+    PlaylistBook = apps.get_model('main', 'PlaylistBook')
+    PlaylistSearchDocument = apps.get_model('main', 'PlaylistSearchDocument')
+    db_alias = schema_editor.connection.alias
+
+    book_values = {}
+    playlist_books = PlaylistBook.objects.using(db_alias) \
+        .filter(deleted_at__isnull=True) \
+        .select_related('book') \
+        .order_by('playlist', 'created_at')
+    for playlist_book in playlist_books:
+        book = playlist_book.book
+        book_values.setdefault(playlist_book.playlist_id, []).extend([book.title, book.author, book.publisher])
+
+    documents = []
+    for playlist in Playlist.objects.using(db_alias).all():
+        values = [playlist.title, playlist.description] + book_values.get(playlist.pk, [])
+        document = '\n'.join(normalize(value) for value in values if value)
+        documents.append(PlaylistSearchDocument(playlist_id=playlist.pk, document=document))
+    PlaylistSearchDocument.objects.using(db_alias).bulk_create(documents, batch_size=500)
+
+    if schema_editor.connection.vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE name = 'playlist_search_fts'")
+            if cursor.fetchone():
+                cursor.executemany(
+                    "INSERT INTO playlist_search_fts (playlist_id, document) VALUES (%s, %s)",
+                    [(document.playlist_id.hex, document.document) for document in documents],
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0034_auto_20261018_1630'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlaylistSearchDocument',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='date created')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='date updated')),
+                ('deleted_at', models.DateTimeField(blank=True, null=True, verbose_name='date deleted')),
+                ('document', bookplaylist.models.fields.NullTextField(blank=True, null=True, verbose_name='document')),
+                ('playlist', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='main.Playlist', verbose_name='playlist')),
+            ],
+            options={
+                'verbose_name': 'search document of playlist',
+                'verbose_name_plural': 'search documents of playlists',
+                'db_table': 'playlist_search_documents',
+                'abstract': False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='playlistsearchdocument',
+            index=models.Index(fields=['created_at'], name='created_at'),
+        ),
+        migrations.AddIndex(
+            model_name='playlistsearchdocument',
+            index=models.Index(fields=['updated_at'], name='updated_at'),
+        ),
+        migrations.RunPython(
+            create_search_index,
+            drop_search_index,
+        ),
+        migrations.RunPython(
+            build_documents,
+            migrations.RunPython.noop,
+        ),
+    ]
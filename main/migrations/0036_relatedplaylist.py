@@ -0,0 +1,34 @@
+# Generated by Django 2.2.6 on 2026-10-18 11:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0035_playlistsearchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedPlaylist',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='rank')),
+                ('score', models.FloatField(verbose_name='score')),
+                ('playlist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_playlist_set', related_query_name='related_playlist', to='main.Playlist', verbose_name='playlist')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_by_set', related_query_name='related_by', to='main.Playlist', verbose_name='related playlist')),
+            ],
+            options={
+                'verbose_name': 'related playlist',
+                'verbose_name_plural': 'related playlists',
+                'db_table': 'related_playlists',
+                'ordering': ['playlist', 'rank'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='relatedplaylist',
+            constraint=models.UniqueConstraint(fields=('playlist', 'rank'), name='playlist_id_rank_uniq'),
+        ),
+    ]
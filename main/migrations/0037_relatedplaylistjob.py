@@ -0,0 +1,33 @@
+# Generated by Django 2.2.6 on 2026-10-18 17:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0036_relatedplaylist'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedPlaylistJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_requested', models.DateTimeField(default=django.utils.timezone.now, verbose_name='date requested')),
+                ('playlist', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='related_playlist_job', to='main.Playlist', verbose_name='playlist')),
+            ],
+            options={
+                'verbose_name': 'related playlist job',
+                'verbose_name_plural': 'related playlist jobs',
+                'db_table': 'related_playlist_jobs',
+                'ordering': ['date_requested'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='relatedplaylistjob',
+            index=models.Index(fields=['date_requested'], name='date_requested'),
+        ),
+    ]
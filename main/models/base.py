@@ -1,22 +1,37 @@
+import hashlib
 import imgkit
 import os
 import re
-from functools import partial
+import requests
+from functools import (
+    lru_cache, partial,
+)
 
 from django.conf import settings
 from django.core.files.base import ContentFile
-from django.db import models
+from django.core.files.storage import default_storage
+from django.db import (
+    models, transaction,
+)
+from django.db.models import F
 from django.template.loader import get_template
+from django.templatetags.static import static
 from django.urls import reverse_lazy
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from bookplaylist import metrics
 from bookplaylist.models import (
     BaseModel, Manager, NullCharField, NullSlugField, NullTextField, NullURLField, get_file_path, remove_emoji,
 )
+from .. import (
+    covers, related,
+)
+from ..search import update_documents_on_commit
 from .manager import (
     AllBookDataManager, AllBookManager, AllLikeManager, AllPlaylistBookManager, AllPlaylistManager, AllTemplateManager,
     BookDataManager, BookManager, LikeManager, PlaylistBookManager, PlaylistManager, PlaylistWithUnpublishedManager,
-    ProviderManager, RecommendationManager, TemplateManager,
+    OgImageJobManager, ProviderManager, RecommendationManager, RelatedPlaylistJobManager, TemplateManager,
 )
 
 # Create your models here.
@@ -131,12 +146,28 @@ class Provider(BaseModel):
     def __str__(self):
         return '%s' % self.name
 
+    def save(self, *args, **kwargs):
+        old_priority = None
+        if not self._state.adding:
+            old_priority = Provider.all_objects.filter(pk=self.pk).values_list('priority', flat=True).first()
+        super().save(*args, **kwargs)
+        if old_priority is not None and old_priority != self.priority:
+            # The data of the provider of the highest priority wins on each book.
+            Book.all_objects.filter(book_data__provider=self).distinct().refresh_book_data()
+
 
-BOOK_DATA_FIELDS = ('provider', 'title', 'author', 'publisher', 'cover', 'large_cover', 'affiliate_url')
+BOOK_DATA_FIELDS = ('title', 'author', 'publisher', 'cover', 'affiliate_url')
+SEARCH_FIELDS = ('title', 'author', 'publisher')
 
 
 class Book(BaseModel):
     isbn = NullCharField(_('ISBN'), max_length=13, unique=True)
+    title = NullCharField(_('title'), max_length=255, blank=True, null=True)
+    author = NullCharField(_('author'), max_length=255, blank=True, null=True)
+    publisher = NullCharField(_('publisher'), max_length=255, blank=True, null=True)
+    cover = NullURLField(_('cover'), blank=True, null=True)
+    affiliate_url = NullURLField(_('Affiliate URL'), blank=True, null=True)
+    cached_cover = NullURLField(_('cached cover'), blank=True, null=True, editable=False)
     objects = BookManager()
     all_objects = AllBookManager()
 
@@ -144,32 +175,55 @@ class Book(BaseModel):
     def _default_data(self):
         return self.book_data_set.first()
 
+    @property
+    def large_cover(self):
+        return re.sub(r'\?_ex=\d+x\d+', '', self.cover) if self.cover else self.cover
+
     class Meta(BaseModel.Meta):
         db_table = 'books'
         ordering = ['isbn']
         verbose_name = _('book')
         verbose_name_plural = _('books')
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        for field in BOOK_DATA_FIELDS:
-            self._set_property_from_field_of_book_data(field)
-
     def __str__(self):
-        return '%s' % (self.book_data_set.first() or self.isbn)
+        return '%s' % (self.title or self.isbn)
 
-    def _set_property_from_field_of_book_data(self, field):
-        prop = property(lambda self: self._get_field_of_book_data(field))
-        setattr(self.__class__, field, prop)
-
-    def _get_field_of_book_data(self, field):
-        book_data = self.book_data_set.all()
+    def refresh_book_data(self, commit=True):
+        book_data = sorted(self.book_data_set.all(), key=lambda x: x.provider.priority)
+        old_values = {field: getattr(self, field) for field in SEARCH_FIELDS}
+        for field in BOOK_DATA_FIELDS:
+            setattr(self, field, self._get_field_of_book_data(book_data, field))
+        if commit:
+            values = {field: getattr(self, field) for field in BOOK_DATA_FIELDS}
+            self.__class__.all_objects.filter(pk=self.pk).update(updated_at=timezone.now(), **values)
+            if any(getattr(self, field) != value for field, value in old_values.items()):
+                update_documents_on_commit(self.playlist_book_set.values_list('playlist', flat=True))
+
+    def _get_field_of_book_data(self, book_data, field):
         for book_datum in book_data:
             value = getattr(book_datum, field)
             if value:
                 return value
-        return getattr(book_data.first(), field) if book_data.first() else None
+        return None
+
+    def has_cached_cover(self):
+        return bool(self.cover) and self.cached_cover == self.large_cover
 
+    def get_cover_url(self, variant='list', extension='jpg'):
+        if not self.has_cached_cover():
+            return self.cover
+        return default_storage.url(covers.get_cover_path(self.isbn, self.cached_cover, variant, extension))
+
+    def cache_cover(self, force=False):
+        if not self.cover or (self.has_cached_cover() and not force):
+            return False
+        source = self.large_cover
+        covers.save_cover_variants(self.isbn, source)
+        if self.cached_cover and self.cached_cover != source:
+            covers.delete_cover_variants(self.isbn, self.cached_cover)
+        self.cached_cover = source
+        self.__class__.all_objects.filter(pk=self.pk).update(cached_cover=source)
+        return True
 
 
 class BookData(BaseModel):
@@ -218,6 +272,14 @@ class BookData(BaseModel):
     def __str__(self):
         return '%s' % self.title
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        Book.all_objects.filter(isbn=self.book_id).refresh_book_data()
+
+    def hard_delete(self):
+        super().hard_delete()
+        Book.all_objects.filter(isbn=self.book_id).refresh_book_data()
+
 
 class Playlist(BaseModel):
     user = models.ForeignKey('accounts.User', on_delete=models.CASCADE, verbose_name=_('user'))
@@ -230,12 +292,18 @@ class Playlist(BaseModel):
         null=True,
         verbose_name=_('Open Graph image')
     )
+    og_image_fingerprint = NullCharField(_('fingerprint of Open Graph image'), max_length=64, blank=True, null=True, editable=False)
     sequence = models.PositiveSmallIntegerField(_('sequence'), blank=True, null=True)
     is_published = models.BooleanField(_('published'), default=True)
+    like_count = models.PositiveIntegerField(_('like count'), default=0, editable=False)
+    book_count = models.PositiveIntegerField(_('book count'), default=0, editable=False)
     objects = PlaylistManager()
     all_objects_without_deleted = PlaylistWithUnpublishedManager()
     all_objects = AllPlaylistManager()
 
+    OG_IMAGE_FIELDS = ('og_image', 'og_image_fingerprint', 'updated_at')
+    COUNTER_FIELDS = ('like_count', 'book_count')
+
     class Meta(BaseModel.Meta):
         db_table = 'playlists'
         ordering = ['-created_at']
@@ -246,6 +314,8 @@ class Playlist(BaseModel):
             models.Index(fields=['sequence'], name='sequence'),
         ] + BaseModel._meta.indexes + [
             models.Index(fields=['user', 'created_at'], name='idx01'),
+            models.Index(fields=['like_count', 'created_at'], name='idx02'),
+            models.Index(fields=['book_count', 'created_at'], name='idx03'),
         ]
 
     def __str__(self):
@@ -254,20 +324,95 @@ class Playlist(BaseModel):
     def get_absolute_url(self):
         return reverse_lazy('main:playlist_detail', args=[str(self.pk)])
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None and not self._state.adding and not args and not kwargs.get('force_insert'):
+            # The counters are changed only by F() updates and refresh_counts. A full save
+            # of an instance loaded before a like or a book was added must not write them back.
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+        if update_fields is None or {'title', 'description'} & set(update_fields):
+            update_documents_on_commit([self.pk])
+        if update_fields is None or 'is_published' in update_fields:
+            related.update_on_commit([self.pk])
+
     def hard_delete(self):
         self.og_image.delete(save=False)
         super().hard_delete()
 
-    def save_og_image(self, save=True):
-        template = self.theme.template
-        template_dir = template.directory
-        template_book_numbers = template.book_numbers.values_list('number', flat=True)
+    def get_card_version(self):
+        # Changes whenever anything shown on the card of the playlist changes.
+        values = [
+            self.updated_at.isoformat(),
+            str(self.like_count),
+            self.user.updated_at.isoformat(),
+        ] + [
+            '{}\t{}\t{}'.format(playlist_book.book_id, playlist_book.book.updated_at.isoformat(), playlist_book.book.cached_cover)
+            for playlist_book in self.playlist_book_set.all()
+        ]
+        return hashlib.md5('\n'.join(values).encode()).hexdigest()
+
+    def get_og_image_url(self):
+        return self.og_image.url if self.og_image else static(settings.OG_IMAGE_PLACEHOLDER)
+
+    def enqueue_og_image(self):
+        if settings.OG_IMAGE_ASYNC:
+            OgImageJob.objects.enqueue(self)
+        else:
+            self.save_og_image()
+
+    def cache_covers(self):
+        for playlist_book in self.playlist_book_set.all():
+            try:
+                playlist_book.book.cache_cover()
+            except (requests.RequestException, OSError):
+                pass
+
+    def is_og_image_up_to_date(self):
+        return bool(self.og_image) and self.og_image_fingerprint == self.get_og_image_fingerprint()
+
+    def get_og_image_fingerprint(self):
+        template_dir, template_path = self._get_og_image_template_path()
+        playlist_books = self.playlist_book_set.all()
+        values = [
+            remove_emoji(self.title.strip()),
+            str(self.user),
+            template_path,
+            get_template_directory_digest(template_path),
+            str(len(playlist_books)),
+        ] + [
+            # Covers not cached yet are drawn as placeholders, so caching them changes the image.
+            '{}\t{}\t{}'.format(
+                playlist_book.book.title or '',
+                playlist_book.book.large_cover or '',
+                playlist_book.book.has_cached_cover(),
+            )
+            for playlist_book in playlist_books
+        ]
+        return hashlib.sha256('\n'.join(values).encode()).hexdigest()
 
-        book_count = self.playlist_book_set.count()
-        book_numbers = [n for n in template_book_numbers if n <= book_count]
-        book_number = max(book_numbers) if book_numbers else min(template_book_numbers)
-        template_file = '{}.html'.format(book_number)
-        template_path = os.path.join(template_dir, template_file)
+    def save_og_image(self, save=True):
+        fingerprint = self.get_og_image_fingerprint()
+        img = None
+        with metrics.timer('og'):
+            if settings.OG_IMAGE_RENDERER == 'pillow':
+                from main.renderers import RendererUnavailable, render_og_image
+                try:
+                    img = render_og_image(self, self.theme.template.slug, self._get_og_image_book_number())
+                except RendererUnavailable:
+                    pass
+            if img is None:
+                img = self._render_og_image_html()
+        self.og_image_fingerprint = fingerprint
+        self.og_image.save('{}.jpg'.format(str(self.pk)), ContentFile(img), save=False)
+        if save:
+            self.save(update_fields=self.OG_IMAGE_FIELDS)
+
+    def _render_og_image_html(self):
+        template_dir, template_path = self._get_og_image_template_path()
         template = get_template(template_path)
 
         raw_title = self.title
@@ -285,10 +430,66 @@ class Playlist(BaseModel):
 
         img = imgkit.from_string(template.render(context), False, options=options)
         self.title = raw_title
-        self.og_image.save('{}.jpg'.format(str(self.pk)), ContentFile(img), save=save)
+        return img
+
+    def _get_og_image_book_number(self):
+        template_book_numbers = [n.number for n in self.theme.template.book_numbers.all()]
+        book_count = len(self.playlist_book_set.all())
+        book_numbers = [n for n in template_book_numbers if n <= book_count]
+        return max(book_numbers) if book_numbers else min(template_book_numbers)
+
+    def _get_og_image_template_path(self):
+        template_dir = self.theme.template.directory
+        template_file = '{}.html'.format(self._get_og_image_book_number())
+        return template_dir, os.path.join(template_dir, template_file)
+
+
+@lru_cache(maxsize=None)
+def get_template_directory_digest(template_path):
+    # Digest of all files of the template set, including base.html and layouts.
+    directory = os.path.dirname(get_template(template_path).origin.name)
+    digest = hashlib.sha256()
+    for root, dirs, files in sorted(os.walk(directory)):
+        for filename in sorted(files):
+            with open(os.path.join(root, filename), 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+class PlaylistCounterMixin:
+    # Keeps Playlist.<counter_field> equal to the number of the rows not deleted.
+    counter_field = None
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding and not self.deleted_at:
+                self._update_playlist_counter(1)
+
+    def delete(self):
+        if not self.deleted_at:
+            with transaction.atomic():
+                super().delete()
+                self._update_playlist_counter(-1)
 
+    def restore(self):
+        if self.deleted_at:
+            with transaction.atomic():
+                super().restore()
+                self._update_playlist_counter(1)
 
-class PlaylistBook(BaseModel):
+    def hard_delete(self):
+        with transaction.atomic():
+            super().hard_delete()
+            if not self.deleted_at:
+                self._update_playlist_counter(-1)
+
+    def _update_playlist_counter(self, delta):
+        Playlist.all_objects.filter(pk=self.playlist_id).update(**{self.counter_field: F(self.counter_field) + delta})
+
+
+class PlaylistBook(PlaylistCounterMixin, BaseModel):
     playlist = models.ForeignKey(
         'Playlist',
         on_delete=models.CASCADE,
@@ -308,6 +509,7 @@ class PlaylistBook(BaseModel):
     description = NullTextField(_('description'), blank=True, null=True)
     objects = PlaylistBookManager()
     all_objects = AllPlaylistBookManager()
+    counter_field = 'book_count'
 
 
     class Meta(BaseModel.Meta):
@@ -322,6 +524,16 @@ class PlaylistBook(BaseModel):
     def __str__(self):
         return '%s' % self.book
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_documents_on_commit([self.playlist_id])
+        related.update_on_commit([self.playlist_id])
+
+    def hard_delete(self):
+        super().hard_delete()
+        update_documents_on_commit([self.playlist_id])
+        related.update_on_commit([self.playlist_id])
+
 
 class Recommendation(BaseModel):
     playlist = models.OneToOneField(
@@ -356,7 +568,7 @@ class Recommendation(BaseModel):
         self.hard_delete()
 
 
-class Like(BaseModel):
+class Like(PlaylistCounterMixin, BaseModel):
     playlist = models.ForeignKey(
         'Playlist',
         on_delete=models.CASCADE,
@@ -375,6 +587,7 @@ class Like(BaseModel):
     date_notified = models.DateTimeField(_('date notified'), blank=True, null=True)
     objects = LikeManager()
     all_objects = AllLikeManager()
+    counter_field = 'like_count'
 
     class Meta(BaseModel.Meta):
         db_table = 'likes'
@@ -392,3 +605,136 @@ class Like(BaseModel):
 
     def __str__(self):
         return '%s' % self.user
+
+
+class OgImageJob(BaseModel):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, _('pending')),
+        (STATUS_RUNNING, _('running')),
+        (STATUS_DONE, _('done')),
+        (STATUS_FAILED, _('failed')),
+    )
+
+    playlist = models.OneToOneField(
+        'Playlist',
+        on_delete=models.CASCADE,
+        related_name='og_image_job',
+        verbose_name=_('playlist')
+    )
+    status = models.CharField(_('status'), max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(_('attempts'), default=0)
+    error = NullTextField(_('error'), blank=True, null=True)
+    date_requested = models.DateTimeField(_('date requested'), default=timezone.now)
+    date_started = models.DateTimeField(_('date started'), blank=True, null=True)
+    date_finished = models.DateTimeField(_('date finished'), blank=True, null=True)
+    objects = OgImageJobManager()
+
+    class Meta(BaseModel.Meta):
+        db_table = 'og_image_jobs'
+        ordering = ['date_requested']
+        verbose_name = _('Open Graph image job')
+        verbose_name_plural = _('Open Graph image jobs')
+        indexes = BaseModel._meta.indexes + [
+            models.Index(fields=['status', 'date_requested'], name='idx01'),
+        ]
+
+    def __str__(self):
+        return '%s' % self.playlist
+
+    def run(self):
+        playlist = self.playlist
+        try:
+            if not playlist.is_deleted:
+                playlist.cache_covers()
+                if not playlist.is_og_image_up_to_date():
+                    playlist.save_og_image()
+        except Exception as e:
+            failed = self.attempts >= settings.OG_IMAGE_JOB_MAX_ATTEMPTS
+            self._finish(self.STATUS_FAILED if failed else self.STATUS_PENDING, error=repr(e))
+            raise
+        self._finish(self.STATUS_DONE)
+
+    def _finish(self, status, error=None):
+        # If the playlist was requested again while rendering, leave the new request pending.
+        now = timezone.now()
+        self.__class__.objects \
+            .filter(pk=self.pk, status=self.STATUS_RUNNING, date_requested=self.date_requested) \
+            .update(status=status, error=error, date_finished=now, updated_at=now)
+
+
+class PlaylistSearchDocument(BaseModel):
+    playlist = models.OneToOneField(
+        'Playlist',
+        on_delete=models.CASCADE,
+        related_name='search_document',
+        verbose_name=_('playlist')
+    )
+    document = NullTextField(_('document'), blank=True, null=True)
+
+    class Meta(BaseModel.Meta):
+        db_table = 'playlist_search_documents'
+        verbose_name = _('search document of playlist')
+        verbose_name_plural = _('search documents of playlists')
+
+    def __str__(self):
+        return '%s' % self.playlist
+
+
+class RelatedPlaylist(models.Model):
+    # Top related playlists of each playlist, rebuilt by main.related
+    playlist = models.ForeignKey(
+        'Playlist',
+        on_delete=models.CASCADE,
+        related_name='related_playlist_set',
+        related_query_name='related_playlist',
+        verbose_name=_('playlist')
+    )
+    related = models.ForeignKey(
+        'Playlist',
+        on_delete=models.CASCADE,
+        related_name='related_by_set',
+        related_query_name='related_by',
+        verbose_name=_('related playlist')
+    )
+    rank = models.PositiveSmallIntegerField(_('rank'))
+    score = models.FloatField(_('score'))
+
+    class Meta:
+        db_table = 'related_playlists'
+        ordering = ['playlist', 'rank']
+        verbose_name = _('related playlist')
+        verbose_name_plural = _('related playlists')
+        constraints = [
+            models.UniqueConstraint(fields=['playlist', 'rank'], name='playlist_id_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return '%s' % self.related
+
+
+class RelatedPlaylistJob(models.Model):
+    # Playlists whose related playlists are recomputed by `manage.py rebuildrelatedplaylists --queued`
+    playlist = models.OneToOneField(
+        'Playlist',
+        on_delete=models.CASCADE,
+        related_name='related_playlist_job',
+        verbose_name=_('playlist')
+    )
+    date_requested = models.DateTimeField(_('date requested'), default=timezone.now)
+    objects = RelatedPlaylistJobManager()
+
+    class Meta:
+        db_table = 'related_playlist_jobs'
+        ordering = ['date_requested']
+        verbose_name = _('related playlist job')
+        verbose_name_plural = _('related playlist jobs')
+        indexes = [
+            models.Index(fields=['date_requested'], name='date_requested'),
+        ]
+
+    def __str__(self):
+        return '%s' % self.playlist
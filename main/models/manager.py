@@ -1,14 +1,22 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
+from django.db.models import (
+    F, Q,
+)
+from django.utils import timezone
 
 from bookplaylist.models import (
     AllObjectsManager, Manager,
 )
 from .query import (
-    AllPlaylistQuerySet, PlaylistQuerySet,
+    AllBookQuerySet, AllLikeQuerySet, AllPlaylistBookQuerySet, AllPlaylistQuerySet,
+    BookQuerySet, LikeQuerySet, PlaylistBookQuerySet, PlaylistQuerySet,
 )
 
 
-__all__ = ['ProviderManager', 'BookManager', 'AllBookManager', 'BookDataManager', 'PlaylistManager', 'PlaylistWithUnpublishedManager', 'AllPlaylistManager', 'PlaylistBookManager', 'RecommendationManager', 'LikeManager', 'AllLikeManager']
+__all__ = ['ProviderManager', 'BookManager', 'AllBookManager', 'BookDataManager', 'PlaylistManager', 'PlaylistWithUnpublishedManager', 'AllPlaylistManager', 'PlaylistBookManager', 'RecommendationManager', 'LikeManager', 'AllLikeManager', 'OgImageJobManager', 'RelatedPlaylistJobManager']
 
 
 ############
@@ -50,11 +58,11 @@ class BookManagerMixin:
         return super().get_queryset().prefetch_related('book_data_set')
 
 
-class BookManager(BookManagerMixin, Manager):
+class BookManager(BookManagerMixin, Manager.from_queryset(BookQuerySet)):
     pass
 
 
-class AllBookManager(BookManagerMixin, AllObjectsManager):
+class AllBookManager(BookManagerMixin, AllObjectsManager.from_queryset(AllBookQuerySet)):
     pass
 
 
@@ -83,7 +91,7 @@ class AllBookDataManager(BookDataManagerMixin, AllObjectsManager):
 class PlaylistManagerMixin:
 
     def get_queryset(self):
-        return super().get_queryset().select_related('user').prefetch_related('playlist_book_set', 'likes')
+        return super().get_queryset().select_related('user').prefetch_related('playlist_book_set')
 
 
 class PlaylistManager(PlaylistManagerMixin, Manager.from_queryset(PlaylistQuerySet)):
@@ -109,14 +117,14 @@ class AllPlaylistManager(PlaylistManagerMixin, AllObjectsManager.from_queryset(A
 class PlaylistBookManagerMixin:
 
     def get_queryset(self):
-        return super().get_queryset().select_related('book').prefetch_related('book__book_data_set')
+        return super().get_queryset().select_related('book')
 
 
-class PlaylistBookManager(PlaylistBookManagerMixin, Manager):
+class PlaylistBookManager(PlaylistBookManagerMixin, Manager.from_queryset(PlaylistBookQuerySet)):
     pass
 
 
-class AllPlaylistBookManager(PlaylistBookManagerMixin, AllObjectsManager):
+class AllPlaylistBookManager(PlaylistBookManagerMixin, AllObjectsManager.from_queryset(AllPlaylistBookQuerySet)):
     pass
 
 
@@ -140,9 +148,69 @@ class LikeManagerMixin:
         return super().get_queryset().select_related('playlist', 'user')
 
 
-class LikeManager(LikeManagerMixin, Manager):
+class LikeManager(LikeManagerMixin, Manager.from_queryset(LikeQuerySet)):
     pass
 
 
-class AllLikeManager(LikeManagerMixin, AllObjectsManager):
+class AllLikeManager(LikeManagerMixin, AllObjectsManager.from_queryset(AllLikeQuerySet)):
     pass
+
+
+##############
+# OgImageJob #
+##############
+
+class OgImageJobManager(Manager):
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('playlist')
+
+    def enqueue(self, playlist):
+        now = timezone.now()
+        job, created = self.get_or_create(playlist=playlist, defaults={'date_requested': now})
+        if not created:
+            # Only one job per playlist: request it again instead of adding another.
+            self.filter(pk=job.pk).update(
+                status=self.model.STATUS_PENDING,
+                attempts=0,
+                error=None,
+                date_requested=now,
+                updated_at=now,
+            )
+        return job
+
+    def claim(self):
+        now = timezone.now()
+        condition = Q(status=self.model.STATUS_PENDING) | Q(
+            status=self.model.STATUS_RUNNING,
+            date_started__lt=now - timedelta(seconds=settings.OG_IMAGE_JOB_TIMEOUT),
+        )
+        for job in self.filter(condition).order_by('date_requested')[:10]:
+            claimed = self.filter(condition, pk=job.pk, date_requested=job.date_requested).update(
+                status=self.model.STATUS_RUNNING,
+                attempts=F('attempts') + 1,
+                date_started=now,
+                updated_at=now,
+            )
+            if claimed:
+                job.refresh_from_db()
+                return job
+        return None
+
+
+class RelatedPlaylistJobManager(models.Manager):
+
+    def enqueue(self, playlist_ids):
+        now = timezone.now()
+        playlist_ids = set(playlist_ids)
+        # Only one row per playlist: request it again instead of adding another.
+        self.filter(playlist__in=playlist_ids).update(date_requested=now)
+        self.bulk_create([
+            self.model(playlist_id=playlist_id, date_requested=now) for playlist_id in playlist_ids
+        ], ignore_conflicts=True)
+
+    def finish(self, jobs):
+        condition = Q()
+        for playlist_id, date_requested in jobs:
+            condition |= Q(playlist=playlist_id, date_requested=date_requested)
+        self.filter(condition).delete()
@@ -1,9 +1,41 @@
+from datetime import timedelta
+
+from django.db import (
+    models, transaction,
+)
+from django.db.models import (
+    Count, F, OuterRef, Prefetch, Q, Subquery,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
 from bookplaylist.models import (
     AllObjectsQuerySet, QuerySet,
 )
+from .. import related
+from ..search import update_documents_on_commit
+
+
+__all__ = [
+    'AllBookQuerySet', 'AllLikeQuerySet', 'AllPlaylistBookQuerySet', 'AllPlaylistQuerySet',
+    'BookQuerySet', 'LikeQuerySet', 'PlaylistBookQuerySet', 'PlaylistQuerySet',
+]
 
 
-__all__ = ['AllPlaylistQuerySet', 'PlaylistQuerySet']
+# Book
+class BookQuerySetMixin:
+
+    def refresh_book_data(self):
+        for book in self.prefetch_related('book_data_set'):
+            book.refresh_book_data()
+
+
+class BookQuerySet(BookQuerySetMixin, QuerySet):
+    pass
+
+
+class AllBookQuerySet(BookQuerySetMixin, AllObjectsQuerySet):
+    pass
 
 
 # Playlist
@@ -14,6 +46,45 @@ class PlaylistQuerySetMixin:
             playlist.og_image.delete(save=False)
         return super().hard_delete()
 
+    def annotate_counts(self):
+        return self.annotate(
+            actual_like_count=self._get_count_subquery('like'),
+            actual_book_count=self._get_count_subquery('playlist_book'),
+        )
+
+    def refresh_counts(self):
+        return self.update(
+            like_count=self._get_count_subquery('like'),
+            book_count=self._get_count_subquery('playlist_book'),
+        )
+
+    def with_count_drift(self):
+        return self.annotate_counts().filter(
+            ~Q(like_count=F('actual_like_count')) | ~Q(book_count=F('actual_book_count'))
+        )
+
+    def for_cards(self):
+        # Everything the playlist widgets use, in 2 queries however many playlists there are.
+        # The lookup is reset first, because the one of the manager has no queryset.
+        playlist_book_model = self.model._meta.get_field('playlist_book').related_model
+        return self \
+            .select_related('user') \
+            .prefetch_related(None) \
+            .prefetch_related(Prefetch(
+                'playlist_book_set',
+                queryset=playlist_book_model.objects.select_related('book').order_by('created_at'),
+            ))
+
+    def _get_count_subquery(self, related_query_name):
+        related_model = self.model._meta.get_field(related_query_name).related_model
+        queryset = related_model.objects \
+            .filter(playlist=OuterRef('pk')) \
+            .order_by() \
+            .values('playlist') \
+            .annotate(count=Count('pk')) \
+            .values('count')
+        return Coalesce(Subquery(queryset, output_field=models.PositiveIntegerField()), 0)
+
 
 class PlaylistQuerySet(PlaylistQuerySetMixin, QuerySet):
     pass
@@ -21,3 +92,94 @@ class PlaylistQuerySet(PlaylistQuerySetMixin, QuerySet):
 
 class AllPlaylistQuerySet(PlaylistQuerySetMixin, AllObjectsQuerySet):
     pass
+
+
+# Like, PlaylistBook
+class PlaylistCounterQuerySetMixin:
+    # Bulk updates bypass the models, so recount the affected playlists afterwards.
+
+    def delete(self):
+        return self._refresh_counts_after(super().delete)
+
+    def hard_delete(self):
+        return self._refresh_counts_after(super().hard_delete)
+
+    def _refresh_counts_after(self, method, *args, **kwargs):
+        with transaction.atomic():
+            playlist_ids = set(self.values_list('playlist', flat=True))
+            result = method(*args, **kwargs)
+            self._refresh_playlists(playlist_ids)
+        return result
+
+    def _refresh_playlists(self, playlist_ids):
+        playlist_model = self.model._meta.get_field('playlist').related_model
+        playlist_model.all_objects.filter(pk__in=playlist_ids).refresh_counts()
+
+
+class AllPlaylistCounterQuerySetMixin(PlaylistCounterQuerySetMixin):
+
+    def restore(self):
+        return self._refresh_counts_after(super().restore)
+
+
+class LikeQuerySet(PlaylistCounterQuerySetMixin, QuerySet):
+    pass
+
+
+class AllLikeQuerySet(AllPlaylistCounterQuerySetMixin, AllObjectsQuerySet):
+    pass
+
+
+class PlaylistBookQuerySetMixin:
+
+    def sync(self, playlist, items):
+        # Makes the books of the playlist the (isbn, description) items, with a fixed number of statements.
+        # Books added get created_at in the order of the items, which is the order in the playlist.
+        seen = set()
+        items = [(isbn, description or '') for isbn, description in items if not (isbn in seen or seen.add(isbn))]
+        descriptions = dict(items)
+        now = timezone.now()
+        with transaction.atomic():
+            existing = {playlist_book.book_id: playlist_book for playlist_book in self.filter(playlist=playlist)}
+            to_delete = [playlist_book.pk for isbn, playlist_book in existing.items() if isbn not in descriptions]
+            to_update = []
+            for isbn, playlist_book in existing.items():
+                if isbn in descriptions and descriptions[isbn] != (playlist_book.description or ''):
+                    playlist_book.description = descriptions[isbn]
+                    playlist_book.updated_at = now
+                    to_update.append(playlist_book)
+            to_create = [
+                self.model(playlist=playlist, book_id=isbn, description=description)
+                for isbn, description in items if isbn not in existing
+            ]
+
+            if to_delete:
+                self.model.all_objects.filter(pk__in=to_delete).update(deleted_at=now, updated_at=now)
+            if to_update:
+                self.bulk_update(to_update, ['description', 'updated_at'])
+            if to_create:
+                self.bulk_create(to_create)
+                # bulk_create gives auto_now_add values of its own
+                for i, playlist_book in enumerate(to_create):
+                    playlist_book.created_at = playlist_book.updated_at = now + timedelta(microseconds=i)
+                self.bulk_update(to_create, ['created_at', 'updated_at'])
+            if to_delete or to_update or to_create:
+                self._refresh_playlists([playlist.pk])
+        return to_create, to_update, to_delete
+
+    def _refresh_playlists(self, playlist_ids):
+        from ..homepage import invalidate
+
+        super()._refresh_playlists(playlist_ids)
+        update_documents_on_commit(playlist_ids)
+        related.update_on_commit(playlist_ids)
+        # No signals are sent for bulk changes.
+        invalidate('popular', 'recent')
+
+
+class PlaylistBookQuerySet(PlaylistBookQuerySetMixin, PlaylistCounterQuerySetMixin, QuerySet):
+    pass
+
+
+class AllPlaylistBookQuerySet(PlaylistBookQuerySetMixin, AllPlaylistCounterQuerySetMixin, AllObjectsQuerySet):
+    pass
@@ -0,0 +1,60 @@
+import threading
+import time
+
+from django.conf import settings
+
+from .models import Provider
+
+
+class ProviderRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (providers, loaded_at), replaced as a whole so that the fast path reads both at once
+        self._state = None
+
+    def get(self, slug):
+        try:
+            return self._get_providers()['slug'][slug]
+        except KeyError:
+            raise Provider.DoesNotExist('Provider "{}" does not exist.'.format(slug))
+
+    def get_by_pk(self, pk):
+        try:
+            return self._get_providers()['pk'][str(pk)]
+        except KeyError:
+            raise Provider.DoesNotExist('Provider with pk "{}" does not exist.'.format(pk))
+
+    def get_default(self):
+        return self.get(settings.DEFAULT_PROVIDER)
+
+    def by_priority(self):
+        return list(self._get_providers()['priority'])
+
+    def clear(self):
+        with self._lock:
+            self._state = None
+
+    def _get_providers(self):
+        state = self._state
+        if self._is_fresh(state):
+            return state[0]
+        with self._lock:
+            # Other processes are not notified by signals, so reload periodically too.
+            state = self._state
+            if not self._is_fresh(state):
+                provider_list = sorted(Provider.objects.all(), key=lambda x: x.priority)
+                providers = {
+                    'slug': {p.slug: p for p in provider_list},
+                    'pk': {str(p.pk): p for p in provider_list},
+                    'priority': tuple(provider_list),
+                }
+                state = self._state = (providers, time.monotonic())
+        return state[0]
+
+    @staticmethod
+    def _is_fresh(state):
+        return state is not None and time.monotonic() - state[1] <= settings.PROVIDER_REGISTRY_TIMEOUT
+
+
+providers = ProviderRegistry()
@@ -0,0 +1,184 @@
+import math
+import threading
+from collections import defaultdict
+from functools import partial
+
+from django.conf import settings
+from django.db import (
+    DEFAULT_DB_ALIAS, transaction,
+)
+from django.utils import timezone
+
+
+# Related playlists share books. Each shared book weighs log(1 + N / df), where
+# df is the number of playlists with the book, so that a rare book counts more
+# than a bestseller, and the sum is divided by the geometric mean of the numbers
+# of books of the two playlists. The score is symmetric.
+
+def get_weight(df, total):
+    return math.log(1 + total / df)
+
+
+def get_scores(book_ids, book_count, postings, book_counts, total):
+    scores = defaultdict(float)
+    for book_id in book_ids:
+        playlist_ids = postings.get(book_id, ())
+        if not playlist_ids or len(playlist_ids) > settings.RELATED_PLAYLISTS_MAX_DF:
+            continue
+        weight = get_weight(len(playlist_ids), total)
+        for pk in playlist_ids:
+            scores[pk] += weight
+    return {
+        pk: score / math.sqrt(max(book_count, 1) * max(book_counts[pk], 1))
+        for pk, score in scores.items()
+    }
+
+
+def get_top(pk, scores):
+    results = sorted(
+        ((other, score) for other, score in scores.items() if other != pk),
+        key=lambda x: (x[1], str(x[0])),
+        reverse=True,
+    )
+    return results[:settings.RELATED_PLAYLISTS_COUNT]
+
+
+def get_playlist_books():
+    from .models import PlaylistBook
+
+    return PlaylistBook.objects.filter(
+        playlist__is_published=True,
+        playlist__deleted_at__isnull=True,
+        playlist__user__is_active=True,
+        playlist__user__deleted_at__isnull=True,
+    )
+
+
+def save_related(related):
+    from .models import RelatedPlaylist
+
+    with transaction.atomic():
+        RelatedPlaylist.objects.filter(playlist__in=list(related)).delete()
+        RelatedPlaylist.objects.bulk_create([
+            RelatedPlaylist(playlist_id=pk, related_id=other, score=score, rank=rank)
+            for pk, top in related.items() for rank, (other, score) in enumerate(top, 1)
+        ], batch_size=1000)
+
+
+def rebuild(batch_size=500):
+    from .models import Playlist, RelatedPlaylistJob
+
+    # The queued playlists are recomputed below as well.
+    started_at = timezone.now()
+    postings = defaultdict(set)
+    books = defaultdict(set)
+    for playlist_id, book_id in get_playlist_books().order_by().values_list('playlist', 'book'):
+        postings[book_id].add(playlist_id)
+        books[playlist_id].add(book_id)
+    book_counts = {pk: len(book_ids) for pk, book_ids in books.items()}
+    total = Playlist.objects.count()
+
+    pk_list = list(Playlist.all_objects.values_list('pk', flat=True))
+    for i in range(0, len(pk_list), batch_size):
+        related = {}
+        for pk in pk_list[i:i + batch_size]:
+            scores = get_scores(books.get(pk, ()), book_counts.get(pk, 0), postings, book_counts, total)
+            related[pk] = get_top(pk, scores)
+        save_related(related)
+        yield min(i + batch_size, len(pk_list)), len(pk_list)
+    RelatedPlaylistJob.objects.filter(date_requested__lte=started_at).delete()
+
+
+def update(playlist_ids):
+    # Recomputes the playlists, and those of their neighbors whose list may include them now
+    # or may not any more. The weights of the other books drift until the next rebuild.
+    from .models import Playlist, RelatedPlaylist
+
+    playlist_books = get_playlist_books().order_by()
+    total = Playlist.objects.count()
+    playlist_ids = set(playlist_ids)
+    stale = set(playlist_ids)
+    done = set()
+    while stale:
+        pk = stale.pop()
+        done.add(pk)
+        book_ids = set(playlist_books.filter(playlist=pk).values_list('book', flat=True))
+        postings = defaultdict(set)
+        book_counts = {}
+        for book_id, other, book_count in playlist_books \
+                .filter(book__in=book_ids) \
+                .values_list('book', 'playlist', 'playlist__book_count'):
+            postings[book_id].add(other)
+            book_counts[other] = book_count
+        scores = get_scores(book_ids, len(book_ids), postings, book_counts, total)
+        save_related({pk: get_top(pk, scores)})
+
+        if pk not in playlist_ids:
+            continue
+        stored = defaultdict(dict)
+        for other, related, score in RelatedPlaylist.objects \
+                .filter(playlist__in=[x for x in scores if x != pk]) \
+                .values_list('playlist', 'related', 'score'):
+            stored[other][related] = score
+        neighbors = set(RelatedPlaylist.objects.filter(related=pk).values_list('playlist', flat=True))
+        for other, score in scores.items():
+            rows = stored[other]
+            if len(rows) < settings.RELATED_PLAYLISTS_COUNT or score > min(rows.values()):
+                neighbors.add(other)
+        stale |= neighbors - done - {pk}
+
+
+_pending = threading.local()
+
+
+def get_pending(using):
+    # Playlists changed in the transactions of this thread, not queued yet
+    if not hasattr(_pending, 'playlist_ids'):
+        _pending.playlist_ids = defaultdict(set)
+    return _pending.playlist_ids[using]
+
+
+def flush_pending(using):
+    from .models import Playlist, RelatedPlaylistJob
+
+    pending = get_pending(using)
+    if not pending:
+        return
+    playlist_ids = set(pending)
+    pending.clear()
+    # Playlists created in a transaction rolled back since are gone.
+    playlist_ids = Playlist.all_objects.db_manager(using).filter(pk__in=playlist_ids).values_list('pk', flat=True)
+    RelatedPlaylistJob.objects.db_manager(using).enqueue(playlist_ids)
+
+
+def update_on_commit(playlist_ids, using=None):
+    # Every save of a book in a playlist registers a callback, but the first one run after
+    # the commit queues the playlists of all of them, and the others find nothing left.
+    # Playlists of a rolled back transaction are queued with the next one, if they still exist.
+    using = using or DEFAULT_DB_ALIAS
+    get_pending(using).update(playlist_ids)
+    transaction.on_commit(partial(flush_pending, using), using)
+
+
+def update_queued(batch_size=100):
+    # Run by `manage.py rebuildrelatedplaylists --queued`. Playlists requested again
+    # while they are recomputed stay in the queue for the next run.
+    from .models import RelatedPlaylistJob
+
+    jobs = list(RelatedPlaylistJob.objects.order_by('date_requested').values_list('playlist', 'date_requested')[:batch_size])
+    if not jobs:
+        return 0
+    update([playlist_id for playlist_id, date_requested in jobs])
+    RelatedPlaylistJob.objects.finish(jobs)
+    return len(jobs)
+
+
+def get_related_ids(playlist, limit):
+    from .models import RelatedPlaylist
+
+    return list(
+        RelatedPlaylist.objects
+            .filter(playlist=playlist)
+            .order_by('rank')
+            .values_list('related', flat=True)[:limit]
+    )
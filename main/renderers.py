@@ -0,0 +1,250 @@
+import io
+import os
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import translation
+from django.utils.translation import gettext
+
+from PIL import (
+    Image, ImageDraw, ImageFont,
+)
+
+from bookplaylist.models import remove_emoji
+from .covers import open_cover_variant
+
+
+class RendererUnavailable(Exception):
+    pass
+
+
+# Boxes are (left, top, width, height) in pixels of the 1200x630 image and
+# follow the CSS of the HTML templates in main/playlists/og_image/.
+LAYOUTS = {
+    'default': {
+        1: (
+            ('hero', (24, 24, 756, 582), {}),
+            ('panel', (786, 30, 384, 570), {}),
+            ('cover', (852, 127, 252, 376), {'index': 0}),
+        ),
+        2: (
+            ('hero', (24, 24, 888, 582), {}),
+            ('cover', (918, 30, 252, 376), {'index': 0}),
+            ('cover', (918, 418, 120, 182), {'index': 1}),
+            ('chevron', (1044, 412, 132, 194), {'size': 72}),
+        ),
+        3: (
+            ('hero', (24, 24, 756, 582), {}),
+            ('cover', (786, 30, 186, 279), {'index': 0}),
+            ('cover', (786, 321, 186, 279), {'index': 2}),
+            ('cover', (984, 30, 186, 279), {'index': 1}),
+            ('chevron', (978, 315, 198, 291), {'size': 96}),
+        ),
+        4: (
+            ('hero', (24, 24, 756, 582), {}),
+            ('cover', (786, 30, 186, 279), {'index': 0}),
+            ('cover', (786, 321, 186, 279), {'index': 2}),
+            ('cover', (984, 30, 186, 279), {'index': 1}),
+            ('cover', (984, 321, 186, 279), {'index': 3}),
+        ),
+        5: (
+            ('hero', (24, 24, 756, 582), {}),
+            ('cover', (786, 30, 120, 182), {'index': 1}),
+            ('cover', (786, 224, 120, 182), {'index': 2}),
+            ('cover', (786, 418, 120, 182), {'index': 3}),
+            ('cover', (918, 30, 252, 376), {'index': 0}),
+            ('cover', (918, 418, 120, 182), {'index': 4}),
+            ('chevron', (1044, 412, 132, 194), {'size': 72}),
+        ),
+        6: (
+            ('hero', (24, 24, 756, 582), {}),
+            ('cover', (786, 30, 120, 182), {'index': 1}),
+            ('cover', (786, 224, 120, 182), {'index': 2}),
+            ('cover', (786, 418, 120, 182), {'index': 3}),
+            ('cover', (918, 30, 252, 376), {'index': 0}),
+            ('cover', (918, 418, 120, 182), {'index': 4}),
+            ('cover', (1050, 418, 120, 182), {'index': 5}),
+        ),
+    },
+    'best_3_in_this_year': {
+        3: (
+            ('background', (0, 0, 1200, 630), {'path': 'main/img/best_3_in_this_year-bg-og-image.png'}),
+            ('cover', (72, 126, 210, 315), {'index': 2, 'border': False}),
+            ('cover', (264, 21, 231, 347), {'index': 1, 'border': False}),
+            ('cover', (456, 189, 252, 378), {'index': 0, 'border': False}),
+            ('list', (130, 454, 0, 0), {'size': 22, 'line_height': 46, 'max_length': 9}),
+            ('text', (1176, 212), {'text': 'user', 'size': 36, 'anchor': 'rs'}),
+            ('text', (1181, 244), {'text': 'best_3_title', 'size': 64, 'anchor': 'ra', 'line_height': 77}),
+            ('text', (1176, 456), {'text': 'best_3_sub_title', 'size': 22, 'anchor': 'rs'}),
+            ('button', (902, 496, 270, 71), {'text': 'more', 'size': 20, 'font': 'brand'}),
+        ),
+    },
+}
+
+TEXTS = {
+    'user': lambda playlist: gettext("%(user)s's'") % {'user': playlist.user},
+    'best_3_title': lambda playlist: gettext('Best 3 Books<br>In This Year').replace('<br>', '\n'),
+    'best_3_sub_title': lambda playlist: gettext("Let's create book playlist and share it"),
+    'more': lambda playlist: gettext('→ MORE'),
+}
+
+WHITE = (255, 255, 255)
+GRAY = (238, 238, 238)
+PURPLE = (156, 68, 166)
+ORANGE = (255, 72, 18)
+
+
+def get_layout(template_slug, book_number):
+    return LAYOUTS.get(template_slug, {}).get(book_number)
+
+
+def get_missing_fonts():
+    return [name for name in ('bold', 'brand') if not os.path.exists(settings.OG_IMAGE_FONTS.get(name) or '')]
+
+
+@lru_cache(maxsize=None)
+def get_font(name, size):
+    # Missing fonts are reported by the check main.E001 at startup, not hidden by the fallback.
+    path = settings.OG_IMAGE_FONTS.get(name)
+    if not path or not os.path.exists(path):
+        raise ImproperlyConfigured('Font "{}" of OG_IMAGE_FONTS is not found.'.format(name))
+    return ImageFont.truetype(path, size)
+
+
+def load_cover(book):
+    # Only the variants cached by Book.cache_cover(), which the job worker runs before
+    # rendering, so that rendering never downloads. Others are drawn as placeholders.
+    if not book.has_cached_cover():
+        return None
+    return open_cover_variant(book.isbn, book.cached_cover, 'og')
+
+
+class PillowRenderer:
+
+    def __init__(self, playlist, template_slug, book_number):
+        self.playlist = playlist
+        self.layout = get_layout(template_slug, book_number)
+        if self.layout is None:
+            raise RendererUnavailable('No layout for {} with {} books.'.format(template_slug, book_number))
+        self.books = [playlist_book.book for playlist_book in playlist.playlist_book_set.all()]
+
+    def render(self):
+        with translation.override(settings.LANGUAGE_CODE):
+            self.image = Image.new('RGB', (settings.OG_IMAGE_WIDTH, settings.OG_IMAGE_HEIGHT), WHITE)
+            self.draw = ImageDraw.Draw(self.image)
+            for kind, box, options in self.layout:
+                getattr(self, 'draw_{}'.format(kind))(box, **options)
+
+        output = io.BytesIO()
+        self.image.save(output, format='JPEG', quality=90)
+        return output.getvalue()
+
+    def draw_background(self, box, path):
+        background = Image.open(finders.find(path)).convert('RGB')
+        self.image.paste(background.resize(box[2:], Image.LANCZOS), box[:2])
+
+    def draw_hero(self, box):
+        left, top, width, height = box
+        inner = (left + 6, top + 6, width - 12, height - 12)
+        gradient = Image.new('RGB', inner[2:], PURPLE)
+        mask = Image.linear_gradient('L').resize(inner[2:])
+        gradient.paste(Image.new('RGB', inner[2:], ORANGE), (0, 0), mask)
+        self._paste_rounded(gradient, inner)
+
+        brand_font = get_font('brand', 48)
+        self.draw.text((left + 24, top + 18), 'BooxMix', font=brand_font, fill=WHITE)
+        sub_title = gettext("Let's create book playlist and share it.")
+        self.draw.text((left + width - 6, top + height - 18), sub_title, font=get_font('bold', 28), fill=WHITE, anchor='rs')
+
+        title = remove_emoji(self.playlist.title.strip())
+        self._draw_centered_text(title, (inner[0] + 12, inner[1], inner[2] - 24, inner[3]), size=64)
+
+    def draw_panel(self, box):
+        self._paste_rounded(Image.new('RGB', box[2:], GRAY), box)
+
+    def draw_cover(self, box, index, border=True):
+        if index >= len(self.books):
+            return
+        cover = load_cover(self.books[index])
+        if cover is None:
+            cover = Image.new('RGB', box[2:], GRAY)
+        cover = cover.convert('RGB').resize(box[2:], Image.LANCZOS)
+        if border:
+            self._paste_rounded(cover, box)
+            left, top, width, height = box
+            self.draw.rounded_rectangle((left, top, left + width - 1, top + height - 1), radius=12, outline=GRAY)
+        else:
+            self.image.paste(cover, box[:2])
+
+    def draw_chevron(self, box, size):
+        left, top, width, height = box
+        center_x, center_y = left + width // 2, top + height // 2
+        half = size * 0.4
+        points = [
+            (center_x - half / 2, center_y - half),
+            (center_x + half / 2, center_y),
+            (center_x - half / 2, center_y + half),
+        ]
+        self.draw.line(points, fill=PURPLE, width=int(size * 0.18), joint='curve')
+
+    def draw_list(self, box, size, line_height, max_length):
+        left, top = box[:2]
+        font = get_font('bold', size)
+        for i, book in enumerate(self.books[:3]):
+            title = book.title or ''
+            if len(title) > max_length:
+                title = title[:max_length - 1] + '…'
+            y = top + line_height * i
+            self.draw.text((left + 32, y), '{}.'.format(i + 1), font=font, fill=WHITE, anchor='ra')
+            self.draw.text((left + 40, y), title, font=font, fill=WHITE, anchor='la')
+
+    def draw_text(self, box, text, size, anchor, line_height=None, font='bold'):
+        text = TEXTS[text](self.playlist)
+        font = get_font(font, size)
+        x, y = box
+        for i, line in enumerate(text.splitlines()):
+            self.draw.text((x, y + (line_height or 0) * i), line, font=font, fill=WHITE, anchor=anchor)
+
+    def draw_button(self, box, text, size, font='bold'):
+        left, top, width, height = box
+        self.draw.rectangle((left, top, left + width - 1, top + height - 1), outline=WHITE)
+        self.draw.text((left + width // 2, top + height // 2), TEXTS[text](self.playlist), font=get_font(font, size), fill=WHITE, anchor='mm')
+
+    def _paste_rounded(self, image, box, radius=12):
+        mask = Image.new('L', box[2:], 0)
+        ImageDraw.Draw(mask).rounded_rectangle((0, 0, box[2] - 1, box[3] - 1), radius=radius, fill=255)
+        self.image.paste(image, box[:2], mask)
+
+    def _draw_centered_text(self, text, box, size):
+        left, top, width, height = box
+        # Shrink the font until the wrapped title fits in the box.
+        while True:
+            font = get_font('bold', size)
+            lines = self._wrap(text, font, width)
+            line_height = int(size * 1.25)
+            if line_height * len(lines) <= height or size <= 24:
+                break
+            size -= 4
+        y = top + (height - line_height * len(lines)) // 2
+        for i, line in enumerate(lines):
+            self.draw.text((left + width // 2, y + line_height * i), line, font=font, fill=WHITE, anchor='ma')
+
+    def _wrap(self, text, font, width):
+        # Japanese has no spaces between words, so wrap by characters.
+        lines = []
+        line = ''
+        for char in text:
+            if char == '\n' or (line and font.getlength(line + char) > width):
+                lines.append(line)
+                line = '' if char in ('\n', ' ') else char
+            else:
+                line += char
+        if line:
+            lines.append(line)
+        return lines
+
+
+def render_og_image(playlist, template_slug, book_number):
+    return PillowRenderer(playlist, template_slug, book_number).render()
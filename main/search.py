@@ -0,0 +1,413 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import (
+    connection, transaction,
+)
+from django.db.models import (
+    Case, FloatField, Value, When,
+)
+from django.db.models.expressions import RawSQL
+
+
+# Katakana to hiragana, and old or variant forms of kanji common in names to the usual ones.
+# NFKC already folds full-width alphanumerics and half-width katakana.
+NORMALIZATION_TABLE = {code: code - 0x60 for code in range(ord('ァ'), ord('ヶ') + 1)}
+NORMALIZATION_TABLE.update(str.maketrans({
+    '髙': '高', '﨑': '崎', '濵': '浜', '濱': '浜', '邉': '辺', '邊': '辺', '齋': '斎', '齊': '斉',
+    '澤': '沢', '櫻': '桜', '國': '国', '學': '学', '圓': '円', '廣': '広', '惠': '恵', '藝': '芸',
+}))
+
+SCRIPT_PATTERN = re.compile(r'[\u3041-\u3096\u30fc]+|[\u3400-\u9fff\uf900-\ufaff々]+|[a-z0-9]+|\S+')
+
+
+def normalize(text):
+    return unicodedata.normalize('NFKC', text or '').lower().translate(NORMALIZATION_TABLE)
+
+
+def get_ngrams(text, n):
+    return {text[i:i + n] for i in range(len(text) - n + 1) if not any(c.isspace() for c in text[i:i + n])}
+
+
+def split_by_script(token):
+    # "村上春樹の小説" -> ["村上春樹", "小説"]: split where the script changes and drop
+    # the one-letter hiragana between, which are mostly particles.
+    segments = SCRIPT_PATTERN.findall(token)
+    return [
+        segment for segment in segments
+        if len(segments) == 1 or not (len(segment) == 1 and '\u3041' <= segment <= '\u3096')
+    ]
+
+
+def build_document(playlist):
+    values = [playlist.title, playlist.description]
+    for playlist_book in playlist.playlist_book_set.all():
+        book = playlist_book.book
+        values += [book.title, book.author, book.publisher]
+    return '\n'.join(normalize(value) for value in values if value)
+
+
+def update_documents(playlist_ids):
+    from .models import Playlist, PlaylistSearchDocument
+
+    playlist_ids = set(playlist_ids)
+    playlists = Playlist.all_objects \
+        .filter(pk__in=playlist_ids) \
+        .prefetch_related('playlist_book_set__book')
+    documents = {}
+    for playlist in playlists:
+        documents[playlist.pk] = build_document(playlist)
+        PlaylistSearchDocument.objects.update_or_create(playlist=playlist, defaults={'document': documents[playlist.pk]})
+    missing_ids = playlist_ids - set(documents)
+    if missing_ids:
+        PlaylistSearchDocument.objects.filter(playlist__in=missing_ids).hard_delete()
+    backend = get_backend()
+    backend.delete(playlist_ids)
+    backend.insert(documents)
+
+
+def update_documents_on_commit(playlist_ids):
+    playlist_ids = list(playlist_ids)
+    transaction.on_commit(lambda: update_documents(playlist_ids))
+
+
+class DocumentSearchBackend:
+    # Substring search on the document column. Works everywhere but scans the table.
+    min_token_length = None
+
+    def search(self, queryset, tokens):
+        tokens = [normalize(token) for token in tokens]
+        long_tokens = [token for token in tokens if self.min_token_length and len(token) >= self.min_token_length]
+        short_tokens = [token for token in tokens if token not in long_tokens]
+        for token in short_tokens:
+            queryset = queryset.filter(search_document__document__contains=token)
+        if long_tokens:
+            queryset = self.filter(queryset, long_tokens)
+        return queryset.annotate(search_rank=self.rank(long_tokens))
+
+    def filter(self, queryset, tokens):
+        return queryset
+
+    def rank(self, tokens):
+        return Value(0.0, output_field=FloatField())
+
+    def insert(self, documents):
+        pass
+
+    def delete(self, playlist_ids):
+        pass
+
+
+class MySQLSearchBackend(DocumentSearchBackend):
+    # FULLTEXT index WITH PARSER ngram, whose token size is 2 by default.
+    min_token_length = 2
+
+    def filter(self, queryset, tokens):
+        return queryset.filter(pk__in=RawSQL(
+            'SELECT playlist_id FROM playlist_search_documents '
+            'WHERE MATCH (document) AGAINST (%s IN BOOLEAN MODE)',
+            [self._get_boolean_query(tokens)],
+        ))
+
+    def rank(self, tokens):
+        return RawSQL(
+            'SELECT MATCH (document) AGAINST (%s IN BOOLEAN MODE) FROM playlist_search_documents '
+            'WHERE playlist_id = playlists.id',
+            [self._get_boolean_query(tokens)],
+            output_field=FloatField(),
+        )
+
+    def _get_boolean_query(self, tokens):
+        return ' '.join('+"{}"'.format(token.replace('"', ' ')) for token in tokens)
+
+
+class PostgreSQLSearchBackend(DocumentSearchBackend):
+    # GIN index with gin_trgm_ops, which serves LIKE '%token%' for 3 or more characters.
+    min_token_length = 3
+
+    def filter(self, queryset, tokens):
+        for token in tokens:
+            queryset = queryset.filter(search_document__document__contains=token)
+        return queryset
+
+    def rank(self, tokens):
+        from django.contrib.postgres.search import TrigramSimilarity
+        return TrigramSimilarity('search_document__document', ' '.join(tokens))
+
+
+class SQLiteSearchBackend(DocumentSearchBackend):
+    # FTS5 table with the trigram tokenizer (SQLite 3.34+), kept in sync by insert/delete.
+    min_token_length = 3
+
+    def filter(self, queryset, tokens):
+        return queryset.filter(pk__in=RawSQL(
+            'SELECT playlist_id FROM playlist_search_fts WHERE playlist_search_fts MATCH %s',
+            [self._get_match_query(tokens)],
+        ))
+
+    def rank(self, tokens):
+        return RawSQL(
+            'SELECT -bm25(playlist_search_fts) FROM playlist_search_fts '
+            'WHERE playlist_search_fts MATCH %s AND playlist_id = playlists.id',
+            [self._get_match_query(tokens)],
+            output_field=FloatField(),
+        )
+
+    def insert(self, documents):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO playlist_search_fts (playlist_id, document) VALUES (%s, %s)',
+                [(playlist_id.hex, document) for playlist_id, document in documents.items()],
+            )
+
+    def delete(self, playlist_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                'DELETE FROM playlist_search_fts WHERE playlist_id = %s',
+                [(playlist_id.hex,) for playlist_id in playlist_ids],
+            )
+
+    def _get_match_query(self, tokens):
+        return ' AND '.join('"{}"'.format(token.replace('"', '""')) for token in tokens)
+
+
+class NgramIndex:
+    # Inverted index of unigrams and bigrams of the search documents in this process.
+    # Candidates from the postings are verified by substring match, so results are
+    # the same as with icontains. Each change increments the version in the cache and
+    # leaves the changed playlists under the version, which other processes re-read
+    # instead of reloading every document. They reload only if some of it has expired,
+    # and every PLAYLIST_SEARCH_INDEX_RELOAD_INTERVAL in case the cache is not shared.
+    version_key = 'search:ngram_index:version'
+    changes_key = 'search:ngram_index:changes:{}'
+    changes_timeout = 60 * 60
+    max_changes = 100
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.documents = {}
+        self.postings = defaultdict(set)
+        self.version = None
+        self.checked_at = 0
+        self.loaded_at = 0
+        self.loaded = False
+
+    def __len__(self):
+        return len(self.documents)
+
+    def load(self):
+        from .models import PlaylistSearchDocument
+
+        version = cache.get(self.version_key)
+        documents = dict(PlaylistSearchDocument.objects.values_list('playlist', 'document'))
+        postings = defaultdict(set)
+        for pk, document in documents.items():
+            for gram in self._get_grams(document):
+                postings[gram].add(pk)
+        with self.lock:
+            self.documents, self.postings = documents, postings
+            self.version = version
+            self.checked_at = self.loaded_at = time.monotonic()
+            self.loaded = True
+
+    def ensure_loaded(self):
+        if time.monotonic() - self.checked_at < settings.PLAYLIST_SEARCH_INDEX_CHECK_INTERVAL:
+            return
+        version = cache.get(self.version_key)
+        is_expired = time.monotonic() - self.loaded_at >= settings.PLAYLIST_SEARCH_INDEX_RELOAD_INTERVAL
+        if not self.loaded or is_expired or not self.apply_changes(version):
+            self.load()
+        self.checked_at = time.monotonic()
+
+    def apply_changes(self, version):
+        # Returns False if the index has to be reloaded.
+        from .models import PlaylistSearchDocument
+
+        if version == self.version:
+            return True
+        if version is None or self.version is None or not 0 < version - self.version <= self.max_changes:
+            return False
+        keys = [self.changes_key.format(i) for i in range(self.version + 1, version + 1)]
+        changes = cache.get_many(keys)
+        if len(changes) < len(keys):
+            return False
+        playlist_ids = set().union(*changes.values())
+        documents = dict(
+            PlaylistSearchDocument.objects
+                .filter(playlist__in=playlist_ids)
+                .values_list('playlist', 'document')
+        )
+        with self.lock:
+            for pk in playlist_ids:
+                self._remove(pk)
+                if pk in documents:
+                    self._add(pk, documents[pk])
+            self.version = version
+        return True
+
+    def add(self, pk, document):
+        if not self.loaded:
+            return
+        with self.lock:
+            self._remove(pk)
+            self._add(pk, document)
+
+    def remove(self, pk):
+        if not self.loaded:
+            return
+        with self.lock:
+            self._remove(pk)
+
+    def publish(self, playlist_ids):
+        # Called after the changes were saved and applied to the index of this process.
+        version = self._increment_version()
+        cache.set(self.changes_key.format(version), set(playlist_ids), self.changes_timeout)
+        if self.loaded and self.version == version - 1:
+            self.version = version
+
+    def bump_version(self):
+        # Makes the other processes reload every document, e.g. after a rebuild.
+        version = self._increment_version()
+        if self.loaded and self.version == version - 1:
+            self.version = version
+
+    def search(self, tokens):
+        self.ensure_loaded()
+        scores = None
+        for token in tokens:
+            matches = self._match(token)
+            if not matches and len(split_by_script(token)) > 1:
+                matches = self._match_all(split_by_script(token))
+            scores = matches if scores is None else {
+                pk: score + matches[pk] for pk, score in scores.items() if pk in matches
+            }
+            if not scores:
+                return []
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)
+
+    def _increment_version(self):
+        cache.add(self.version_key, 0, None)
+        try:
+            return cache.incr(self.version_key)
+        except ValueError:
+            # Evicted between add and incr
+            cache.set(self.version_key, 1, None)
+            return 1
+
+    def _match_all(self, tokens):
+        scores = None
+        for token in tokens:
+            matches = self._match(token)
+            scores = matches if scores is None else {
+                pk: score + matches[pk] for pk, score in scores.items() if pk in matches
+            }
+            if not scores:
+                return {}
+        return scores
+
+    def _match(self, token):
+        grams = get_ngrams(token, 2) or {token}
+        postings = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+        candidates = set.intersection(*postings) if postings else set()
+        # Prefix matches of a field or a word rank higher.
+        prefix_pattern = re.compile(r'(?:^|\s){}'.format(re.escape(token)))
+        matches = {}
+        for pk in candidates:
+            document = self.documents.get(pk, '')
+            count = document.count(token)
+            if count:
+                matches[pk] = count + 2 * len(prefix_pattern.findall(document))
+        return matches
+
+    def _add(self, pk, document):
+        self.documents[pk] = document or ''
+        for gram in self._get_grams(document):
+            self.postings[gram].add(pk)
+
+    def _remove(self, pk):
+        document = self.documents.pop(pk, None)
+        if document is None:
+            return
+        for gram in self._get_grams(document):
+            postings = self.postings.get(gram)
+            if postings is not None:
+                postings.discard(pk)
+                if not postings:
+                    del self.postings[gram]
+
+    def _get_grams(self, document):
+        return get_ngrams(document or '', 1) | get_ngrams(document or '', 2)
+
+
+ngram_index = NgramIndex()
+
+
+class NgramSearchBackend(DocumentSearchBackend):
+
+    def search(self, queryset, tokens):
+        results = self.select(queryset, ngram_index.search([normalize(token) for token in tokens]))
+        # Scores are counts of matches, so a few values cover all the results.
+        groups = defaultdict(list)
+        for pk, score in results:
+            groups[score].append(pk)
+        whens = [When(pk__in=pk_list, then=Value(float(score))) for score, pk_list in groups.items()]
+        return queryset \
+            .filter(pk__in=[pk for pk, score in results]) \
+            .annotate(search_rank=Case(*whens, default=Value(0.0), output_field=FloatField()))
+
+    def select(self, queryset, results):
+        # The best PLAYLIST_SEARCH_MAX_RESULTS of the results that pass the filters of the
+        # queryset, e.g. the theme. Checked a page at a time from the best.
+        size = settings.PLAYLIST_SEARCH_MAX_RESULTS
+        selected = []
+        for i in range(0, len(results), size):
+            page = results[i:i + size]
+            pk_set = set(
+                queryset
+                    .filter(pk__in=[pk for pk, score in page])
+                    .prefetch_related(None)
+                    .order_by()
+                    .values_list('pk', flat=True)
+            )
+            selected += [(pk, score) for pk, score in page if pk in pk_set]
+            if len(selected) >= size:
+                break
+        return selected[:size]
+
+    def insert(self, documents):
+        for pk, document in documents.items():
+            ngram_index.add(pk, document)
+
+    def delete(self, playlist_ids):
+        # update_documents deletes every changed playlist before inserting the documents,
+        # which are already saved for the other processes to read.
+        for pk in playlist_ids:
+            ngram_index.remove(pk)
+        ngram_index.publish(playlist_ids)
+
+
+def get_backend():
+    if settings.PLAYLIST_SEARCH_BACKEND == 'ngram':
+        return NgramSearchBackend()
+    elif connection.vendor == 'mysql':
+        return MySQLSearchBackend()
+    elif connection.vendor == 'postgresql':
+        return PostgreSQLSearchBackend()
+    elif connection.vendor == 'sqlite' and has_sqlite_fts():
+        return SQLiteSearchBackend()
+    return DocumentSearchBackend()
+
+
+@lru_cache(maxsize=None)
+def has_sqlite_fts():
+    return 'playlist_search_fts' in connection.introspection.table_names()
+
+
+def search_playlists(queryset, tokens):
+    return get_backend().search(queryset, tokens)
@@ -0,0 +1,45 @@
+from django.db.models.signals import (
+    post_delete, post_save,
+)
+from django.dispatch import receiver
+
+from . import homepage
+from .models import (
+    Like, Playlist, PlaylistBook, Provider, Recommendation, Theme,
+)
+from .providers import providers
+
+
+@receiver(post_save, sender=Provider)
+@receiver(post_delete, sender=Provider)
+def clear_provider_registry(sender, **kwargs):
+    providers.clear()
+
+
+@receiver(post_save, sender=Playlist)
+@receiver(post_delete, sender=Playlist)
+def invalidate_homepage_by_playlist(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= set(Playlist.OG_IMAGE_FIELDS):
+        return
+    homepage.invalidate(*homepage.SECTIONS)
+
+
+@receiver(post_save, sender=PlaylistBook)
+@receiver(post_delete, sender=PlaylistBook)
+def invalidate_homepage_by_playlist_book(sender, **kwargs):
+    # Sections of playlists with two or more books
+    homepage.invalidate('popular', 'recent')
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+def invalidate_homepage_by_like(sender, **kwargs):
+    homepage.invalidate('popular')
+
+
+@receiver(post_save, sender=Recommendation)
+@receiver(post_delete, sender=Recommendation)
+@receiver(post_save, sender=Theme)
+@receiver(post_delete, sender=Theme)
+def invalidate_homepage_by_recommendation(sender, **kwargs):
+    homepage.invalidate('themes')
@@ -0,0 +1,11 @@
+from django import template
+
+
+register = template.Library()
+
+
+@register.filter
+def cover_url(book, variant='list'):
+    # {{ book|cover_url:'small' }} or {{ book|cover_url:'small.webp' }}
+    variant, _, extension = variant.partition('.')
+    return book.get_cover_url(variant, extension or 'jpg')
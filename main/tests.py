@@ -1,3 +1,883 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from io import (
+    BytesIO, StringIO,
+)
+from unittest import (
+    mock, skipUnless,
+)
+
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import NON_FIELD_ERRORS
+from django.core.management import call_command
+from django.db import (
+    connection, transaction,
+)
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.test import (
+    RequestFactory, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import (
+    Image, ImageFont, features,
+)
+
+from accounts.models import User
+from bookplaylist.metrics import BudgetExceeded
+from bookplaylist.middleware import MetricsMiddleware
+from bookplaylist.models import perform_unique_checks_conditional
+from bookplaylist.paginators import KeysetPaginator
+from . import (
+    homepage, likes, related, views,
+)
+from .checks import (
+    check_og_image_fonts, check_shared_cache,
+)
+from .drafts import PlaylistDraft
+from .models import (
+    Book, BookData, Like, Number, OgImageJob, Playlist, PlaylistBook, PlaylistSearchDocument, Provider, RelatedPlaylist, RelatedPlaylistJob, Theme,
+)
+from .providers import providers
+from .renderers import (
+    get_font, render_og_image,
+)
+from .search import (
+    NgramIndex, ngram_index, search_playlists, update_documents,
+)
 
 # Create your tests here.
+
+
+class PlaylistCountTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.theme = Theme.objects.create(name='theme', slug='theme')
+        users = [User.objects.create(username='user{}'.format(i), email='user{}@example.com'.format(i)) for i in range(3)]
+        cls.playlist = Playlist.objects.create(user=users[0], theme=cls.theme, title='playlist', description='description')
+        for i in range(2):
+            book = Book.objects.create(isbn='978410000000{}'.format(i), title='book {}'.format(i))
+            PlaylistBook.objects.create(playlist=cls.playlist, book=book)
+        for user in users:
+            Like.objects.create(playlist=cls.playlist, user=user)
+
+    def assertCounts(self, like_count, book_count):
+        self.playlist.refresh_from_db()
+        self.assertEqual((self.playlist.like_count, self.playlist.book_count), (like_count, book_count))
+
+    def test_counts_are_updated_on_save(self):
+        self.assertCounts(3, 2)
+
+    def test_refresh_counts(self):
+        Playlist.all_objects.update(like_count=10, book_count=0)
+        Playlist.all_objects.refresh_counts()
+        self.assertCounts(3, 2)
+
+    def test_reconcile_command(self):
+        Playlist.all_objects.update(like_count=10, book_count=0)
+        with redirect_stdout(StringIO()) as stdout:
+            call_command('reconcileplaylistcounts', '--dry-run')
+        self.assertIn('likes: 10 -> 3 | books: 0 -> 2', stdout.getvalue())
+        self.assertCounts(10, 0)
+
+        with redirect_stdout(StringIO()) as stdout:
+            call_command('reconcileplaylistcounts')
+        self.assertIn('1 playlists fixed.', stdout.getvalue())
+        self.assertCounts(3, 2)
+
+    def test_save_of_stale_instance_keeps_counts(self):
+        playlist = Playlist.objects.get(pk=self.playlist.pk)
+        Like.objects.filter(user__username='user0').delete()
+        playlist.title = 'title'
+        playlist.save()
+        playlist.delete()
+        playlist.restore()
+        self.assertCounts(2, 2)
+        self.assertEqual(self.playlist.title, 'title')
+
+    def test_bulk_delete_and_restore(self):
+        Like.objects.filter(user__username='user0').delete()
+        PlaylistBook.objects.filter(book='9784100000000').delete()
+        self.assertCounts(2, 1)
+        Like.all_objects.filter(user__username='user0').restore()
+        self.assertCounts(3, 1)
+        Like.objects.filter(playlist=self.playlist).hard_delete()
+        self.assertCounts(0, 1)
+
+
+class SetLikeTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user', email='user@example.com')
+        theme = Theme.objects.create(name='theme', slug='theme')
+        cls.playlist = Playlist.objects.create(user=cls.user, theme=theme, title='playlist', description='description')
+
+    def assertLikes(self, count):
+        self.playlist.refresh_from_db()
+        self.assertEqual(self.playlist.like_count, count)
+        self.assertEqual(Like.objects.filter(playlist=self.playlist).count(), count)
+
+    def test_repeated_toggles(self):
+        for liked, count in ((True, 1), (True, 1), (False, 0), (False, 0), (True, 1)):
+            self.assertEqual(likes.set_like(self.playlist, self.user, liked), count)
+            self.assertLikes(count)
+        # Liking again restores the deleted like instead of adding a row.
+        self.assertEqual(Like.all_objects.filter(playlist=self.playlist).count(), 1)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentSetLikeTests(TransactionTestCase):
+    # The likes of the same user wait for each other on the row lock of the user.
+
+    def setUp(self):
+        self.user = User.objects.create(username='user', email='user@example.com')
+        theme = Theme.objects.create(name='theme', slug='theme')
+        self.playlist = Playlist.objects.create(user=self.user, theme=theme, title='playlist', description='description')
+
+    def toggle(self, liked, barrier):
+        try:
+            barrier.wait()
+            likes.set_like(self.playlist, self.user, liked)
+        finally:
+            connection.close()
+
+    def test_concurrent_toggles(self):
+        for liked, count in ((True, 1), (False, 0)):
+            barrier = threading.Barrier(5)
+            threads = [threading.Thread(target=self.toggle, args=(liked, barrier)) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.playlist.refresh_from_db()
+            self.assertEqual(self.playlist.like_count, count)
+            self.assertEqual(Like.objects.filter(playlist=self.playlist).count(), count)
+
+
+class BookDataResolutionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.providers = [
+            Provider.objects.create(name=name, slug=name, endpoint='https://{}.example.com/'.format(name), priority=priority)
+            for name, priority in (('first', 1), ('second', 2))
+        ]
+        cls.book = Book.objects.create(isbn='9784500000000')
+        BookData.objects.create(book=cls.book, provider=cls.providers[1], title='second title', author='second author')
+        BookData.objects.create(book=cls.book, provider=cls.providers[0], title='first title')
+
+    def test_provider_of_highest_priority_wins(self):
+        self.book.refresh_from_db()
+        # A field the first provider does not have comes from the next one.
+        self.assertEqual((self.book.title, self.book.author), ('first title', 'second author'))
+
+    def test_priority_change_resolves_books_again(self):
+        provider = self.providers[0]
+        provider.priority = 3
+        provider.save()
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.title, 'second title')
+
+
+class ProviderRegistryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.provider = Provider.objects.create(name='first', slug='first', endpoint='https://first.example.com/', priority=1)
+
+    def setUp(self):
+        providers.clear()
+
+    @override_settings(PROVIDER_REGISTRY_TIMEOUT=60)
+    def test_reloaded_after_timeout(self):
+        with mock.patch('main.providers.time.monotonic', return_value=1000):
+            self.assertEqual(providers.get('first'), self.provider)
+        # A change without signals, as made by another process
+        Provider.objects.filter(pk=self.provider.pk).update(name='renamed')
+        with mock.patch('main.providers.time.monotonic', return_value=1060), self.assertNumQueries(0):
+            self.assertEqual(providers.get('first').name, 'first')
+        with mock.patch('main.providers.time.monotonic', return_value=1061), self.assertNumQueries(1):
+            self.assertEqual(providers.get('first').name, 'renamed')
+
+    def test_cleared_on_save(self):
+        self.assertEqual(providers.by_priority(), [self.provider])
+        second = Provider.objects.create(name='second', slug='second', endpoint='https://second.example.com/', priority=0)
+        self.assertEqual(providers.by_priority(), [second, self.provider])
+        second.delete()
+        with self.assertRaises(Provider.DoesNotExist):
+            providers.get('second')
+
+
+class RelatedPlaylistTests(TransactionTestCase):
+    # The playlists are queued on commit, which a TestCase never reaches.
+
+    def setUp(self):
+        self.user = User.objects.create(username='user', email='user@example.com')
+        self.theme = Theme.objects.create(name='theme', slug='theme')
+        self.books = [Book.objects.create(isbn='978420000000{}'.format(i), title='book {}'.format(i)) for i in range(3)]
+        self.other = Playlist.objects.create(user=self.user, theme=self.theme, title='other', description='description')
+        for book in self.books[:2]:
+            PlaylistBook.objects.create(playlist=self.other, book=book)
+
+    def test_one_update_per_transaction(self):
+        with redirect_stdout(StringIO()):
+            call_command('rebuildrelatedplaylists', '--queued')
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                playlist = Playlist.objects.create(user=self.user, theme=self.theme, title='playlist', description='description')
+                for book in self.books:
+                    PlaylistBook.objects.create(playlist=playlist, book=book)
+        # The playlists are queued once; the command recomputes them.
+        self.assertEqual(len([query for query in queries if 'related_playlist_jobs' in query['sql']]), 2)
+        self.assertEqual(list(RelatedPlaylistJob.objects.values_list('playlist', flat=True)), [playlist.pk])
+        self.assertEqual(related.get_related_ids(playlist, 10), [])
+
+        with redirect_stdout(StringIO()):
+            call_command('rebuildrelatedplaylists', '--queued')
+        self.assertFalse(RelatedPlaylistJob.objects.exists())
+        self.assertEqual(related.get_related_ids(playlist, 10), [self.other.pk])
+        self.assertEqual(related.get_related_ids(self.other, 10), [playlist.pk])
+
+    def test_rolled_back_playlists_are_not_queued(self):
+        RelatedPlaylistJob.objects.all().delete()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Playlist.objects.create(user=self.user, theme=self.theme, title='playlist', description='description')
+            raise RuntimeError
+        PlaylistBook.objects.create(playlist=self.other, book=self.books[2])
+        self.assertEqual(list(RelatedPlaylistJob.objects.values_list('playlist', flat=True)), [self.other.pk])
+
+    def test_requested_again_while_running(self):
+        RelatedPlaylistJob.objects.enqueue([self.other.pk])
+        jobs = list(RelatedPlaylistJob.objects.values_list('playlist', 'date_requested'))
+        RelatedPlaylistJob.objects.enqueue([self.other.pk])
+        RelatedPlaylistJob.objects.finish(jobs)
+        self.assertTrue(RelatedPlaylistJob.objects.filter(playlist=self.other).exists())
+
+
+class PlaylistDetailConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user', email='user@example.com')
+        cls.theme = Theme.objects.create(name='theme', slug='theme')
+        cls.playlist, cls.other = [
+            Playlist.objects.create(user=cls.user, theme=cls.theme, title=title, description='description')
+            for title in ('playlist', 'other')
+        ]
+        for i in range(2):
+            book = Book.objects.create(isbn='978430000000{}'.format(i), title='book {}'.format(i))
+            for playlist in (cls.playlist, cls.other):
+                PlaylistBook.objects.create(playlist=playlist, book=book)
+        related.update([cls.playlist.pk, cls.other.pk])
+
+    def get(self, **extra):
+        return self.client.get(reverse('main:playlist_detail', args=[self.playlist.pk]), **extra)
+
+    def test_not_modified(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+        # Only the playlist, its user and theme, and its books are read.
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertFalse([query for query in queries if 'related_playlists' in query['sql']])
+
+    def test_etag_changes_with_the_playlist(self):
+        etag = self.get()['ETag']
+        Playlist.objects.filter(pk=self.playlist.pk).update(like_count=1)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@mock.patch.object(views.PlaylistView, 'paginate_by', 2)
+class PlaylistPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='user', email='user@example.com')
+        theme = Theme.objects.create(name='theme', slug='theme')
+        cls.playlists = [
+            Playlist.objects.create(user=user, theme=theme, title='playlist {}'.format(i), description='description')
+            for i in range(5)
+        ]
+        # Ties on like_count and created_at, which only the id breaks
+        created_at = timezone.now()
+        Playlist.all_objects.update(like_count=1, created_at=created_at)
+        Playlist.all_objects.filter(pk=cls.playlists[4].pk).update(like_count=2)
+
+    def get(self, **params):
+        return self.client.get(reverse('main:playlist_fragment'), params)
+
+    def test_pages(self):
+        pages = []
+        cursor = None
+        while True:
+            response = self.get(**({'cursor': cursor} if cursor else {}))
+            page = response.context['page_obj']
+            pages.append([playlist.pk for playlist in page])
+            if not page.has_next():
+                self.assertNotIn('next_page_params', response.context)
+                break
+            cursor = page.next_cursor
+        expected = [self.playlists[4].pk] + sorted((playlist.pk for playlist in self.playlists[:4]), reverse=True)
+        self.assertEqual(pages, [expected[:2], expected[2:4], expected[4:]])
+
+    def test_tampered_cursor(self):
+        cursor = self.get().context['page_obj'].next_cursor
+        self.assertEqual(self.get(cursor=cursor[:-1] + ('A' if cursor[-1] != 'A' else 'B')).status_code, 404)
+        # A cursor of the same values signed for another purpose
+        values = KeysetPaginator(Playlist.objects.all(), views.PlaylistView.orderings['popular'], 2).decode_cursor(cursor)
+        self.assertEqual(self.get(cursor=signing.dumps(values, compress=True)).status_code, 404)
+
+    @override_settings(PLAYLIST_CURSOR_MAX_AGE=60)
+    def test_expired_cursor(self):
+        now = time.time()
+        with mock.patch('django.core.signing.time.time', return_value=now - 61):
+            cursor = self.get().context['page_obj'].next_cursor
+        self.assertEqual(self.get(cursor=cursor).status_code, 404)
+
+        with mock.patch('django.core.signing.time.time', return_value=now - 59):
+            cursor = self.get().context['page_obj'].next_cursor
+        self.assertEqual(self.get(cursor=cursor).status_code, 200)
+
+
+@override_settings(PLAYLIST_SEARCH_BACKEND='document')
+class SearchDocumentTests(TransactionTestCase):
+    # The documents are updated on commit, which a TestCase never reaches.
+
+    def setUp(self):
+        user = User.objects.create(username='user', email='user@example.com')
+        theme = Theme.objects.create(name='theme', slug='theme')
+        provider = Provider.objects.create(name='provider', slug='provider', endpoint='https://example.com/', priority=1)
+        self.book = Book.objects.create(isbn='9784600000000')
+        BookData.objects.create(book=self.book, provider=provider, title='ノルウェイの森', author='ムラカミハルキ')
+        self.playlist = Playlist.objects.create(user=user, theme=theme, title='Ｐｌａｙｌｉｓｔ', description='description')
+        PlaylistBook.objects.create(playlist=self.playlist, book=self.book)
+
+    def search(self, *tokens):
+        return list(search_playlists(Playlist.objects.all(), list(tokens)))
+
+    def test_document_is_normalized(self):
+        document = PlaylistSearchDocument.objects.get(playlist=self.playlist).document
+        self.assertEqual(document.split('\n'), ['playlist', 'description', 'のるうぇいの森', 'むらかみはるき'])
+        # Full-width, half-width, katakana and hiragana all match.
+        for tokens in (['playlist'], ['ﾑﾗｶﾐ'], ['むらかみ', 'PLAYLIST']):
+            with self.subTest(tokens=tokens):
+                self.assertEqual(self.search(*tokens), [self.playlist])
+        self.assertEqual(self.search('むらかみ', 'other'), [])
+
+    def test_document_follows_the_book(self):
+        BookData.objects.filter(book=self.book).update(author='')
+        BookData.objects.get(book=self.book).save()
+        self.assertEqual(self.search('むらかみ'), [])
+        self.assertEqual(self.search('ノルウェイ'), [self.playlist])
+
+
+@override_settings(PLAYLIST_SEARCH_BACKEND='ngram', PLAYLIST_SEARCH_INDEX_CHECK_INTERVAL=0)
+class NgramSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user', email='user@example.com')
+        cls.themes = [Theme.objects.create(name='theme{}'.format(i), slug='theme{}'.format(i)) for i in range(2)]
+        cls.playlists = [
+            Playlist.objects.create(user=cls.user, theme=cls.themes[0], title='村上春樹 村上春樹 {}'.format(i), description='description')
+            for i in range(3)
+        ] + [
+            Playlist.objects.create(user=cls.user, theme=cls.themes[1], title='村上春樹', description='description'),
+        ]
+        update_documents([playlist.pk for playlist in cls.playlists])
+
+    def setUp(self):
+        ngram_index.load()
+
+    def search(self, queryset):
+        return list(search_playlists(queryset, ['村上春樹']).order_by('-search_rank', 'title'))
+
+    @override_settings(PLAYLIST_SEARCH_MAX_RESULTS=2)
+    def test_filters_are_applied_before_the_limit(self):
+        self.assertEqual(self.search(Playlist.objects.filter(theme=self.themes[1])), self.playlists[3:])
+        self.assertEqual(len(self.search(Playlist.objects.all())), 2)
+
+    def test_changes_are_applied_without_reloading(self):
+        index = NgramIndex()
+        index.load()
+        playlist = self.playlists[3]
+        Playlist.objects.filter(pk=playlist.pk).update(title='羊をめぐる冒険')
+        update_documents([playlist.pk])
+        with self.assertNumQueries(1):
+            self.assertNotIn(playlist.pk, dict(index.search(['村上春樹'])))
+        self.assertIn(playlist.pk, dict(index.search(['羊'])))
+        self.assertEqual(len(index), len(self.playlists))
+
+    def test_reload_without_shared_version(self):
+        # Another process whose cache never sees the version of the changes
+        index = NgramIndex()
+        with mock.patch.object(index, 'version_key', 'search:ngram_index:version:other'):
+            index.load()
+            playlist = self.playlists[3]
+            Playlist.objects.filter(pk=playlist.pk).update(title='羊をめぐる冒険')
+            update_documents([playlist.pk])
+            self.assertIn(playlist.pk, dict(index.search(['村上春樹'])))
+            with override_settings(PLAYLIST_SEARCH_INDEX_RELOAD_INTERVAL=0):
+                self.assertNotIn(playlist.pk, dict(index.search(['村上春樹'])))
+                self.assertIn(playlist.pk, dict(index.search(['羊'])))
+
+    @override_settings(DEBUG=False, CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_local_cache_is_warned(self):
+        self.assertEqual([warning.id for warning in check_shared_cache(None)], ['main.W002'])
+
+
+@skipUnless(features.check('freetype2'), 'Pillow has no FreeType support.')
+class HomepageSnapshotTests(TransactionTestCase):
+    # The snapshot is invalidated on commit, which a TestCase never reaches.
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='user', email='user@example.com')
+        self.theme = Theme.objects.create(name='theme', slug='theme')
+        self.books = [Book.objects.create(isbn='978440000000{}'.format(i), title='book {}'.format(i)) for i in range(2)]
+
+    def create_playlist(self, title):
+        playlist = Playlist.objects.create(user=self.user, theme=self.theme, title=title, description='description')
+        for book in self.books:
+            PlaylistBook.objects.create(playlist=playlist, book=book)
+        return playlist
+
+    def test_write_invalidates_sections(self):
+        first = self.create_playlist('first')
+        self.assertEqual(homepage.get_snapshot()['recent'], [first.pk])
+        with self.assertNumQueries(0):
+            homepage.get_snapshot()
+
+        second = self.create_playlist('second')
+        self.assertIsNone(cache.get(homepage.get_cache_key('recent')))
+        self.assertEqual(homepage.get_snapshot()['recent'], [second.pk, first.pk])
+
+        Like.objects.create(playlist=first, user=self.user)
+        self.assertIsNone(cache.get(homepage.get_cache_key('popular')))
+        self.assertEqual(homepage.get_snapshot()['popular'], [first.pk, second.pk])
+
+    @override_settings(DEBUG=False, CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_local_cache_is_warned(self):
+        with override_settings(PLAYLIST_SEARCH_BACKEND='database'):
+            self.assertEqual([warning.id for warning in check_shared_cache(None)], ['main.W002'])
+
+
+class OgImageRendererTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='user', email='user@example.com')
+        theme = Theme.objects.create(name='theme', slug='theme')
+        cls.playlist = Playlist.objects.create(user=user, theme=theme, title='プレイリスト', description='description')
+        for i in range(3):
+            book = Book.objects.create(
+                isbn='978430000000{}'.format(i),
+                title='book {}'.format(i),
+                cover='https://example.com/{}.jpg'.format(i),
+            )
+            PlaylistBook.objects.create(playlist=cls.playlist, book=book)
+
+    def setUp(self):
+        # The TrueType font built in Pillow in place of the fonts, which are not in the repository
+        with tempfile.NamedTemporaryFile(suffix='.ttf', delete=False) as f:
+            f.write(ImageFont.load_default(10).path.getvalue())
+        self.addCleanup(os.remove, f.name)
+        fonts = override_settings(OG_IMAGE_FONTS={'bold': f.name, 'brand': f.name})
+        fonts.enable()
+        self.addCleanup(fonts.disable)
+        get_font.cache_clear()
+        self.addCleanup(get_font.cache_clear)
+
+    def test_render(self):
+        # The covers are not cached, so they are drawn as placeholders without downloading them.
+        for template_slug, book_number in (('default', 1), ('default', 3), ('best_3_in_this_year', 3)):
+            with self.subTest(template_slug=template_slug, book_number=book_number):
+                image = Image.open(BytesIO(render_og_image(self.playlist, template_slug, book_number)))
+                self.assertEqual((image.format, image.size), ('JPEG', (1200, 630)))
+
+    def test_missing_fonts_are_warnings(self):
+        with override_settings(OG_IMAGE_RENDERER='pillow', OG_IMAGE_FONTS={}):
+            self.assertEqual([warning.id for warning in check_og_image_fonts(None)], ['main.W001', 'main.W001'])
+        with override_settings(OG_IMAGE_RENDERER='html', OG_IMAGE_FONTS={}):
+            self.assertEqual(check_og_image_fonts(None), [])
+        with override_settings(OG_IMAGE_RENDERER='pillow'):
+            self.assertEqual(check_og_image_fonts(None), [])
+
+
+class OgImageJobTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='user', email='user@example.com')
+        theme = Theme.objects.create(name='theme', slug='theme')
+        cls.playlist = Playlist.objects.create(user=user, theme=theme, title='playlist', description='description')
+
+    def setUp(self):
+        for name in ('cache_covers', 'save_og_image'):
+            patcher = mock.patch.object(Playlist, name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def test_one_job_per_playlist(self):
+        OgImageJob.objects.enqueue(self.playlist)
+        job = OgImageJob.objects.claim()
+        self.assertEqual((job.status, job.attempts), (OgImageJob.STATUS_RUNNING, 1))
+        self.assertIsNone(OgImageJob.objects.claim())
+
+        # Requested again while rendering: the new request is left pending.
+        OgImageJob.objects.enqueue(self.playlist)
+        job.run()
+        self.assertEqual(OgImageJob.objects.get().status, OgImageJob.STATUS_PENDING)
+
+    def test_worker(self):
+        OgImageJob.objects.enqueue(self.playlist)
+        with redirect_stdout(StringIO()) as stdout:
+            call_command('runogimageworker', '--burst')
+        self.assertIn('Done. | title: playlist', stdout.getvalue())
+        self.save_og_image.assert_called_once_with()
+        self.assertEqual(OgImageJob.objects.get().status, OgImageJob.STATUS_DONE)
+
+    @override_settings(OG_IMAGE_JOB_MAX_ATTEMPTS=2)
+    def test_failed_job_is_retried(self):
+        self.save_og_image.side_effect = OSError('failed')
+        OgImageJob.objects.enqueue(self.playlist)
+        for status in (OgImageJob.STATUS_PENDING, OgImageJob.STATUS_FAILED):
+            with self.assertRaises(OSError):
+                OgImageJob.objects.claim().run()
+            job = OgImageJob.objects.get()
+            self.assertEqual((job.status, job.error), (status, "OSError('failed')"))
+        self.assertIsNone(OgImageJob.objects.claim())
+
+
+@override_settings(OG_IMAGE_RENDERER='pillow')
+class CreateOgImageCommandTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='user', email='user@example.com')
+        theme = Theme.objects.create(name='theme', slug='theme')
+        theme.template.book_numbers.add(Number.objects.create(number=1))
+        cls.playlists = [
+            Playlist.objects.create(user=user, theme=theme, title='playlist {}'.format(i), description='description')
+            for i in range(2)
+        ]
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_root_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_root_settings.enable()
+        self.addCleanup(media_root_settings.disable)
+        # The covers and the renderer are left out; only which images are rendered matters.
+        for patcher in (
+            mock.patch.object(Playlist, 'cache_covers'),
+            mock.patch('main.renderers.render_og_image', return_value=b'image'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def call_command(self, *args):
+        with redirect_stdout(StringIO()) as stdout:
+            call_command('createogimage', *args)
+        return stdout.getvalue()
+
+    def test_only_changed_images_are_rendered_again(self):
+        self.assertIn('2/2 images created', self.call_command())
+        self.assertIn('No data to create the image.', self.call_command('--override'))
+
+        Playlist.objects.filter(pk=self.playlists[0].pk).update(title='title')
+        output = self.call_command('--override')
+        self.assertIn('Done. | title: title', output)
+        self.assertIn('1/1 images created', output)
+        self.assertIn('2/2 images created', self.call_command('--override', '--ignore-fingerprint'))
+
+
+class PlaylistCardQueryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user', email='user@example.com')
+        cls.theme = Theme.objects.create(name='theme', slug='theme')
+        for i in range(12):
+            playlist = Playlist.objects.create(
+                user=cls.user,
+                theme=cls.theme,
+                title='playlist {:02d}'.format(i),
+                description='description',
+            )
+            for j in range(3):
+                book = Book.objects.create(
+                    isbn='978400000{:02d}{}'.format(i, j),
+                    title='book {}-{}'.format(i, j),
+                    cover='https://example.com/{}-{}.jpg'.format(i, j),
+                )
+                PlaylistBook.objects.create(playlist=playlist, book=book)
+
+    def render_cards(self, limit, card_cache_timeout=0):
+        playlists = Playlist.objects.for_cards().order_by('title')[:limit]
+        return render_to_string('main/playlists/layouts/list-widget.html', {
+            'playlists': playlists,
+            'card_cache_timeout': card_cache_timeout,
+        })
+
+    def test_number_of_queries_does_not_depend_on_page_size(self):
+        for limit in (1, 12):
+            with self.subTest(limit=limit), self.assertNumQueries(2):
+                self.render_cards(limit)
+
+    def test_books_are_in_order(self):
+        for playlist in Playlist.objects.for_cards():
+            playlist_books = list(playlist.playlist_book_set.all())
+            self.assertEqual(playlist_books, sorted(playlist_books, key=lambda x: x.created_at))
+
+    def test_cards_are_cached_by_version(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.render_cards(12, card_cache_timeout=60)
+        # Not a change of the version, so the cached card is shown.
+        Book.objects.filter(title='book 0-0').update(title='changed')
+        with self.assertNumQueries(2):
+            self.assertNotIn('changed', self.render_cards(1, card_cache_timeout=60))
+
+        Playlist.objects.filter(title='playlist 00').update(like_count=1)
+        self.assertIn('changed', self.render_cards(1, card_cache_timeout=60))
+
+
+class BenchmarkCommandTests(TransactionTestCase):
+    # The command seeds the database of the tests instead of creating another one.
+
+    def setUp(self):
+        for name in ('setup_test_environment', 'teardown_test_environment'):
+            patcher = mock.patch('main.management.commands.benchmark.{}'.format(name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for name in ('create_test_db', 'destroy_test_db'):
+            patcher = mock.patch.object(connection.creation, name)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_results(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command(
+                'benchmark', '--users=3', '--playlists=6', '--books=10', '--books-per-playlist=2', '--providers=1',
+                '--likes=5', '--themes=2', '--recommendations=2', '--requests=2', '--output', output,
+                stderr=StringIO(),
+            )
+            with open(output) as f:
+                results = json.load(f)
+        self.assertEqual(results['dataset']['playlists'], 6)
+        self.assertEqual(results['dataset']['likes'], 5)
+        self.assertEqual(results['options']['seed'], 0)
+        self.assertEqual(results['environment']['database'], connection.vendor)
+        self.assertEqual(len(results['scenarios']), 8)
+        for name, result in results['scenarios'].items():
+            with self.subTest(name=name):
+                self.assertEqual(result['requests'], 2)
+                self.assertLessEqual(result['p50_ms'], result['max_ms'])
+
+
+class MetricsMiddlewareTests(TestCase):
+
+    def get_response(self, request):
+        list(Theme.objects.all())
+        return HttpResponse()
+
+    def test_server_timing(self):
+        response = MetricsMiddleware(self.get_response)(RequestFactory().get('/'))
+        self.assertIn('queries;desc="1"', response['Server-Timing'])
+
+    @override_settings(METRICS_DEFAULT_BUDGET={'queries': 0})
+    def test_budget_exceeded(self):
+        with self.assertRaises(BudgetExceeded), self.assertLogs('bookplaylist.metrics', 'WARNING'):
+            MetricsMiddleware(self.get_response)(RequestFactory().get('/'))
+
+    @override_settings(METRICS_DEFAULT_BUDGET={'total_ms': 0})
+    def test_time_budget_exceeded_is_only_logged(self):
+        with self.assertLogs('bookplaylist.metrics', 'WARNING') as logs:
+            MetricsMiddleware(self.get_response)(RequestFactory().get('/'))
+        self.assertIn('total_ms', logs.output[0])
+
+
+class PlaylistDraftTests(TestCase):
+
+    def test_round_trip_of_posted_data(self):
+        draft = PlaylistDraft('7e3c4c36-6a5f-4a2c-9d55-0c3f1b0c7d4e')
+        draft.update({
+            'title': 'title',
+            'theme': '1',
+            'description': 'description',
+            'playlist_book_set-TOTAL_FORMS': '2',
+            'playlist_book_set-INITIAL_FORMS': '1',
+            'playlist_book_set-0-id': 'ad7d2a4d-41f8-4c7a-8f0b-5b6b4f8a2f3e',
+            'playlist_book_set-0-book': '9780000000000',
+            'playlist_book_set-0-description': 'first',
+            'playlist_book_set-0-DELETE': 'on',
+            'playlist_book_set-1-book': '9780000000001',
+            'playlist_book_set-1-description': 'second',
+        })
+        session = {}
+        draft.save(session)
+        draft = PlaylistDraft.load(session, '7e3c4c36-6a5f-4a2c-9d55-0c3f1b0c7d4e')
+        self.assertEqual(draft.get_data(), {
+            'title': 'title',
+            'theme': '1',
+            'description': 'description',
+            'playlist_book_set-TOTAL_FORMS': '2',
+            'playlist_book_set-INITIAL_FORMS': '1',
+            'playlist_book_set-0-id': 'ad7d2a4d-41f8-4c7a-8f0b-5b6b4f8a2f3e',
+            'playlist_book_set-0-book': '9780000000000',
+            'playlist_book_set-0-description': 'first',
+            'playlist_book_set-0-DELETE': 'on',
+            'playlist_book_set-1-book': '9780000000001',
+            'playlist_book_set-1-description': 'second',
+        })
+        self.assertIsNone(PlaylistDraft.load(session))
+
+    def test_add_book_once(self):
+        draft = PlaylistDraft(fields={})
+        self.assertTrue(draft.add('9780000000000'))
+        self.assertFalse(draft.add('9780000000000'))
+        self.assertEqual(draft.get_data()['playlist_book_set-TOTAL_FORMS'], '1')
+
+    def test_books_are_read_from_database(self):
+        Book.objects.create(isbn='9780000000000', title='title')
+        draft = PlaylistDraft(books=[['9780000000001', '', None, False], ['9780000000000', '', None, False]])
+        with self.assertNumQueries(1):
+            books = draft.get_books()
+        self.assertEqual([(book.isbn, book.title) for book in books], [('9780000000001', None), ('9780000000000', 'title')])
+
+
+@override_settings(OG_IMAGE_ASYNC=True)
+class PlaylistFormTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user', email='user@example.com')
+        cls.theme = Theme.objects.create(name='theme', slug='theme')
+        provider = Provider.objects.create(name='Rakuten', slug='rakuten', endpoint='https://example.com/', priority=1)
+        cls.books = []
+        for i in range(3):
+            book = Book.objects.create(isbn='978420000000{}'.format(i), title='book {}'.format(i))
+            BookData.objects.create(book=book, provider=provider, title=book.title)
+            cls.books.append(book)
+
+    def setUp(self):
+        self.client.force_login(self.user, backend='accounts.backends.ModelBackend')
+
+    def get_data(self, books, initial=0):
+        data = {
+            'title': 'title',
+            'theme': self.theme.pk,
+            'description': 'description',
+            'playlist_book_set-TOTAL_FORMS': len(books),
+            'playlist_book_set-INITIAL_FORMS': initial,
+        }
+        for i, (pk, isbn, description, deleted) in enumerate(books):
+            if pk:
+                data['playlist_book_set-{}-id'.format(i)] = pk
+            data['playlist_book_set-{}-book'.format(i)] = isbn
+            data['playlist_book_set-{}-description'.format(i)] = description
+            if deleted:
+                data['playlist_book_set-{}-DELETE'.format(i)] = 'on'
+        return data
+
+    def assertBooks(self, playlist, books):
+        playlist.refresh_from_db()
+        self.assertEqual(playlist.book_count, len(books))
+        self.assertEqual(
+            [(x.book_id, x.description) for x in playlist.playlist_book_set.order_by('created_at')],
+            books,
+        )
+
+    def test_create(self):
+        response = self.client.post(reverse('main:playlist_create'), self.get_data([
+            (None, self.books[1].isbn, 'first', False),
+            (None, self.books[0].isbn, 'second', False),
+        ]))
+        playlist = Playlist.objects.get(user=self.user)
+        self.assertRedirects(response, reverse('main:playlist_create_complete', args=[playlist.pk]), fetch_redirect_response=False)
+        self.assertBooks(playlist, [(self.books[1].isbn, 'first'), (self.books[0].isbn, 'second')])
+
+    def test_update(self):
+        playlist = Playlist.objects.create(user=self.user, theme=self.theme, title='title', description='description')
+        playlist_books = [
+            PlaylistBook.objects.create(playlist=playlist, book=book, description='old')
+            for book in self.books[:2]
+        ]
+        response = self.client.post(reverse('main:playlist_update', args=[playlist.pk]), self.get_data([
+            (playlist_books[0].pk, self.books[0].isbn, 'new', False),
+            (playlist_books[1].pk, self.books[1].isbn, 'old', True),
+            (None, self.books[2].isbn, 'added', False),
+        ], initial=2))
+        self.assertRedirects(response, reverse('main:playlist_detail', args=[playlist.pk]), fetch_redirect_response=False)
+        self.assertBooks(playlist, [(self.books[0].isbn, 'new'), (self.books[2].isbn, 'added')])
+        self.assertTrue(PlaylistBook.all_objects.get(pk=playlist_books[1].pk).deleted_at)
+
+    def test_missing_book_data_fetched_in_one_batch(self):
+        other = Provider.objects.create(name='other', slug='other', endpoint='https://other.example.com/', priority=2)
+        books = []
+        for i in range(3, 6):
+            book = Book.objects.create(isbn='978420000000{}'.format(i))
+            BookData.objects.create(book=book, provider=other, title='other {}'.format(i))
+            books.append(book)
+        item = {'title': 'rakuten', 'subTitle': '', 'contents': '', 'author': 'author', 'publisherName': 'publisher', 'largeImageUrl': ''}
+        with mock.patch.object(views.BasePlaylistFormView, 'get_book_data_many', return_value=[
+            {'count': 1, 'Items': [{'Item': item}]},
+            {'count': 0},
+            None,
+        ]) as get_book_data_many:
+            self.client.post(reverse('main:playlist_create'), self.get_data([
+                (None, self.books[0].isbn, 'first', False),
+            ] + [(None, book.isbn, '', False) for book in books]))
+        # Only the books without data of the default provider, in one call
+        get_book_data_many.assert_called_once()
+        self.assertEqual([params['isbn'] for params in get_book_data_many.call_args[0][0]], [book.isbn for book in books])
+        self.assertEqual(
+            [Book.objects.get(pk=book.pk).title for book in books],
+            ['rakuten', 'other 4', 'other 5'],
+        )
+
+    def test_book_already_in_playlist(self):
+        playlist = Playlist.objects.create(user=self.user, theme=self.theme, title='title', description='description')
+        playlist_book = PlaylistBook.objects.create(playlist=playlist, book=self.books[0], description='old')
+        response = self.client.post(reverse('main:playlist_update', args=[playlist.pk]), self.get_data([
+            (playlist_book.pk, self.books[0].isbn, 'old', False),
+            (None, self.books[0].isbn, 'again', False),
+        ], initial=1))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['formset'].forms[1].non_field_errors())
+        self.assertBooks(playlist, [(self.books[0].isbn, 'old')])
+
+    def test_one_invalid_book_in_batch(self):
+        playlist = Playlist.objects.create(user=self.user, theme=self.theme, title='title', description='description')
+        playlist_book = PlaylistBook.objects.create(playlist=playlist, book=self.books[0], description='old')
+        instances = [
+            (PlaylistBook(playlist=playlist, book=book), None)
+            for book in (self.books[1], self.books[0], self.books[2])
+        ]
+        with self.assertNumQueries(1):
+            errors = perform_unique_checks_conditional(instances)
+        self.assertEqual([bool(x) for x in errors], [False, True, False])
+        self.assertIn(NON_FIELD_ERRORS, errors[1])
+
+        response = self.client.post(reverse('main:playlist_update', args=[playlist.pk]), self.get_data([
+            (playlist_book.pk, self.books[0].isbn, 'new', False),
+            (None, self.books[1].isbn, 'first', False),
+            (None, self.books[0].isbn, 'again', False),
+            (None, self.books[2].isbn, 'second', False),
+        ], initial=1))
+        self.assertEqual(response.status_code, 200)
+        formset = response.context['formset']
+        self.assertEqual([bool(form.errors) for form in formset.forms], [False, False, True, False])
+        self.assertBooks(playlist, [(self.books[0].isbn, 'old')])
@@ -6,6 +6,7 @@ app_name = 'main'
 urlpatterns = [
     path('', views.IndexView.as_view(), name='index'),
     path('playlists/', views.PlaylistView.as_view(), name='playlist'),
+    path('playlists/fragment/', views.PlaylistFragmentView.as_view(), name='playlist_fragment'),
     path('playlists/create/', views.PlaylistCreateView.as_view(), name='playlist_create'),
     path('playlists/create/book/', views.PlaylistCreateBookView.as_view(), name='playlist_create_book'),
     re_path(r'playlists/create/book/(?P<isbn>\d{13})/', views.PlaylistCreateBookStoreView.as_view(), name='playlist_create_book_store'),
@@ -6,8 +6,9 @@ from django import forms
 from django.conf import settings
 from django.contrib import messages
 from django.core.paginator import Paginator
+from django.db import transaction
 from django.db.models import (
-    Count, Exists, OuterRef, Prefetch, Q,
+    Exists, OuterRef,
 )
 from django.http import (
     Http404, HttpResponse, HttpResponseRedirect,
@@ -17,18 +18,28 @@ from django.shortcuts import (
 )
 from django.urls import reverse_lazy
 from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 from django.views import generic
 
 from .forms import (
     BookSearchForm, ContactForm, PlaylistBookFormSet, PlaylistForm, PlaylistSearchForm,
 )
+from . import (
+    homepage, likes,
+)
+from .drafts import PlaylistDraft
 from .models import (
     Book, BookData, Like, Playlist, Theme,
 )
+from .search import search_playlists
+from bookplaylist.clients import Bulkhead
+from bookplaylist.paginators import (
+    InvalidCursor, KeysetPaginator,
+)
 from bookplaylist.utils import APIMixin
 from bookplaylist.views import (
-    OwnerOnlyMixin, SearchFormView, TemplateContextMixin, csrf_protect, login_required,
+    ConditionalGetMixin, OwnerOnlyMixin, SearchFormView, TemplateContextMixin, csrf_protect, login_required,
 )
 
 # Create your views here.
@@ -56,83 +67,50 @@ class IndexView(TemplateContextMixin, PlaylistSearchFormView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context.update({
-            'playlists_recommended': Playlist.objects \
-                .filter(sequence__isnull=False) \
-                .order_by('sequence'),
-            'playlists_popular': Playlist.objects \
-                .filter(
-                    playlist_book__deleted_at__isnull=True,
-                    like__deleted_at__isnull=True) \
-                .annotate(
-                    playlist_book__count=Count('playlist_book', distinct=True),
-                    like__count=Count('like', distinct=True)) \
-                .filter(
-                    playlist_book__count__gte=2) \
-                .order_by(
-                    '-like__count',
-                    '-created_at') \
-                 [:4],
-            'playlists_recent': Playlist.objects \
-                .filter(
-                    playlist_book__deleted_at__isnull=True) \
-                .annotate(
-                    playlist_book__count=Count('playlist_book',distinct=True)) \
-                .filter(
-                    playlist_book__count__gte=2) \
-                .order_by(
-                    '-created_at') \
-                 [:4],
-            'themes': Theme.objects \
-                .prefetch_related(
-                    Prefetch(
-                        'playlist_set',
-                        queryset=Playlist.objects \
-                            .filter(
-                                recommendation__isnull=False,
-                                recommendation__sequence__isnull=False) \
-                            .order_by('recommendation__sequence')))
-        })
+        context.update(homepage.get_sections())
         return context
 
 
 class PlaylistView(TemplateContextMixin, generic.list.BaseListView, PlaylistSearchFormView):
     context_object_name = 'playlists'
     model = Playlist
+    paginate_by = settings.PLAYLIST_PAGINATE_BY
     template_name = 'main/playlists/list.html'
+    orderings = {
+        'popular': ('-like_count', '-created_at', '-id'),
+        'recent': ('-created_at', '-id'),
+        'relevance': ('-search_rank', '-like_count', '-created_at', '-id'),
+    }
 
     def get_queryset(self):
-        condition_list = []
         condition_dict = {}
         theme = self.request.GET.get('theme')
-        query = self.request.GET.get('q')
-        ordering = self.request.GET.get('ordering') or 'popular'
+        q_list = self._format_query(self.request.GET.get('q') or '')
 
         if theme:
             condition_dict['theme__slug'] = theme
-        if query:
-            q_list = self._format_query(query)
-            condition_list = [
-                  Q(title__icontains=q)\
-                | Q(description__icontains=q)\
-                | Q(playlist_book__book__book_data__title__icontains=q)\
-                | Q(playlist_book__book__book_data__author__icontains=q)
-                | Q(playlist_book__book__book_data__publisher__icontains=q)
-                for q in q_list
-            ]
-
-        queryset = Playlist.objects.filter(*condition_list, **condition_dict).distinct()
-
-        if ordering == 'popular':
-            queryset = queryset \
-                .filter(like__deleted_at__isnull=True) \
-                .annotate(like__count=Count('like',distinct=True)) \
-                .order_by('-like__count', '-created_at')
-        elif ordering == 'recent':
-            queryset = queryset.order_by('-created_at')
 
+        queryset = Playlist.objects.for_cards().filter(**condition_dict)
+        if q_list:
+            # Every token must match (AND), like the former icontains conditions.
+            queryset = search_playlists(queryset, q_list)
         return queryset
 
+    def get_ordering(self):
+        is_search = bool(self._format_query(self.request.GET.get('q') or ''))
+        ordering = self.request.GET.get('ordering') or ('relevance' if is_search else 'popular')
+        if ordering == 'relevance' and not is_search:
+            ordering = 'popular'
+        return self.orderings.get(ordering, self.orderings['recent'])
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, self.get_ordering(), page_size, max_age=settings.PLAYLIST_CURSOR_MAX_AGE)
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404
+        return (paginator, page, page.object_list, page.has_next())
+
     def get_context_data(self, **kwargs):
         q = self.request.GET.get('q')
         ordering = self.request.GET.get('ordering')
@@ -160,15 +138,23 @@ class PlaylistView(TemplateContextMixin, generic.list.BaseListView, PlaylistSear
         self.og_url =  self.request.build_absolute_uri()
         context = super().get_context_data(**kwargs)
         context['theme'] = theme
+        if context['page_obj'].has_next():
+            params = self.request.GET.copy()
+            params['cursor'] = context['page_obj'].next_cursor
+            context['next_page_params'] = params.urlencode()
         return context
 
 
-class PlaylistDetailView(TemplateContextMixin, generic.DetailView):
+class PlaylistFragmentView(PlaylistView):
+    template_name = 'main/playlists/list-fragment.html'
+
+
+class PlaylistDetailView(ConditionalGetMixin, TemplateContextMixin, generic.DetailView):
     model = Playlist
     template_name = 'main/playlists/detail.html'
 
     def get_queryset(self):
-        queryset = super().get_queryset().select_related('theme')
+        queryset = super().get_queryset().for_cards().select_related('theme')
         if self.request.user.is_authenticated:
             like = Like.objects.filter(
                 playlist=OuterRef('pk'),
@@ -177,34 +163,57 @@ class PlaylistDetailView(TemplateContextMixin, generic.DetailView):
             queryset = queryset.annotate(is_liked=Exists(like))
         return queryset
 
+    def get_etag_values(self):
+        # The cards of the other playlists are left out, so that a 304 needs only the
+        # queries of the playlist. They may lag until the playlist itself changes.
+        playlist = self.object
+        values = [
+            playlist.pk,
+            playlist.updated_at,
+            playlist.like_count,
+            getattr(playlist, 'is_liked', False),
+            playlist.user.updated_at,
+            playlist.theme.updated_at,
+        ]
+        for playlist_book in playlist.playlist_book_set.all():
+            values += [playlist_book.pk, playlist_book.updated_at, playlist_book.book.updated_at]
+        return values
+
     def get_context_data(self, **kwargs):
         self.page_title = self.object.title
         self.page_description = \
             self.object.description or \
             'BooxMixのプレイリスト詳細画面では、おすすめの本が詰まったプレイリストを閲覧することができます。入門書から個性のある本まで、多様な順番でまとめられています。興味ある本を発見したら購入してみましょう。'
         self.og_url =  self.request.build_absolute_uri()
-        self.og_image =  self.object.og_image.url
-        self.og_image_width = settings.OG_IMAGE_WIDTH
-        self.og_image_height = settings.OG_IMAGE_HEIGHT
+        self.set_og_image(self.object)
 
         context = super().get_context_data(**kwargs)
-        context['other_playlists'] = Playlist.objects \
+        context['other_playlists'] = self.other_playlists
+        return context
+
+    @cached_property
+    def other_playlists(self):
+        other_playlists = list(
+            Playlist.objects
+                .for_cards()
+                .filter(related_by__playlist=self.object)
+                .order_by('related_by__rank')[:4]
+        )
+        if other_playlists:
+            return other_playlists
+
+        # Playlists without related ones yet
+        return list(Playlist.objects \
+            .for_cards() \
             .exclude(
                 pk=self.object.pk) \
             .filter(
                 theme=self.object.theme,
-                playlist_book__deleted_at__isnull=True,
-                like__deleted_at__isnull=True) \
-            .annotate(
-                playlist_book__count=Count('playlist_book', distinct=True),
-                like__count=Count('like', distinct=True)) \
-            .filter(
-                playlist_book__count__gte=2) \
+                book_count__gte=2) \
             .order_by(
-                '-like__count',
+                '-like_count',
                 '-created_at') \
-             [:4]
-        return context
+             [:4])
 
 
 MODE_CREATE = 'create'
@@ -212,8 +221,6 @@ MODE_UPDATE = 'update'
 GET_KEY_CONTINUE = 'continue'
 POST_KEY_SEARCH = 'search'
 POST_KEY_ADD_BOOK = 'add_book'
-SESSION_KEY_FORM = 'playlist_form_data'
-SESSION_KEY_BOOK = 'playlist_book_data'
 
 
 class BasePlaylistFormView(APIMixin, generic.detail.SingleObjectTemplateResponseMixin, generic.edit.ModelFormMixin, generic.edit.ProcessFormView):
@@ -222,82 +229,74 @@ class BasePlaylistFormView(APIMixin, generic.detail.SingleObjectTemplateResponse
 
     def get(self, request, *args, **kwargs):
         if not request.GET.get(GET_KEY_CONTINUE):
-            request.session[SESSION_KEY_FORM] = self.initial_form_data
-            request.session[SESSION_KEY_BOOK] = self.initial_book_data
+            self.draft = self.get_initial_draft()
+            self.draft.save(request.session)
         return super().get(request, *args, **kwargs)
 
+    @cached_property
+    def draft(self):
+        return PlaylistDraft.load(self.request.session, self.kwargs.get('pk'))
+
+    def save_draft(self):
+        draft = self.draft or PlaylistDraft(self.kwargs.get('pk'))
+        draft.update(self.request.POST)
+        draft.save(self.request.session)
+
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
         kwargs['request'] = self.request
-        form_data = self.request.session.get(SESSION_KEY_FORM)
-        if form_data:
-            kwargs['initial'] = form_data
+        if self.draft and self.draft.fields:
+            kwargs['initial'] = self.draft.fields
         return kwargs
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        form_data = self.request.session.get(SESSION_KEY_FORM)
-        book_data = self.request.session.get(SESSION_KEY_BOOK)
+        draft = self.draft
+        form_data = draft.get_data() if draft and draft.fields is not None else None
         formset = kwargs.get('formset') or PlaylistBookFormSet(form_data, instance=self.object, form_kwargs={'request': self.request})
         context.update({
             'formset': formset,
-            'book_formset': zip(formset or [], book_data or []),
+            'book_formset': zip(formset or [], draft.get_books() if draft else []),
         })
         return context
 
     def form_valid(self, form):
         if POST_KEY_ADD_BOOK in self.request.POST:
-            post_data = self.request.POST.copy()
-            del post_data[POST_KEY_ADD_BOOK]
-            self.request.session[SESSION_KEY_FORM] = post_data
+            self.save_draft()
             return redirect('main:playlist_{}_book'.format(self.mode), **self.kwargs)
-        book_session_list = self.request.session.get(SESSION_KEY_BOOK)
-
-        # create Books if not exists
-        book_dict_list = [
-            {
-                'isbn': book_session['isbn'],
-                'created_at': timezone.now(),
-                'updated_at': timezone.now(),
-            }
-            for book_session in book_session_list
-        ]
-        book_obj_list = [Book(**book_dict) for book_dict in book_dict_list]
-        Book.objects.bulk_create(book_obj_list, ignore_conflicts=True)
-
-        # create BookData if not exists
-        book_data_dict_list = [
-            self._get_book_data_if_not_exists(book_session)
-            for book_session in book_session_list
-        ]
-        book_data_obj_list = [BookData(**book_data_dict) for book_data_dict in book_data_dict_list]
-        BookData.objects.bulk_create(book_data_obj_list, ignore_conflicts=True)
 
         # handle PlaylistBookFormSet
         instance = form.save(commit=False)
         formset = PlaylistBookFormSet(self.request.POST, instance=instance, form_kwargs={'request': self.request})
         if not len(formset.forms) - len(formset.deleted_forms):
             messages.error(self.request, _('You have to add at least one book to your playlist.'))
-            self.request.session[SESSION_KEY_FORM] = self.request.POST
+            self.save_draft()
             url = self.get_error_url()
             return HttpResponseRedirect(url)
         if not formset.is_valid():
             return self.render_to_response(self.get_context_data(form=form, formset=formset))
 
+        # create BookData of the provider if the books were added with the data of another one
+        book_data_obj_list = self._get_book_data_list_if_not_exists(list(formset.books))
+        if book_data_obj_list:
+            BookData.objects.bulk_create(book_data_obj_list, ignore_conflicts=True)
+            Book.objects.filter(isbn__in=[book_data.book_id for book_data in book_data_obj_list]).refresh_book_data()
+
         # save Playlist and PlaylistBooks
-        instance.save()
-        formset.save()
+        with transaction.atomic():
+            instance.save()
+            formset.save_bulk()
 
-        # save Playlist.og_image
-        instance.save_og_image()
+        # request to render Playlist.og_image
+        instance.enqueue_og_image()
 
         # clear session and redirect
-        for key in (SESSION_KEY_FORM, SESSION_KEY_BOOK,):
-            if SESSION_KEY_FORM in self.request.session:
-                del self.request.session[key]
+        PlaylistDraft.clear(self.request.session)
         if self.success_message:
             messages.success(self.request, self.success_message)
-        return super().form_valid(form)
+        # Not super().form_valid(), which would save the playlist again over its refreshed counts
+        self.object = instance
+        return HttpResponseRedirect(self.get_success_url())
 
     def form_invalid(self, form):
         formset = PlaylistBookFormSet(self.request.POST, instance=self.object, form_kwargs={'request': self.request})
@@ -306,47 +305,45 @@ class BasePlaylistFormView(APIMixin, generic.detail.SingleObjectTemplateResponse
     def get_error_url(self):
         return reverse_lazy('main:playlist_{}'.format(self.mode), kwargs=self.kwargs) + '?{}=True'.format(GET_KEY_CONTINUE)
 
-    def _get_book_data_if_not_exists(self, book_session):
-        if book_session['provider_id'] == str(self.provider.pk):
-            # if the same data is in db, return existing BookData
-            return self._book_session_to_book_data_dict(book_session)
+    def _get_book_data_list_if_not_exists(self, isbn_list):
+        provider = self.provider
+        existing_isbn_set = set(
+            BookData.all_objects
+                .filter(book__in=isbn_list, provider=provider)
+                .values_list('book', flat=True)
+        )
+        isbn_list_to_fetch = [isbn for isbn in isbn_list if isbn not in existing_isbn_set]
+        if not isbn_list_to_fetch:
+            return []
 
-        if self.provider.slug == 'rakuten':
-            params = {
-                'applicationId': settings.RAKUTEN_APPLICATION_ID,
-                'isbn': book_session['isbn'],
-            }
+        if provider.slug == 'rakuten':
+            params_list = [
+                {
+                    'applicationId': settings.RAKUTEN_APPLICATION_ID,
+                    'isbn': isbn,
+                }
+                for isbn in isbn_list_to_fetch
+            ]
         else:
-            params = {}
-        response = self.get_book_data(params).json()
-        if not response or not response[0] == 'null' or 'error' in response or int(response['count']) == 0:
-            # if no data is in the response, return existing BookData
-            return self._book_session_to_book_data_dict(book_session)
-        book = response['Items'][0]
-        book_data_dict = {
-            'book_id': book_session['isbn'],
-            'provider_id': str(self.provider.pk),
-            'title': self.format_title(book['Item']['title'], book['Item']['subTitle'], book['Item']['contents']),
-            'author': book['Item']['author'],
-            'publisher': book['Item']['publisherName'],
-            'cover': book['Item']['largeImageUrl'],
-            'created_at': timezone.now(),
-            'updated_at': timezone.now(),
-        }
-        return book_data_dict
-
-    def _book_session_to_book_data_dict(self, book_session):
-        book_data_dict = {
-            'book_id': book_session['isbn'],
-            'provider_id': book_session['provider_id'],
-            'title': book_session['title'],
-            'author': book_session['author'],
-            'publisher': book_session['publisher'],
-            'cover': book_session['cover'],
-            'created_at': timezone.now(),
-            'updated_at': timezone.now(),
-        }
-        return book_data_dict
+            params_list = [{} for isbn in isbn_list_to_fetch]
+        response_list = self.get_book_data_many(params_list)
+        book_data_dict_list = []
+        for isbn, response in zip(isbn_list_to_fetch, response_list):
+            if not response or 'error' in response or int(response['count']) == 0:
+                # if no data is in the response, keep the data of the other providers
+                continue
+            book = response['Items'][0]
+            book_data_dict_list.append({
+                'book_id': isbn,
+                'provider_id': str(provider.pk),
+                'title': self.format_title(book['Item']['title'], book['Item']['subTitle'], book['Item']['contents']),
+                'author': book['Item']['author'],
+                'publisher': book['Item']['publisherName'],
+                'cover': book['Item']['largeImageUrl'],
+                'created_at': timezone.now(),
+                'updated_at': timezone.now(),
+            })
+        return [BookData(**book_data_dict) for book_data_dict in book_data_dict_list]
 
 
 @login_required
@@ -360,10 +357,11 @@ class PlaylistCreateView(TemplateContextMixin, BasePlaylistFormView):
 
     def get(self, request, *args, **kwargs):
         self.object = None
-        self.initial_form_data =  None
-        self.initial_book_data = []
         return super().get(request, *args, **kwargs)
 
+    def get_initial_draft(self):
+        return PlaylistDraft()
+
     def post(self, request, *args, **kwargs):
         self.object = None
         return super().post(request, *args, **kwargs)
@@ -383,20 +381,11 @@ class PlaylistUpdateView(TemplateContextMixin, OwnerOnlyMixin, BasePlaylistFormV
     def get(self, request, *args, **kwargs):
         if not hasattr(self, 'object'):
             self.object = self.get_object()
-        self.initial_form_data =  None
-        self.initial_book_data = [
-            {
-                'isbn': x.book.isbn,
-                'provider_id': str(x.book._default_data.provider.pk),
-                'title': x.book._default_data.title,
-                'author': x.book._default_data.author,
-                'publisher': x.book._default_data.publisher,
-                'cover': x.book._default_data.cover,
-            }
-            for x in self.object.playlist_book_set.all()
-        ]
         return super().get(request, *args, **kwargs)
 
+    def get_initial_draft(self):
+        return PlaylistDraft.from_playlist(self.object)
+
     def post(self, request, *args, **kwargs):
         if not hasattr(self, 'object'):
             self.object = self.get_object()
@@ -408,9 +397,7 @@ class PlaylistUpdateView(TemplateContextMixin, OwnerOnlyMixin, BasePlaylistFormV
 
     def get_context_data(self, **kwargs):
         self.og_url = self.get_full_absolute_url(self.object)
-        self.og_image = self.object.og_image.url
-        self.og_image_width = settings.OG_IMAGE_WIDTH
-        self.og_image_height = settings.OG_IMAGE_HEIGHT
+        self.set_og_image(self.object)
         return super().get_context_data(**kwargs)
 
 
@@ -443,6 +430,12 @@ class PlaylistUpdateBookView(OwnerOnlyMixin, BasePlaylistBookView):
 @csrf_protect
 @login_required
 class BookSearchView(APIMixin, generic.View):
+    # The search runs while the user types, so it gives up sooner than the other calls,
+    # and a slow provider can hold only some of the workers of each process.
+    client_kwargs = {
+        'bulkhead': Bulkhead(settings.PROVIDER_SEARCH_MAX_CONCURRENCY),
+        'deadline': settings.PROVIDER_SEARCH_DEADLINE,
+    }
 
     def search_book(self, data):
         q = data.get('q')
@@ -462,7 +455,10 @@ class BookSearchView(APIMixin, generic.View):
         else:
             params = {}
 
-        response = self.get_book_data(params)
+        try:
+            response = self.get_book_data(params)
+        except requests.RequestException:
+            return HttpResponse(_('<p class="mt-4">An error has occurred. Please retry later.</p>'))
         if response.status_code == requests.codes.bad_request:
             return HttpResponse(_('<p class="mt-4">The keyword is too short. Please search by longer words.</p>'))
 
@@ -470,10 +466,27 @@ class BookSearchView(APIMixin, generic.View):
         if 'error' in response:
             return HttpResponse(_('<p class="mt-4">An error has occurred. Please retry later.</p>'))
 
+        if self.provider.slug == 'rakuten':
+            # cache each book by ISBN so that adding it to the playlist doesn't call the API again
+            self.set_book_data_many(
+                [
+                    {
+                        'applicationId': settings.RAKUTEN_APPLICATION_ID,
+                        'isbn': self.format_isbn(book['Item']['isbn']),
+                    }
+                    for book in response['Items']
+                ],
+                [
+                    {'count': 1, 'page': 1, 'first': 1, 'last': 1, 'hits': 1, 'Items': [book]}
+                    for book in response['Items']
+                ]
+            )
+
+        draft = PlaylistDraft.load(self.request.session, data.get('pk'))
         context = {
             'mode': data.get('mode'),
             'pk': data.get('pk'),
-            'books_in_session': [x['isbn'] for x in self.request.session.get(SESSION_KEY_BOOK)] if SESSION_KEY_BOOK in self.request.session else [],
+            'books_in_session': draft.isbn_set if draft else set(),
             'count': response['count'],
             'first': response['first'],
             'last': response['last'],
@@ -509,58 +522,54 @@ class BookSearchView(APIMixin, generic.View):
 class BasePlaylistBookStoreView(APIMixin, generic.RedirectView):
 
     def get(self, request, *args, **kwargs):
-        form_data = request.session.get(SESSION_KEY_FORM)
-        book_data = request.session.get(SESSION_KEY_BOOK)
-        if not form_data or not SESSION_KEY_BOOK in request.session:
+        draft = PlaylistDraft.load(request.session, self.kwargs.get('pk'))
+        if not draft or draft.fields is None:
             messages.warning(request, _('Session timeout. Please retry from the beginning.'))
             return redirect('main:playlist_{}'.format(self.mode), **self.kwargs)
 
-        book_obj = Book.objects.filter(isbn=self.kwargs.get('isbn')).first()
-        if book_obj and book_obj._default_data:
-            book_json = {
-                'isbn': self.kwargs.get('isbn'),
-                'provider_id': str(book_obj._default_data.provider.pk),
-                'title': book_obj._default_data.title,
-                'author': book_obj._default_data.author,
-                'publisher': book_obj._default_data.publisher,
-                'cover': book_obj._default_data.cover,
-            }
-        else:
+        isbn = self.kwargs.get('isbn')
+        if isbn in draft:
+            messages.error(request, _('This book has already been added to the playlist.'))
+            url = self.get_redirect_url()
+            return HttpResponseRedirect(url)
+
+        # The draft keeps the ISBN only, so the book and its data are saved before being added.
+        if not BookData.objects.filter(book=isbn, book__deleted_at__isnull=True).exists():
             if self.provider.slug == 'rakuten':
                 params = {
                     'applicationId': settings.RAKUTEN_APPLICATION_ID,
-                    'isbn': self.kwargs.get('isbn'),
+                    'isbn': isbn,
                 }
             else:
                 params = {}
-            response = self.get_book_data(params).json()
+            try:
+                response = self.get_book_data(params).json()
+            except requests.RequestException:
+                response = {'error': 'unavailable'}
             if 'error' in response:
-                messages.error(_('An error has occurred. Please retry later.'))
+                messages.error(request, _('An error has occurred. Please retry later.'))
                 url = self.get_redirect_url()
                 return HttpResponseRedirect(url)
             if int(response['count']) == 0:
-                messages.error(_('We could\'t find the book you want to add. Please retry again.'))
+                messages.error(request, _('We could\'t find the book you want to add. Please retry again.'))
                 url = self.get_redirect_url()
                 return HttpResponseRedirect(url)
             book = response['Items'][0]
-            book_json = {
-                'isbn': self.kwargs.get('isbn'),
-                'provider_id': str(self.provider.pk),
-                'title': self.format_title(book['Item']['title'], book['Item']['subTitle'], book['Item']['contents']),
-                'author': book['Item']['author'],
-                'publisher': book['Item']['publisherName'],
-                'cover': book['Item']['largeImageUrl'],
-            }
-
-        if book_json in request.session.get(SESSION_KEY_BOOK):
-            messages.error(request, _('This book has already been added to the playlist.'))
-            url = self.get_redirect_url()
-            return HttpResponseRedirect(url)
-
-        request.session[SESSION_KEY_BOOK] += [book_json]
-        book_num = len(request.session[SESSION_KEY_BOOK])
-        request.session[SESSION_KEY_FORM]['playlist_book_set-{}-book'.format(book_num-1)] = book_json['isbn']
-        request.session[SESSION_KEY_FORM]['playlist_book_set-TOTAL_FORMS'] = str(int(request.session[SESSION_KEY_FORM]['playlist_book_set-TOTAL_FORMS']) + 1)
+            Book.objects.bulk_create([Book(isbn=isbn)], ignore_conflicts=True)
+            BookData.objects.bulk_create([
+                BookData(
+                    book_id=isbn,
+                    provider=self.provider,
+                    title=self.format_title(book['Item']['title'], book['Item']['subTitle'], book['Item']['contents']),
+                    author=book['Item']['author'],
+                    publisher=book['Item']['publisherName'],
+                    cover=book['Item']['largeImageUrl'],
+                ),
+            ], ignore_conflicts=True)
+            Book.objects.filter(isbn=isbn).refresh_book_data()
+
+        draft.add(isbn)
+        draft.save(request.session)
         return super().get(request, *args, **kwargs)
 
     def get_redirect_url(self, *args, **kwargs):
@@ -588,9 +597,7 @@ class PlaylistCreateCompleteView(TemplateContextMixin, OwnerOnlyMixin, generic.D
 
     def get_context_data(self, **kwargs):
         self.og_url = self.get_full_absolute_url(self.object)
-        self.og_image = self.object.og_image.url
-        self.og_image_width = settings.OG_IMAGE_WIDTH
-        self.og_image_height = settings.OG_IMAGE_HEIGHT
+        self.set_og_image(self.object)
         return super().get_context_data(**kwargs)
 
 
@@ -617,27 +624,17 @@ class PlaylistLikeView(generic.View):
     def post(self, request, *args, **kwargs):
         playlist = get_object_or_404(Playlist, pk=self.kwargs.get('pk'))
         user = request.user
-        likes_count = int(request.POST.get('count'))
         is_liked_req = strtobool(request.POST.get('is_liked'))
         if not user.is_authenticated:
             is_guest_user = True
             is_liked = is_liked_req
+            likes_count = likes.get_count(playlist)
         else:
+            # Toggle the status shown in the page. If the page was stale, the status
+            # is already the requested one and nothing changes.
             is_guest_user = False
-            like = Like.all_objects.filter(playlist=playlist, user=user).first()
-            is_liked = bool(like and not like.is_deleted)
-
-            # If like-status in the request is correct, update data in DB.
-            if is_liked == is_liked_req:
-                if not like:
-                    like = playlist.likes.create(user=user)
-                elif like.is_deleted:
-                    like.restore()
-                elif not like.is_deleted:
-                    like.delete()
-
-            is_liked = bool(like and not like.is_deleted)
-            likes_count = likes_count + 1 if not is_liked_req else likes_count - 1
+            is_liked = not is_liked_req
+            likes_count = likes.set_like(playlist, user, is_liked)
 
         context = {
             'playlist_id': playlist.pk,